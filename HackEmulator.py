@@ -0,0 +1,172 @@
+# Assembles and runs Hack assembly with the Jack OS stood in for by VMInterpreter.JackOS, so programs
+# from the assembly backend can be checked without the OS compiled to assembly.
+# Run as: python HackEmulator.py <.asm file> [--entry Main.main]
+import argparse
+import sys
+
+from VMInterpreter import ARG, DEFAULT_MAX_JUMPS, LCL, RAM_SIZE, SP, STACK_BASE, Halt, JackOS, VMError, to_word
+
+PREDEFINED = {"SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4, "SCREEN": 16384, "KBD": 24576}
+for register in range(16):
+    PREDEFINED["R" + str(register)] = register
+FIRST_VARIABLE = 16
+RETURN_TRAMPOLINE = "$return"
+DEFAULT_MAX_STEPS = 20 * DEFAULT_MAX_JUMPS
+# every comp field of the Hack instruction set, as a function of A, D and M
+COMPUTATIONS = {"0": lambda a, d, m: 0, "1": lambda a, d, m: 1, "-1": lambda a, d, m: -1,
+                "D": lambda a, d, m: d, "A": lambda a, d, m: a, "M": lambda a, d, m: m,
+                "!D": lambda a, d, m: ~d, "!A": lambda a, d, m: ~a, "!M": lambda a, d, m: ~m,
+                "-D": lambda a, d, m: -d, "-A": lambda a, d, m: -a, "-M": lambda a, d, m: -m,
+                "D+1": lambda a, d, m: d + 1, "A+1": lambda a, d, m: a + 1, "M+1": lambda a, d, m: m + 1,
+                "D-1": lambda a, d, m: d - 1, "A-1": lambda a, d, m: a - 1, "M-1": lambda a, d, m: m - 1,
+                "D+A": lambda a, d, m: d + a, "D+M": lambda a, d, m: d + m,
+                "D-A": lambda a, d, m: d - a, "D-M": lambda a, d, m: d - m,
+                "A-D": lambda a, d, m: a - d, "M-D": lambda a, d, m: m - d,
+                "D&A": lambda a, d, m: d & a, "D&M": lambda a, d, m: d & m,
+                "D|A": lambda a, d, m: d | a, "D|M": lambda a, d, m: d | m}
+JUMPS = {"": lambda value: False, "JGT": lambda value: value > 0, "JEQ": lambda value: value == 0,
+         "JGE": lambda value: value >= 0, "JLT": lambda value: value < 0, "JNE": lambda value: value != 0,
+         "JLE": lambda value: value <= 0, "JMP": lambda value: True}
+
+
+def assemble(lines, os_functions=()):
+    # returns the instructions, as ("A", value) or ("C", computation, reads M, dest, jump), and the
+    # symbols. A label that is never declared but names an OS function gets an address past the end
+    # of the program, where the emulator runs the OS in its place
+    labels = dict()
+    code = list()
+    for line in lines:
+        line = line.split("//", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("("):
+            labels[line[1:-1]] = len(code)
+        else:
+            code.append(line)
+    symbols = dict(PREDEFINED)
+    symbols.update(labels)
+    next_variable = FIRST_VARIABLE
+    stubs = dict()
+    instructions = list()
+    for line in code:
+        if line.startswith("@"):
+            symbol = line[1:]
+            if symbol.isdigit():
+                instructions.append(("A", int(symbol)))
+                continue
+            if symbol not in symbols:
+                if symbol in os_functions:
+                    symbols[symbol] = len(code) + len(stubs)
+                    stubs[symbols[symbol]] = symbol
+                else:
+                    symbols[symbol] = next_variable
+                    next_variable += 1
+            instructions.append(("A", symbols[symbol]))
+            continue
+        dest, comp, jump = "", line, ""
+        if "=" in comp:
+            dest, comp = comp.split("=", 1)
+        if ";" in comp:
+            comp, jump = comp.split(";", 1)
+        if comp not in COMPUTATIONS or jump not in JUMPS or any(part not in "ADM" for part in dest):
+            raise VMError("not a Hack instruction: " + line)
+        instructions.append(("C", COMPUTATIONS[comp], "M" in comp, dest, JUMPS[jump] if jump else None))
+    return instructions, symbols, stubs
+
+
+class HackComputer:
+    def __init__(self, lines, keyboard=""):
+        self.ram = [0] * RAM_SIZE
+        self.os = JackOS(self.ram, keyboard)
+        self.code, self.symbols, self.stubs = assemble(lines, self.os.functions)
+        self.steps = 0
+        self.os_calls = 0
+
+    def run(self, entry="Main.main", max_steps=DEFAULT_MAX_STEPS):
+        # runs from entry with a frame whose return address ends the run, like VirtualMachine.run,
+        # returns what the program printed
+        if entry not in self.symbols:
+            raise VMError("undefined function " + entry)
+        ram = self.ram
+        code = self.code
+        stubs = self.stubs
+        halt = len(code) + len(stubs)
+        trampoline = self.symbols.get(RETURN_TRAMPOLINE)
+        sp = STACK_BASE
+        for value in (halt, 0, 0, 0, 0):
+            ram[sp] = value
+            sp += 1
+        ram[SP] = ram[LCL] = sp
+        ram[ARG] = STACK_BASE
+        pc = self.symbols[entry]
+        a = d = 0
+        steps = 0
+        try:
+            while pc != halt:
+                if pc >= len(code):
+                    # an OS function, called with LCL at the arguments' end past the saved frame
+                    self.os_calls += 1
+                    argc = ram[LCL] - ram[ARG] - 5
+                    value = self.os.functions[stubs[pc]](*ram[ram[ARG]:ram[ARG] + argc])
+                    d = to_word(value or 0)
+                    if trampoline is not None:
+                        pc = trampoline
+                        continue
+                    # the textbook return
+                    frame = ram[LCL]
+                    pc = ram[frame - 5]
+                    ram[ram[ARG]] = d
+                    ram[SP] = ram[ARG] + 1
+                    for register in (4, 3, 2, 1):
+                        ram[register] = ram[frame - 5 + register]
+                    continue
+                instruction = code[pc]
+                steps += 1
+                if steps > max_steps:
+                    raise VMError("gave up after " + str(max_steps) + " instructions")
+                if instruction[0] == "A":
+                    a = instruction[1]
+                    pc += 1
+                    continue
+                kind, computation, reads_m, dest, jump = instruction
+                if a < 0 and (reads_m or "M" in dest):
+                    raise VMError("negative address at instruction " + str(pc))
+                value = to_word(computation(a, d, ram[a] if reads_m else 0))
+                target = a
+                if "M" in dest:
+                    ram[a] = value
+                if "D" in dest:
+                    d = value
+                if "A" in dest:
+                    a = value
+                pc = target if jump is not None and jump(value) else pc + 1
+        except Halt:
+            pass
+        except IndexError:
+            raise VMError("address out of range at instruction " + str(pc))
+        finally:
+            self.steps += steps
+        return "".join(self.os.output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs a Hack assembly program with the Jack OS in Python.")
+    parser.add_argument("path", help="a .asm file")
+    parser.add_argument("--entry", default="Main.main", help="label to start from (default %(default)s)")
+    parser.add_argument("--input", default="", help="what the program reads from the keyboard, \\n ends a line")
+    args = parser.parse_args(argv)
+    with open(args.path) as file:
+        lines = file.read().splitlines()
+    try:
+        computer = HackComputer(lines, args.input.replace("\\n", "\n"))
+        output = computer.run(args.entry)
+    except VMError as error:
+        print("error: " + str(error), file=sys.stderr)
+        return 1
+    sys.stdout.write(output)
+    print(str(computer.steps) + " Hack instructions, " + str(computer.os_calls) + " OS calls", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
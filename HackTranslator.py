@@ -0,0 +1,415 @@
+# Translates the instruction tuples buffered by JackCompiler.VMWriter straight to Hack assembly, without
+# a round trip through .vm text. Calls and returns go through shared trampolines and the top of the stack
+# stays in D between instructions that hand it on. With both switched off the output is the textbook
+# translation of each VM command, which is what translating the .vm text would give.
+
+SEGMENT_BASES = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
+TEMP_BASE = 5
+POINTER_BASE = 3
+STACK_BASE = 256
+# words of the Hack ROM, an A-instruction loads addresses up to ROM_SIZE - 1 at most
+ROM_SIZE = 32768
+FRAME = ("LCL", "ARG", "THIS", "THAT")
+ENTRY = "Sys.init"
+# labels of the shared code, $ keeps them apart from Jack names
+CALL_TRAMPOLINE = "$call"
+RETURN_TRAMPOLINE = "$return"
+COMPARE_ROUTINE = "$compare"
+BOOTSTRAP = "$bootstrap"
+# computations with the second operand x in M and the top of the stack y in D
+BINARY = {"add": "D=D+M", "sub": "D=M-D", "and": "D=D&M", "or": "D=D|M"}
+IN_PLACE = {"add": "M=D+M", "sub": "M=M-D", "and": "M=D&M", "or": "M=D|M"}
+UNARY = {"neg": "-", "not": "!"}
+# jumps taken when a value with the sign of x - y compares to zero like x compares to y. x - y itself
+# overflows when the signs differ, so only eq may use it
+COMPARE_JUMPS = {"eq": "JEQ", "gt": "JGT", "lt": "JLT"}
+NEGATED_JUMPS = {"JEQ": "JNE", "JGT": "JLE", "JLT": "JGE"}
+# largest segment offset reached by stepping A instead of adding the offset
+PUSH_STEPS = 3
+POP_STEPS = 7
+
+
+def count_instructions(lines):
+    # label declarations take no ROM word
+    return sum(1 for line in lines if line[0] != "(")
+
+
+def check_rom(lines):
+    # raises unless the program fits the ROM and every label is an address an A-instruction can load
+    size = count_instructions(lines)
+    if size > ROM_SIZE:
+        raise Exception("the program takes " + str(size) + " Hack instructions, more than the " + str(ROM_SIZE) +
+                        " words of the ROM")
+    address = 0
+    for line in lines:
+        if line[0] != "(":
+            address += 1
+        elif address >= ROM_SIZE:
+            raise Exception("label " + line[1:-1] + " is at ROM address " + str(address) + ", past the last one " +
+                            str(ROM_SIZE - 1))
+
+
+def sign_code(prefix, leave):
+    # pops x and leaves in D a value with the sign of x - y, y being in R13, then runs leave
+    return ["@SP", "AM=M-1", "D=M", "@R14", "M=D", "@" + prefix + "$xneg", "D;JLT",
+            # x is not negative, so a negative y is smaller
+            "@R13", "D=M", "@" + prefix + "$plus", "D;JLT", "@" + prefix + "$same", "0;JMP",
+            # x is negative, so a y that is not is larger
+            "(" + prefix + "$xneg)", "@R13", "D=M", "@" + prefix + "$minus", "D;JGE",
+            "(" + prefix + "$same)", "@R14", "D=M", "@R13", "D=D-M", *leave,
+            "(" + prefix + "$plus)", "D=1", *leave,
+            "(" + prefix + "$minus)", "D=-1", *leave]
+
+
+class HackTranslator:
+    # one translator covers a whole program, since labels and the trampolines it needs span the classes
+    def __init__(self, trampolines=True, cache=True):
+        self.trampolines = trampolines
+        self.cache = cache
+        self.call_arities = set()
+        # functions translated and functions called, across the classes
+        self.defined = set()
+        self.called = set()
+        self.compares = False
+        self.function = BOOTSTRAP
+        self.class_name = ""
+        self.label_count = 0
+        # whether D holds the top of the stack, which is then not stored yet
+        self.cached = False
+        self.out = list()
+
+    def translate(self, instructions):
+        # the assembly lines of instructions, which start with a function
+        self.out = out = list()
+        i = 0
+        while i < len(instructions):
+            instruction = instructions[i]
+            op = instruction[0]
+            if self.cache:
+                # a comparison with a constant tests the sign of x first and never pushes the constant
+                j = i
+                constant = None
+                if op == "push" and instruction[1] == "constant" and i + 1 < len(instructions) \
+                        and instructions[i + 1][0] in ("lt", "gt"):
+                    constant = instruction[2]
+                    j = i + 1
+                condition = instructions[j][0]
+                if condition in COMPARE_JUMPS or condition == "not":
+                    # a condition feeding an if-goto turns into the jump itself
+                    k = j + 1
+                    negate = False
+                    if condition != "not" and k < len(instructions) and instructions[k] == ("not",):
+                        negate = True
+                        k += 1
+                    if k < len(instructions) and instructions[k][0] == "if-goto":
+                        label = self.label(instructions[k][1])
+                        if condition == "not":
+                            # not x is zero only for x = -1, so any other value jumps, true or not
+                            self.load()
+                            self.emit("D=D+1", "@" + label, "D;JNE")
+                        else:
+                            self.compare_jump(condition, constant, label, not negate)
+                        i = k + 1
+                        continue
+                    if constant is not None:
+                        self.write_compare(instructions[j], constant)
+                        i = j + 1
+                        continue
+            self.HANDLERS[op](self, instruction)
+            i += 1
+        self.store()
+        return out
+
+    def emit(self, *lines):
+        self.out.extend(lines)
+
+    def new_label(self, kind):
+        self.label_count += 1
+        return self.function + "$" + kind + "." + str(self.label_count)
+
+    def label(self, name):
+        # VM labels are local to their function
+        return self.function + "$" + name
+
+    def push_d(self):
+        # D is the new top of the stack
+        if self.cache:
+            self.cached = True
+        elif self.trampolines:
+            self.emit("@SP", "AM=M+1", "A=A-1", "M=D")
+        else:
+            self.emit("@SP", "A=M", "M=D", "@SP", "M=M+1")
+
+    def store(self):
+        # writes a top of the stack held in D to the stack
+        if self.cached:
+            self.emit("@SP", "AM=M+1", "A=A-1", "M=D")
+            self.cached = False
+
+    def load(self):
+        # pops the top of the stack into D
+        if self.cached:
+            self.cached = False
+        else:
+            self.emit("@SP", "AM=M-1", "D=M")
+
+    def difference(self):
+        # pops y and x and leaves x - y in D
+        if self.cached:
+            self.emit("@SP", "AM=M-1", "D=M-D")
+            self.cached = False
+        else:
+            self.emit("@SP", "AM=M-1", "D=M", "@SP", "AM=M-1", "D=M-D")
+
+    def address(self, segment, index):
+        if segment == "temp":
+            return str(TEMP_BASE + index)
+        if segment == "pointer":
+            return str(POINTER_BASE + index)
+        if segment == "static":
+            return self.class_name + "." + str(index)
+        raise Exception("unknown segment " + segment)
+
+    def write_push(self, instruction):
+        segment, index = instruction[1], instruction[2]
+        self.store()
+        if not self.cache:
+            if segment == "constant":
+                self.emit("@" + str(index), "D=A")
+            elif segment in SEGMENT_BASES:
+                self.emit("@" + str(index), "D=A", "@" + SEGMENT_BASES[segment], "A=D+M", "D=M")
+            else:
+                self.emit("@" + self.address(segment, index), "D=M")
+        elif segment == "constant":
+            if index <= 1:
+                self.emit("D=" + str(index))
+            else:
+                self.emit("@" + str(index), "D=A")
+        elif segment in SEGMENT_BASES:
+            self.emit("@" + SEGMENT_BASES[segment])
+            if index == 0:
+                self.emit("A=M")
+            elif index <= PUSH_STEPS:
+                self.emit("A=M+1", *["A=A+1"] * (index - 1))
+            else:
+                self.emit("D=M", "@" + str(index), "A=D+A")
+            self.emit("D=M")
+        else:
+            self.emit("@" + self.address(segment, index), "D=M")
+        self.push_d()
+
+    def write_pop(self, instruction):
+        segment, index = instruction[1], instruction[2]
+        if segment not in SEGMENT_BASES:
+            self.load()
+            self.emit("@" + self.address(segment, index), "M=D")
+        elif not self.cache:
+            self.emit("@" + str(index), "D=A", "@" + SEGMENT_BASES[segment], "D=D+M", "@R13", "M=D")
+            self.load()
+            self.emit("@R13", "A=M", "M=D")
+        elif index <= POP_STEPS:
+            self.load()
+            self.emit("@" + SEGMENT_BASES[segment])
+            if index == 0:
+                self.emit("A=M")
+            else:
+                self.emit("A=M+1", *["A=A+1"] * (index - 1))
+            self.emit("M=D")
+        else:
+            if self.cached:
+                self.emit("@R13", "M=D")
+            self.emit("@" + SEGMENT_BASES[segment], "D=M", "@" + str(index), "D=D+A", "@R14", "M=D")
+            if self.cached:
+                self.emit("@R13", "D=M")
+                self.cached = False
+            else:
+                self.load()
+            self.emit("@R14", "A=M", "M=D")
+
+    def write_binary(self, instruction):
+        op = instruction[0]
+        if self.cached:
+            # the result stays in D
+            self.emit("@SP", "AM=M-1", BINARY[op])
+        else:
+            self.emit("@SP", "AM=M-1", "D=M", "A=A-1", IN_PLACE[op])
+
+    def write_unary(self, instruction):
+        sign = UNARY[instruction[0]]
+        if self.cached:
+            self.emit("D=" + sign + "D")
+        else:
+            self.emit("@SP", "A=M-1", "M=" + sign + "M")
+
+    def compare_sign(self):
+        # pops y and x and leaves in D a value with the sign of x - y
+        self.load()
+        self.emit("@R13", "M=D")
+        if self.trampolines:
+            self.compares = True
+            return_label = self.new_label("ret")
+            self.emit("@" + return_label, "D=A", "@R15", "M=D", "@" + COMPARE_ROUTINE, "0;JMP",
+                      "(" + return_label + ")")
+        else:
+            prefix = self.new_label("compare")
+            self.emit(*sign_code(prefix, ["@" + prefix + "$done", "0;JMP"]), "(" + prefix + "$done)")
+
+    def compare_jump(self, op, constant, label, when):
+        # jumps to label when x op y is when, constant is y if it was not pushed
+        jump = COMPARE_JUMPS[op] if when else NEGATED_JUMPS[COMPARE_JUMPS[op]]
+        if op == "eq":
+            self.difference()
+        elif constant is None:
+            self.compare_sign()
+        else:
+            self.load()
+            if constant > 0:
+                # y is not negative, so a negative x decides it and any other x - y cannot overflow
+                skip_label = None
+                if jump in ("JLT", "JLE"):
+                    self.emit("@" + label, "D;JLT")
+                else:
+                    skip_label = self.new_label("skip")
+                    self.emit("@" + skip_label, "D;JLT")
+                if constant == 1:
+                    self.emit("D=D-1")
+                else:
+                    self.emit("@" + str(constant), "D=D-A")
+                self.emit("@" + label, "D;" + jump)
+                if skip_label is not None:
+                    self.emit("(" + skip_label + ")")
+                return
+        self.emit("@" + label, "D;" + jump)
+
+    def write_compare(self, instruction, constant=None):
+        op = instruction[0]
+        true_label = self.new_label("true")
+        end_label = self.new_label("end")
+        if not self.cache:
+            if op == "eq":
+                self.emit("@SP", "AM=M-1", "D=M", "A=A-1", "D=M-D", "@" + true_label, "D;JEQ",
+                          "@SP", "A=M-1", "M=0", "@" + end_label, "0;JMP",
+                          "(" + true_label + ")", "@SP", "A=M-1", "M=-1", "(" + end_label + ")")
+                return
+            self.compare_sign()
+            self.emit("@" + true_label, "D;" + COMPARE_JUMPS[op], "@SP", "A=M", "M=0", "@" + end_label, "0;JMP",
+                      "(" + true_label + ")", "@SP", "A=M", "M=-1", "(" + end_label + ")", "@SP", "M=M+1")
+            return
+        self.compare_jump(op, constant, true_label, True)
+        self.emit("D=0", "@" + end_label, "0;JMP", "(" + true_label + ")", "D=-1", "(" + end_label + ")")
+        self.cached = True
+
+    def write_label(self, instruction):
+        self.store()
+        self.emit("(" + self.label(instruction[1]) + ")")
+
+    def write_goto(self, instruction):
+        self.store()
+        self.emit("@" + self.label(instruction[1]), "0;JMP")
+
+    def write_if(self, instruction):
+        self.load()
+        self.emit("@" + self.label(instruction[1]), "D;JNE")
+
+    def write_function(self, instruction):
+        self.store()
+        self.function = instruction[1]
+        self.class_name = self.function.split(".")[0]
+        self.defined.add(self.function)
+        self.emit("(" + self.function + ")")
+        locals_count = instruction[2]
+        if not self.cache:
+            for _ in range(locals_count):
+                self.emit("@0", "D=A", "@SP", "A=M", "M=D", "@SP", "M=M+1")
+        elif locals_count:
+            self.emit("@SP", "A=M")
+            for _ in range(locals_count):
+                self.emit("M=0", "A=A+1")
+            self.emit("D=A", "@SP", "M=D")
+
+    def write_call(self, instruction):
+        self.store()
+        function, argc = instruction[1], instruction[2]
+        self.called.add(function)
+        return_label = self.new_label("ret")
+        if self.trampolines:
+            self.call_arities.add(argc)
+            self.emit("@" + return_label, "D=A", "@R13", "M=D", "@" + function, "D=A",
+                      "@" + CALL_TRAMPOLINE + str(argc), "0;JMP", "(" + return_label + ")")
+            # the return trampoline hands the value back in R13
+            self.emit("@R13", "D=M")
+            self.push_d()
+            return
+        self.emit("@" + return_label, "D=A", "@SP", "A=M", "M=D", "@SP", "M=M+1")
+        for register in FRAME:
+            self.emit("@" + register, "D=M", "@SP", "A=M", "M=D", "@SP", "M=M+1")
+        self.emit("@SP", "D=M", "@" + str(argc + 5), "D=D-A", "@ARG", "M=D", "@SP", "D=M", "@LCL", "M=D",
+                  "@" + function, "0;JMP", "(" + return_label + ")")
+
+    def write_return(self, instruction):
+        self.load()
+        if self.trampolines:
+            self.emit("@" + RETURN_TRAMPOLINE, "0;JMP")
+            return
+        self.emit("@R13", "M=D", "@LCL", "D=M", "@R14", "M=D", "@5", "A=D-A", "D=M", "@R15", "M=D",
+                  "@R13", "D=M", "@ARG", "A=M", "M=D", "@ARG", "D=M+1", "@SP", "M=D")
+        for register in reversed(FRAME):
+            self.emit("@R14", "AM=M-1", "D=M", "@" + register, "M=D")
+        self.emit("@R15", "A=M", "0;JMP")
+
+    def undefined_calls(self):
+        # the functions called so far that nothing translated so far defines, an assembler would take
+        # each of them for a variable
+        return sorted(self.called - self.defined)
+
+    def bootstrap(self):
+        # sets up the stack and calls the entry function, comes first in the program
+        self.function = BOOTSTRAP
+        self.out = list()
+        self.emit("@" + str(STACK_BASE), "D=A", "@SP", "M=D")
+        self.write_call(("call", ENTRY, 0))
+        self.emit("(" + BOOTSTRAP + "$halt)", "@" + BOOTSTRAP + "$halt", "0;JMP")
+        self.cached = False
+        return self.out
+
+    def shared_code(self):
+        # the trampolines the translated code jumps to, comes last in the program
+        out = list()
+        if not self.trampolines:
+            return out
+        for argc in sorted(self.call_arities):
+            # D is the function and R13 the return address
+            out.extend(["(" + CALL_TRAMPOLINE + str(argc) + ")", "@R14", "M=D", "@R13", "D=M",
+                        "@SP", "AM=M+1", "A=A-1", "M=D"])
+            for register in FRAME:
+                out.extend(["@" + register, "D=M", "@SP", "AM=M+1", "A=A-1", "M=D"])
+            out.extend(["@SP", "D=M", "@LCL", "M=D", "@" + str(argc + 5), "D=D-A", "@ARG", "M=D",
+                        "@R14", "A=M", "0;JMP"])
+        if self.compares:
+            # y is in R13 and the return address in R15
+            out.extend(["(" + COMPARE_ROUTINE + ")"] + sign_code(COMPARE_ROUTINE, ["@R15", "A=M", "0;JMP"]))
+        # D is the return value, which goes back in R13 with the stack cut back to the arguments
+        out.extend(["(" + RETURN_TRAMPOLINE + ")", "@R13", "M=D", "@LCL", "D=M", "@R14", "M=D",
+                    "@5", "A=D-A", "D=M", "@R15", "M=D", "@ARG", "D=M", "@SP", "M=D"])
+        for register in reversed(FRAME):
+            out.extend(["@R14", "AM=M-1", "D=M", "@" + register, "M=D"])
+        out.extend(["@R15", "A=M", "0;JMP"])
+        return out
+
+    HANDLERS = {"push": write_push,
+                "pop": write_pop,
+                "add": write_binary,
+                "sub": write_binary,
+                "and": write_binary,
+                "or": write_binary,
+                "neg": write_unary,
+                "not": write_unary,
+                "eq": write_compare,
+                "gt": write_compare,
+                "lt": write_compare,
+                "label": write_label,
+                "goto": write_goto,
+                "if-goto": write_if,
+                "function": write_function,
+                "call": write_call,
+                "return": write_return}
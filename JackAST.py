@@ -0,0 +1,171 @@
+# Syntax tree of a parsed Jack class, built by JackCompiler.Parser and read by the code generators
+# and optimization passes. Passes that rewrite a tree return new nodes instead of changing
+# the ones they were given, so a parsed tree can be cached and shared between backends.
+
+
+class Node:
+    __slots__ = ()
+
+    def children(self):
+        result = list()
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, Node):
+                result.append(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, Node):
+                        result.append(item)
+        return result
+
+    def __repr__(self):
+        fields = ", ".join(name + "=" + repr(getattr(self, name)) for name in self.__slots__)
+        return type(self).__name__ + "(" + fields + ")"
+
+
+class ClassDec(Node):
+    __slots__ = ("name", "class_vars", "subroutines")
+
+    def __init__(self, name, class_vars, subroutines):
+        self.name = name
+        self.class_vars = class_vars
+        self.subroutines = subroutines
+
+
+class ClassVarDec(Node):
+    __slots__ = ("kind", "type", "names")
+
+    def __init__(self, kind, var_type, names):
+        self.kind = kind
+        self.type = var_type
+        self.names = names
+
+
+class SubroutineDec(Node):
+    __slots__ = ("kind", "return_type", "name", "parameters", "locals", "statements")
+
+    def __init__(self, kind, return_type, name, parameters, local_vars, statements):
+        self.kind = kind
+        self.return_type = return_type
+        self.name = name
+        # (type, name) pairs
+        self.parameters = parameters
+        self.locals = local_vars
+        self.statements = statements
+
+
+class LetStatement(Node):
+    __slots__ = ("name", "index", "value")
+
+    def __init__(self, name, index, value):
+        self.name = name
+        # None unless the target is an array entry
+        self.index = index
+        self.value = value
+
+
+class IfStatement(Node):
+    __slots__ = ("condition", "statements", "else_statements")
+
+    def __init__(self, condition, statements, else_statements):
+        self.condition = condition
+        self.statements = statements
+        # None when there is no else block
+        self.else_statements = else_statements
+
+
+class WhileStatement(Node):
+    __slots__ = ("condition", "statements")
+
+    def __init__(self, condition, statements):
+        self.condition = condition
+        self.statements = statements
+
+
+class DoStatement(Node):
+    __slots__ = ("call",)
+
+    def __init__(self, call):
+        self.call = call
+
+
+class ReturnStatement(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class IntegerConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class StringConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        # without the surrounding quotes
+        self.value = value
+
+
+class KeywordConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class VarName(Node):
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class ArrayEntry(Node):
+    __slots__ = ("name", "index")
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+
+class SubroutineCall(Node):
+    __slots__ = ("receiver", "name", "arguments")
+
+    def __init__(self, receiver, name, arguments):
+        # a variable or class name, None for a call on the current object or class
+        self.receiver = receiver
+        self.name = name
+        self.arguments = arguments
+
+
+class UnaryOp(Node):
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+
+class BinaryOp(Node):
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+def walk(node):
+    # every node of the tree in pre-order, without recursion
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = node.children()
+        children.reverse()
+        stack.extend(children)
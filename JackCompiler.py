@@ -1,35 +1,51 @@
+import argparse
+import array
+import bisect
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import io
 import os
+import re
 import sys
 
-GARBAGE = "<>"
-JACK_FILE = 1
-KEYWORD = "keyword"
-SYMBOL = "symbol"
-INT_CONST = "integerConstant"
-STR_CONST = "stringConstant"
-IDENTIFIER = "identifier"
-
-ALL_TOKENS = {"keyword": ["class", "constructor", "function", "method", "field", "static", "var",
-                          "int", "char", "boolean", "void", "true", "false", "null", "this",
-                          "let", "do", "if", "else", "while", "return"],
-              "symbol": ["{", "}", "(", ")", "[", "]", ".", ",", ";", "+", "-", "*", "/", "&",
-                         "|", "<", ">", "=", "~"],
-              "op": ["+", "-", "*", "/", "&", "|", "<", ">", "="],
-              "keyConst": ["true", "false", "null", "this"],
-              "statements": ["let", "if", "while", "do", "return"],
-              "unary": ["~", "-"],
-              "type": ["int", "char", "boolean"],
-              "subroutine": ["constructor", "function", "method"],
-              "class": ["static", "field"]}
-REG_TYPES = ["int", "char", "boolean"]
-OS_CLASSES = ["Array", "Keyboard", "Math", "Memory", "Output", "Screen", "String", "Sys"]
+from JackAST import ArrayEntry, BinaryOp, ClassDec, ClassVarDec, DoStatement, IfStatement, IntegerConstant, \
+    KeywordConstant, LetStatement, ReturnStatement, StringConstant, SubroutineCall, SubroutineDec, UnaryOp, \
+    VarName, WhileStatement, walk
+from JackOptimizer import constant_node, fold_constants, is_boolean, trivial_body
+from HackTranslator import HackTranslator, check_rom, count_instructions
+from JackProfiler import Profiler, format_summary
+from VMBundle import BUNDLE_EXTENSION, pack
+from VMBytecode import EXTENSION, BytecodeEncoder
+from VMInterpreter import parse_vm, render_vm
+from VMOptimizer import is_plain_push, multiply_sequence, pack_locals, peephole
+
+KEYWORD = 0
+SYMBOL = 1
+INT_CONST = 2
+STR_CONST = 3
+IDENTIFIER = 4
+TOKEN_TYPE_NAMES = ("keyword", "symbol", "integerConstant", "stringConstant", "identifier")
+
+ALL_TOKENS = {"keyword": frozenset(["class", "constructor", "function", "method", "field", "static", "var",
+                                     "int", "char", "boolean", "void", "true", "false", "null", "this",
+                                     "let", "do", "if", "else", "while", "return"]),
+              "symbol": frozenset(["{", "}", "(", ")", "[", "]", ".", ",", ";", "+", "-", "*", "/", "&",
+                                   "|", "<", ">", "=", "~"]),
+              "op": frozenset(["+", "-", "*", "/", "&", "|", "<", ">", "="]),
+              "keyConst": frozenset(["true", "false", "null", "this"]),
+              "statements": frozenset(["let", "if", "while", "do", "return"]),
+              "unary": frozenset(["~", "-"]),
+              "type": frozenset(["int", "char", "boolean"]),
+              "subroutine": frozenset(["constructor", "function", "method"]),
+              "class": frozenset(["static", "field"])}
+REG_TYPES = frozenset(["int", "char", "boolean"])
+ARITHMETIC_COMMANDS = {"+": "add", "-": "sub", "=": "eq", ">": "gt", "<": "lt", "&": "and", "|": "or"}
+UNARY_COMMANDS = {"~": "not", "-": "neg"}
+OS_CLASSES = frozenset(["Array", "Keyboard", "Math", "Memory", "Output", "Screen", "String", "Sys"])
 INT_UPPER = 32767
 INT_LOWER = 0
-TYPE_POS = 0
-KIND_POS = 1
-INDEX_POS = 2
-TYPE = 0
-NAME = 1
 THIS = "this"
 STATIC = "static"
 ARGUMENT = "argument"
@@ -40,702 +56,1777 @@ FALSE = "false"
 NULL = "null"
 CTOR = "constructor"
 METHOD = "method"
+FUNCTION = "function"
 POINTER = "pointer"
 CONSTANT = "constant"
 TEMP = "temp"
 THAT = "that"
+OPS = ALL_TOKENS["op"]
+UNARY_OPS = ALL_TOKENS["unary"]
+KEYWORD_CONSTANTS = ALL_TOKENS["keyConst"]
+PARALLEL_MIN_FILES = 4
+PARALLEL_MIN_BYTES = 64 * 1024
+COMPILER_VERSION = "1.4"
+ENTRY_CLASS = "Main"
+ENTRY_FUNCTION = "main"
+# synthetic functions of the string pool, $ cannot clash with a Jack identifier
+CLASS_POOL_FUNCTION = "$strings"
+PROGRAM_POOL_FUNCTION = "$pool"
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# words of the static segment, RAM 16 to 255, that the statics of all classes share
+STATIC_WORDS = 240
+# largest inlined body, in VM instructions, that --inline accepts without a budget
+INLINE_MAX_INSTRUCTIONS = 6
+# instructions of the inlined form of each trivial_body kind, on a receiver other than this
+INLINE_SIZES = {"field": 3, "set": 6, "constant": 1}
+# characters read at a time and tokens kept when compiling with --stream
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_WINDOW = 16
+
+
+Symbol = collections.namedtuple("Symbol", ["segment", "index", "type"])
 
 
 class Token:
+    __slots__ = ("value", "type")
+
     def __init__(self, value, tok_type):
         self.value = value
         self.type = tok_type
 
 
 class SymbolTable:
-    def __init__(self):
-        self.this_index = 0
-        self.static_index = 0
-        self.argument_index = 0
-        self.local_index = 0
+    # a class or subroutine scope, a subroutine scope chains to its class scope through parent
+    def __init__(self, parent=None):
+        self.parent = parent
         self.map = dict()
+        self.counts = {THIS: 0, STATIC: 0, ARGUMENT: 0, LOCAL: 0}
 
     def start(self):
-        self.__init__()
+        self.map.clear()
+        for var_kind in self.counts:
+            self.counts[var_kind] = 0
 
     def define(self, var_name, var_type, var_kind):
-        index = 0
         if var_kind == FIELD:
-            index = self.this_index
             var_kind = THIS
-            self.this_index += 1
-        elif var_kind == STATIC:
-            index = self.static_index
-            self.static_index += 1
-        elif var_kind == ARGUMENT:
-            index = self.argument_index
-            self.argument_index += 1
-        elif var_kind == LOCAL:
-            index = self.local_index
-            self.local_index += 1
-        self.map[var_name] = (var_type, var_kind, index)
+        index = self.counts[var_kind]
+        self.counts[var_kind] = index + 1
+        self.map[var_name] = Symbol(var_kind, index, var_type)
 
     def var_count(self, var_kind):
-        res = 0
-        for key in self.map:
-            if self.map[key][KIND_POS] == var_kind:
-                res += 1
-        return res
+        if var_kind == FIELD:
+            var_kind = THIS
+        return self.counts[var_kind]
+
+    def resolve(self, var_name):
+        table = self
+        while table is not None:
+            symbol = table.map.get(var_name)
+            if symbol is not None:
+                return symbol
+            table = table.parent
+        return None
 
     def kind_of(self, var_name):
-        if var_name in self.map:
-            return self.map[var_name][KIND_POS]
-        return None
+        symbol = self.resolve(var_name)
+        return symbol.segment if symbol is not None else None
 
     def type_of(self, var_name):
-        if var_name in self.map:
-            return self.map[var_name][TYPE_POS]
-        return None
+        symbol = self.resolve(var_name)
+        return symbol.type if symbol is not None else None
 
     def index_of(self, var_name):
-        if var_name in self.map:
-            return self.map[var_name][INDEX_POS]
-        return None
+        symbol = self.resolve(var_name)
+        return symbol.index if symbol is not None else None
 
 
 class VMWriter:
-    def __init__(self, filename):
-        self.file = open(filename, "w")
+    # buffers instructions as tuples and writes them out in one go, sink is a path, "-" for stdout,
+    # a text or binary stream, or None for an in-memory buffer read back with getvalue()
+    # with optimize set every flushed batch goes through the peephole pass first and then shares local
+    # slots, with strength_reduce multiplications by small constants become additions
+    # a writer whose render returns bytes needs a binary sink
+    BINARY_OUTPUT = False
+
+    def __init__(self, sink=None, optimize=False, strength_reduce=False):
+        self.instructions = list()
+        self.optimize = optimize
+        self.strength_reduce = strength_reduce
+        self.written = 0
+        self.removed = 0
+        self.calls_saved = 0
+        # local slots saved by function name
+        self.locals_saved = dict()
+        # VM instructions written per function after the header, counted once this is a dict
+        self.function_sizes = None
+        self.path = None
+        self.stream = None
+        self.owns_stream = False
+        if sink is None:
+            self.stream = io.StringIO()
+            self.owns_stream = True
+        elif sink == "-":
+            self.stream = sys.stdout.buffer if self.BINARY_OUTPUT else sys.stdout
+        elif isinstance(sink, (str, os.PathLike)):
+            self.path = sink
+        else:
+            self.stream = sink
+        self.binary = isinstance(self.stream, (io.RawIOBase, io.BufferedIOBase))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.owns_stream and self.path is not None:
+            self.stream.close()
 
     def write_push(self, segment, index):
-        self.file.write("push " + str(segment) + " " + str(index) + "\n")
+        self.instructions.append(("push", segment, index))
 
     def write_pop(self, segment, index):
-        self.file.write("pop " + str(segment) + " " + str(index) + "\n")
+        self.instructions.append(("pop", segment, index))
 
     def write_arithmetic(self, command):
-        if command == '+':
-            self.file.write("add" + "\n")
-        if command == '-':
-            self.file.write("sub" + "\n")
-        if command == '=':
-            self.file.write("eq" + "\n")
-        if command == '>':
-            self.file.write("gt" + "\n")
-        if command == '<':
-            self.file.write("lt" + "\n")
-        if command == '&':
-            self.file.write("and" + "\n")
-        if command == '|':
-            self.file.write("or" + "\n")
         if command == '*':
+            if self.strength_reduce and self.reduce_multiply():
+                self.calls_saved += 1
+                return
             self.write_call("Math.multiply", 2)
-        if command == '/':
+        elif command == '/':
             self.write_call("Math.divide", 2)
+        else:
+            self.instructions.append((ARITHMETIC_COMMANDS[command],))
+
+    def reduce_multiply(self):
+        # x * k or k * x with both operands just pushed, where k is a constant
+        instructions = self.instructions
+        if len(instructions) < 2:
+            return False
+        last = instructions[-1]
+        before = instructions[-2]
+        if last[0] == "push" and last[1] == CONSTANT:
+            factor = last[2]
+            operand = before if is_plain_push(before) else None
+        elif before[0] == "push" and before[1] == CONSTANT and is_plain_push(last):
+            factor = before[2]
+            operand = last
+        else:
+            return False
+        code = multiply_sequence(factor, operand)
+        if code is None:
+            return False
+        del instructions[-1 if operand is None else -2:]
+        instructions.extend(code)
+        return True
 
     def write_unary(self, command):
-        if command == '~':
-            self.file.write("not" + "\n")
-        if command == '-':
-            self.file.write("neg" + "\n")
+        self.instructions.append((UNARY_COMMANDS[command],))
 
     def write_label(self, label_name):
-        self.file.write("label " + label_name + "\n")
+        self.instructions.append(("label", label_name))
 
     def write_goto(self, label_name):
-        self.file.write("goto " + label_name + "\n")
+        self.instructions.append(("goto", label_name))
 
     def write_if(self, label_name):
-        self.file.write("if-goto " + label_name + "\n")
+        self.instructions.append(("if-goto", label_name))
 
     def write_call(self, func_name, argc):
-        self.file.write("call " + func_name + " " + str(argc) + "\n")
+        self.instructions.append(("call", func_name, argc))
+
+    def write_string(self, value):
+        # String.new and a String.appendChar call per character, two writer calls less per character
+        append = self.instructions.append
+        append(("push", CONSTANT, len(value)))
+        append(("call", "String.new", 1))
+        for char in value:
+            append(("push", CONSTANT, ord(char)))
+            append(("call", "String.appendChar", 2))
 
     def write_function(self, func_name, argc):
-        self.file.write("function " + func_name + " " + str(argc) + "\n")
+        self.instructions.append(("function", func_name, argc))
 
     def write_return(self):
-        self.file.write("return" + "\n")
+        self.instructions.append(("return",))
+
+    def flush(self):
+        if not self.instructions:
+            return
+        # the same list stays the buffer, code generators append to it
+        instructions = self.instructions[:]
+        self.instructions.clear()
+        if self.optimize:
+            instructions, removed = peephole(instructions)
+            instructions, saved = pack_locals(instructions)
+            if saved:
+                # locals sharing a slot can turn a copy between them into a push and pop of the same slot
+                instructions, more = peephole(instructions)
+                removed += more
+                self.locals_saved.update(saved)
+            self.removed += removed
+        self.written += len(instructions)
+        if self.function_sizes is not None:
+            sizes = self.function_sizes
+            name = None
+            for instruction in instructions:
+                if instruction[0] == "function":
+                    name = instruction[1]
+                    sizes[name] = 0
+                elif name is not None:
+                    sizes[name] += 1
+        code = self.render(instructions)
+        if self.stream is None:
+            self.stream = open(self.path, "wb" if self.BINARY_OUTPUT else "w")
+            self.owns_stream = True
+            self.binary = self.BINARY_OUTPUT
+        if self.binary and not self.BINARY_OUTPUT:
+            self.stream.write(code.encode())
+        else:
+            self.stream.write(code)
+
+    def render(self, instructions):
+        return render_vm(instructions)
+
+    def getvalue(self):
+        self.flush()
+        return self.stream.getvalue()
+
+    def close(self):
+        self.flush()
+        if self.owns_stream and self.path is not None:
+            self.stream.close()
+        elif self.stream is not None and not self.owns_stream:
+            self.stream.flush()
 
     def close_file(self):
-        self.file.close()
+        self.close()
+
+
+class BytecodeWriter(VMWriter):
+    # a VMWriter whose output is VMBytecode, each flush continuing the string table of the last one
+    BINARY_OUTPUT = True
+
+    def __init__(self, sink=None, optimize=False, strength_reduce=False):
+        super().__init__(io.BytesIO() if sink is None else sink, optimize, strength_reduce)
+        self.encoder = BytecodeEncoder()
+
+    def render(self, instructions):
+        return self.encoder.encode(instructions)
+
+
+class HackWriter(VMWriter):
+    # a VMWriter whose output is Hack assembly, translated by a HackTranslator shared by the whole
+    # program. It counts the Hack instructions it wrote and those the textbook translation of the
+    # same VM code would have taken
+    def __init__(self, sink=None, optimize=False, strength_reduce=False, translator=None):
+        super().__init__(sink, optimize, strength_reduce)
+        self.translator = translator if translator is not None else HackTranslator()
+        self.reference = HackTranslator(trampolines=False, cache=False)
+        self.asm_written = 0
+        self.asm_reference = 0
+
+    def render(self, instructions):
+        lines = self.translator.translate(instructions)
+        self.asm_written += count_instructions(lines)
+        self.asm_reference += count_instructions(self.reference.translate(instructions))
+        return "\n".join(lines) + "\n"
+
+
+TOKEN_PATTERN = re.compile(r"""
+    //[^\n]* | /\*.*?\*/
+    | ("[^"\n]*" | \d+ | [A-Za-z_]\w* | [{}()\[\].,;+\-*&|<>=~] | /(?!\*))
+    | (/\*|"|\S)
+""", re.VERBOSE | re.DOTALL | re.ASCII)
+NEWLINE_PATTERN = re.compile("\n")
+
+
+def lex(source):
+    # one linear scan over the source, returns its tokens and their offsets in it
+    # every distinct value gets a single shared token, so the stream is a list of references
+    tokens = list()
+    offsets = array.array("l")
+    known = dict(FIXED_TOKENS)
+    for match in TOKEN_PATTERN.finditer(source):
+        value = match.group(1)
+        if value:
+            token = known.get(value)
+            if token is None:
+                if value[0] == "\"":
+                    token = Token(sys.intern(value), STR_CONST)
+                elif "0" <= value[0] <= "9":
+                    if not INT_LOWER <= int(value) <= INT_UPPER:
+                        raise_lex_error("integer constant " + value + " out of range", source, match.start())
+                    token = Token(sys.intern(value), INT_CONST)
+                else:
+                    token = Token(sys.intern(value), IDENTIFIER)
+                known[value] = token
+            tokens.append(token)
+            offsets.append(match.start())
+        elif match.group(2):
+            bad = match.group(2)
+            if bad == "/*":
+                raise_lex_error("unterminated comment", source, match.start())
+            elif bad == "\"":
+                raise_lex_error("unterminated string constant", source, match.start())
+            raise_lex_error("unexpected character " + repr(bad), source, match.start())
+    return tokens, offsets
 
 
-def is_keyword(token):
-    return token in ALL_TOKENS["keyword"]
+def raise_lex_error(problem, source, offset):
+    line, column = position_of(line_starts_of(source), offset)
+    raise Exception(problem + " at line " + str(line) + ", column " + str(column))
 
 
-def is_symbol(token):
-    return token in ALL_TOKENS["symbol"]
+def line_starts_of(source):
+    return [0] + [match.end() for match in NEWLINE_PATTERN.finditer(source)]
 
 
-def is_integer_constant(token):
-    int_st = ""
-    for char in token:
-        if "0" <= char <= "9":
-            int_st += char
-        else:
-            return False
-    return INT_LOWER <= int(int_st) <= INT_UPPER
+def position_of(line_starts, offset):
+    line = bisect.bisect_right(line_starts, offset)
+    return line, offset - line_starts[line - 1] + 1
 
 
-def is_string_constant(token):
-    for char in token[1:-1]:
-        if char == "\"" or char == "\n":
-            return False
-    return token[0] == "\"" and token[-1] == "\""
+class JackTokenizer:
 
+    def __init__(self, source):
+        self.index = 0
+        if not isinstance(source, str):
+            source = "".join(source)
+        self.tokens, self.offsets = lex(source)
+        self.line_starts = line_starts_of(source)
 
-def is_identifier(token):
-    for char in token:
-        if "0" <= char <= "9" or "A" <= char <= "Z" or "a" <= char <= "z" or char == "_":
-            continue
+    def has_more_tokens(self):
+        return self.index < len(self.tokens)
+
+    def get_next_token(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def go_back(self):
+        self.index -= 1
+
+    def position(self, index=None):
+        # line and column of a token, by default of the last one returned
+        if index is None:
+            index = self.index - 1
+        return position_of(self.line_starts, self.offsets[index])
+
+
+def read_chunks(file_name, size=STREAM_CHUNK_SIZE):
+    with open(file_name, "r") as file:
+        while True:
+            chunk = file.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def stream_lex(chunks):
+    # lex over a source given in pieces, yields each token with its line and column and keeps no more
+    # of the source than a token or comment that goes on into the next piece. String constants are
+    # not shared, there is no bound on how many distinct ones a source has
+    known = dict(FIXED_TOKENS)
+    chunks = iter(chunks)
+    buffer = ""
+    line = 1
+    # where the current line starts and how far newlines are counted, as offsets in the buffer
+    line_start = 0
+    counted = 0
+    at_end = False
+    while not at_end:
+        chunk = next(chunks, None)
+        if chunk is None:
+            at_end = True
         else:
+            buffer += chunk
+        kept = len(buffer)
+        for match in TOKEN_PATTERN.finditer(buffer):
+            value = match.group(1)
+            bad = match.group(2)
+            # a string constant cannot go on past the end of its line
+            if not at_end and (match.end() == len(buffer) or bad == "/*"
+                               or bad == "\"" and buffer.find("\n", match.start()) < 0):
+                kept = match.start()
+                break
+            if not value and not bad:
+                continue
+            start = match.start()
+            newlines = buffer.count("\n", counted, start)
+            if newlines:
+                line += newlines
+                line_start = buffer.rfind("\n", counted, start) + 1
+            counted = start
+            if bad:
+                if bad == "/*":
+                    problem = "unterminated comment"
+                elif bad == "\"":
+                    problem = "unterminated string constant"
+                else:
+                    problem = "unexpected character " + repr(bad)
+                raise Exception(problem + " at line " + str(line) + ", column " + str(start - line_start + 1))
+            token = known.get(value)
+            if token is None:
+                if value[0] == "\"":
+                    yield Token(value, STR_CONST), line, start - line_start + 1
+                    continue
+                elif "0" <= value[0] <= "9":
+                    if not INT_LOWER <= int(value) <= INT_UPPER:
+                        raise Exception("integer constant " + value + " out of range at line " + str(line) +
+                                        ", column " + str(start - line_start + 1))
+                    token = Token(sys.intern(value), INT_CONST)
+                else:
+                    token = Token(sys.intern(value), IDENTIFIER)
+                known[value] = token
+            yield token, line, start - line_start + 1
+        newlines = buffer.count("\n", counted, kept)
+        if newlines:
+            line += newlines
+            line_start = buffer.rfind("\n", counted, kept) + 1
+        buffer = buffer[kept:]
+        line_start -= kept
+        counted = 0
+
+
+class TokenWindow:
+    # the token list of a StreamingTokenizer: reading an index past the end lexes on to it, and only the
+    # last size tokens stay, enough for the parser's lookahead and error messages
+    def __init__(self, stream, size=STREAM_WINDOW):
+        self.stream = stream
+        self.size = size
+        self.tokens = [None] * size
+        self.positions = [None] * size
+        self.end = 0
+
+    def __len__(self):
+        # the tokens read so far
+        return self.end
+
+    def __getitem__(self, index):
+        while index >= self.end:
+            item = next(self.stream, None)
+            if item is None:
+                raise IndexError(index)
+            slot = self.end % self.size
+            self.tokens[slot] = item[0]
+            self.positions[slot] = item[1:]
+            self.end += 1
+        if index < self.end - self.size:
+            raise Exception("token " + str(index) + " is out of the window of the last " + str(self.size))
+        return self.tokens[index % self.size]
+
+    def position(self, index):
+        self[index]
+        return self.positions[index % self.size]
+
+
+class StreamingTokenizer(JackTokenizer):
+    # a JackTokenizer over a source given in pieces, such as read_chunks of a file, that holds a
+    # TokenWindow of it instead of all its tokens
+    def __init__(self, chunks, window=STREAM_WINDOW):
+        self.index = 0
+        self.tokens = TokenWindow(stream_lex(chunks), window)
+
+    def has_more_tokens(self):
+        try:
+            self.tokens[self.index]
+        except IndexError:
             return False
-    return True
+        return True
 
+    def position(self, index=None):
+        if index is None:
+            index = self.index - 1
+        return self.tokens.position(index)
 
-def make_jack_st(lines):
-    lines = first_pass(lines)
-    return create_st(lines)
-
-
-def rid_of_spaces(st):
-    new_st = ""
-    add_space = False
-    for sym in ALL_TOKENS["symbol"]:
-        if sym in st:
-            st = st.replace(sym, " " + sym + " ")
-    # get rid of all spaces
-    i = 0
-    while i < len(st):
-        if st[i] == "\"":
-            if add_space is True:
-                new_st += " "
-                add_space = False
-            index = st[i + 1:].index("\"")
-            new_st += st[i:i + index + 2].replace(" ", GARBAGE)
-            i += index + 2
-            continue
-        if st[i] == " " or st[i] == "\t" or st[i] == "\n" or st[i] == "\r":
-            add_space = True
-            i += 1
-            continue
-        if add_space is True:
-            new_st += " "
-            add_space = False
-        new_st += st[i]
-        i += 1
-    if len(new_st) > 0 and new_st[-1] != " ":
-        new_st += " "
-    return new_st
-
-
-def first_pass(lines):
-    i = 0
-    while i < len(lines):
-        if "//" in lines[i]:
-            lines[i] = lines[i][:lines[i].index("//")]
-        elif "/**" in lines[i]:
-            while "*/" not in lines[i]:
-                lines[i] = ""
-                i += 1
-            lines[i] = ""
-        elif "/*" in lines[i]:
-            lines[i] = lines[i][:lines[i].index("/*")]
-        lines[i] = rid_of_spaces(lines[i])
-        i += 1
-    return lines
 
+def declared_kinds(chunks):
+    # the kind of each subroutine a source declares by name, without parsing it, the keywords that
+    # declare them appear nowhere else
+    kinds = dict()
+    stream = stream_lex(chunks)
+    for token, line, column in stream:
+        if token.type == KEYWORD and token.value in ALL_TOKENS["subroutine"]:
+            next(stream, None)
+            name = next(stream, None)
+            if name is not None:
+                kinds[name[0].value] = token.value
+    return kinds
 
-def create_st(lines):
-    st = ""
-    for i in range(len(lines)):
-        if lines[i]:
-            st = st + str(lines[i])
-    return st
 
+FIXED_TOKENS = dict([(keyword, Token(keyword, KEYWORD)) for keyword in ALL_TOKENS["keyword"]]
+                    + [(symbol, Token(symbol, SYMBOL)) for symbol in ALL_TOKENS["symbol"]])
 
-class JackTokenizer:
 
-    def __init__(self, string_list):
-        self.index = 0
-        self.string_list = string_list
-        st = make_jack_st(string_list)
-        self.string_list = st.split()
+class Parser:
+    # recursive descent over the token stream, builds a JackAST.ClassDec per class
+    # reads the tokenizer's token list directly, this is the hottest loop of the compiler
+    def __init__(self, jk):
+        self.jk = jk
+        self.tokens = jk.tokens
+        self.index = jk.index
 
-    def has_more_tokens(self):
-        if self.index < len(self.string_list):
-            return True
-        return False
+    def error(self, message):
+        line, column = self.jk.position(min(self.index, len(self.tokens)) - 1)
+        raise Exception(message + " at line " + str(line) + ", column " + str(column))
 
-    def get_next_token(self):
-        if is_keyword(self.string_list[self.index]):
-            token = Token(self.string_list[self.index], KEYWORD)
-        elif is_symbol(self.string_list[self.index]):
-            token = Token(self.string_list[self.index], SYMBOL)
-        elif is_integer_constant(self.string_list[self.index]):
-            token = Token(self.string_list[self.index], INT_CONST)
-        elif is_string_constant(self.string_list[self.index]):
-            token = Token(self.string_list[self.index].replace("<>", " "), STR_CONST)
-        elif is_identifier(self.string_list[self.index]):
-            token = Token(self.string_list[self.index], IDENTIFIER)
+    def next_token(self):
+        token = self.tokens[self.index]
         self.index += 1
         return token
 
-    def go_back(self):
-        self.index -= 1
+    def expect(self, value):
+        token = self.tokens[self.index]
+        self.index += 1
+        if token.value != value:
+            self.error("expected '" + value + "' but found '" + token.value + "'")
 
+    def unexpected(self, value):
+        # the hot paths check the next token inline and only call this on a mismatch
+        self.index += 1
+        self.error("expected '" + value + "' but found '" + self.tokens[self.index - 1].value + "'")
 
-def is_term(token):
-    return token.type == IDENTIFIER or token.type == INT_CONST or token.type == STR_CONST \
-           or token.value in ALL_TOKENS["keyConst"] or token.value == "(" \
-           or token.value in ALL_TOKENS["unary"]
+    def expect_identifier(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        if token.type != IDENTIFIER:
+            self.error("expected an identifier but found '" + token.value + "'")
+        return token.value
 
+    def expect_type(self, allow_void=False):
+        token = self.tokens[self.index]
+        self.index += 1
+        if token.type != IDENTIFIER and token.value not in ALL_TOKENS["type"] \
+                and not (allow_void and token.value == "void"):
+            self.error("expected a type but found '" + token.value + "'")
+        return token.value
+
+    def parse_class(self):
+        try:
+            class_dec = self.parse_class_body()
+        except IndexError:
+            self.index = len(self.tokens) + 1
+            self.error("unexpected end of file")
+        self.jk.index = self.index
+        return class_dec
+
+    def parse_class_stream(self):
+        # parse_class a subroutine at a time, yields the ClassDec with no subroutines and then each of them
+        try:
+            yield self.parse_class_head()
+            while self.tokens[self.index].value in ALL_TOKENS["subroutine"]:
+                yield self.parse_subroutine_dec()
+            self.expect("}")
+        except IndexError:
+            self.index = len(self.tokens) + 1
+            self.error("unexpected end of file")
+        self.jk.index = self.index
+
+    def expect_end(self):
+        if self.jk.has_more_tokens():
+            self.index += 1
+            self.error("unexpected '" + self.jk.peek().value + "' after the end of the class")
+
+    def parse_class_body(self):
+        class_dec = self.parse_class_head()
+        while self.tokens[self.index].value in ALL_TOKENS["subroutine"]:
+            class_dec.subroutines.append(self.parse_subroutine_dec())
+        self.expect("}")
+        return class_dec
+
+    def parse_class_head(self):
+        # 'class' name '{' class variables
+        self.expect("class")
+        class_name = self.expect_identifier()
+        self.expect("{")
+        class_vars = list()
+        while self.tokens[self.index].value in ALL_TOKENS["class"]:
+            class_vars.append(self.parse_class_var_dec())
+        return ClassDec(class_name, class_vars, list())
+
+    def parse_class_var_dec(self):
+        # ('static'|'field') type name (',' name)* ';'
+        static_or_field = self.next_token().value
+        var_type = self.expect_type()
+        names = [self.expect_identifier()]
+        while self.tokens[self.index].value == ",":
+            self.index += 1
+            names.append(self.expect_identifier())
+        self.expect(";")
+        return ClassVarDec(static_or_field, var_type, names)
+
+    def parse_subroutine_dec(self):
+        # ('constructor'|'function'|'method') ('void'|type) name '(' parameters ')' body
+        kind = self.next_token().value
+        return_type = self.expect_type(True)
+        name = self.expect_identifier()
+        self.expect("(")
+        parameters = self.parse_parameter_list()
+        self.expect(")")
+        self.expect("{")
+        local_vars = list()
+        while self.tokens[self.index].value == "var":
+            self.parse_var_dec(local_vars)
+        statements = self.parse_statements()
+        self.expect("}")
+        return SubroutineDec(kind, return_type, name, parameters, local_vars, statements)
+
+    def parse_parameter_list(self):
+        parameters = list()
+        if self.tokens[self.index].value == ")":
+            return parameters
+        parameters.append((self.expect_type(), self.expect_identifier()))
+        while self.tokens[self.index].value == ",":
+            self.index += 1
+            parameters.append((self.expect_type(), self.expect_identifier()))
+        return parameters
+
+    def parse_var_dec(self, local_vars):
+        # 'var' type name (',' name)* ';'
+        self.index += 1
+        var_type = self.expect_type()
+        local_vars.append((var_type, self.expect_identifier()))
+        while self.tokens[self.index].value == ",":
+            self.index += 1
+            local_vars.append((var_type, self.expect_identifier()))
+        self.expect(";")
+
+    def parse_statements(self):
+        statements = list()
+        tokens = self.tokens
+        while True:
+            value = tokens[self.index].value
+            if value == "let":
+                statements.append(self.parse_let())
+            elif value == "if":
+                statements.append(self.parse_if())
+            elif value == "while":
+                statements.append(self.parse_while())
+            elif value == "do":
+                statements.append(self.parse_do())
+            elif value == "return":
+                statements.append(self.parse_return())
+            else:
+                return statements
 
-def is_statement(token):
-    return token.value in ALL_TOKENS["statements"]
+    def parse_let(self):
+        # 'let' name ('[' expression ']')? '=' expression ';'
+        tokens = self.tokens
+        self.index += 1
+        var_name = self.expect_identifier()
+        index = None
+        if tokens[self.index].value == "[":
+            self.index += 1
+            index = self.parse_expression()
+            self.expect("]")
+        if tokens[self.index].value != "=":
+            self.unexpected("=")
+        self.index += 1
+        value = self.parse_expression()
+        if tokens[self.index].value != ";":
+            self.unexpected(";")
+        self.index += 1
+        return LetStatement(var_name, index, value)
 
+    def parse_if(self):
+        # 'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
+        self.index += 1
+        self.expect("(")
+        condition = self.parse_expression()
+        self.expect(")")
+        self.expect("{")
+        statements = self.parse_statements()
+        self.expect("}")
+        else_statements = None
+        if self.tokens[self.index].value == "else":
+            self.index += 1
+            self.expect("{")
+            else_statements = self.parse_statements()
+            self.expect("}")
+        return IfStatement(condition, statements, else_statements)
+
+    def parse_while(self):
+        # 'while' '(' expression ')' '{' statements '}'
+        self.index += 1
+        self.expect("(")
+        condition = self.parse_expression()
+        self.expect(")")
+        self.expect("{")
+        statements = self.parse_statements()
+        self.expect("}")
+        return WhileStatement(condition, statements)
+
+    def parse_do(self):
+        # 'do' subroutineCall ';'
+        self.index += 1
+        name = self.expect_identifier()
+        following = self.tokens[self.index].value
+        if following != "(" and following != ".":
+            self.error("expected a subroutine call")
+        call = self.parse_subroutine_call(name)
+        self.expect(";")
+        return DoStatement(call)
+
+    def parse_return(self):
+        # 'return' expression? ';'
+        self.index += 1
+        value = None
+        if self.tokens[self.index].value != ";":
+            value = self.parse_expression()
+        self.expect(";")
+        return ReturnStatement(value)
+
+    def parse_expression(self):
+        # term (op term)*, evaluated left to right. The expressions nested in parentheses, array indexes
+        # and call arguments open a frame instead of recursing, so any depth parses in one loop. The
+        # innermost frame is in locals: what opened it, None for the outermost, "(" or the class of the
+        # node it is part of, the expression so far, the op and the unary ops before the next term, and
+        # the array name or the call's receiver, name and arguments so far. The others wait on a stack.
+        # The position is a local too, stored back before anything that reads it
+        tokens = self.tokens
+        index = self.index
+        frames = list()
+        opened = left = op = unary_ops = extra = None
+        while True:
+            token = tokens[index]
+            index += 1
+            tok_type = token.type
+            if tok_type == IDENTIFIER:
+                following = tokens[index].value
+                if following == "[":
+                    index += 1
+                    frames.append((opened, left, op, unary_ops, extra))
+                    opened, left, op, unary_ops, extra = ArrayEntry, None, None, None, token.value
+                    continue
+                if following == "(" or following == ".":
+                    receiver = None
+                    name = token.value
+                    if following == ".":
+                        receiver = name
+                        token = tokens[index + 1]
+                        index += 2
+                        if token.type != IDENTIFIER:
+                            self.index = index
+                            self.error("expected an identifier but found '" + token.value + "'")
+                        name = token.value
+                    if tokens[index].value != "(":
+                        self.index = index
+                        self.unexpected("(")
+                    index += 1
+                    if tokens[index].value != ")":
+                        frames.append((opened, left, op, unary_ops, extra))
+                        opened, left, op, unary_ops, extra = SubroutineCall, None, None, None, (receiver, name, [])
+                        continue
+                    index += 1
+                    term = SubroutineCall(receiver, name, [])
+                else:
+                    term = VarName(token.value)
+            elif tok_type == INT_CONST:
+                term = IntegerConstant(int(token.value))
+            elif tok_type == STR_CONST:
+                term = StringConstant(token.value[1:-1])
+            else:
+                value = token.value
+                if value in KEYWORD_CONSTANTS:
+                    term = KeywordConstant(value)
+                elif value == "(":
+                    frames.append((opened, left, op, unary_ops, extra))
+                    opened, left, op, unary_ops, extra = "(", None, None, None, None
+                    continue
+                elif value in UNARY_OPS:
+                    if unary_ops is None:
+                        unary_ops = [value]
+                    else:
+                        unary_ops.append(value)
+                    continue
+                else:
+                    self.index = index
+                    self.error("expected a term but found '" + value + "'")
+            # a term ends here, and so may the expressions of the frames it closes
+            while True:
+                if unary_ops is not None:
+                    while unary_ops:
+                        term = UnaryOp(unary_ops.pop(), term)
+                    unary_ops = None
+                left = term if left is None else BinaryOp(op, left, term)
+                value = tokens[index].value
+                if value in OPS:
+                    op = value
+                    index += 1
+                    break
+                if opened is None:
+                    self.index = index
+                    return left
+                if opened == "(":
+                    if value != ")":
+                        self.index = index
+                        self.unexpected(")")
+                    index += 1
+                    term = left
+                elif opened is ArrayEntry:
+                    if value != "]":
+                        self.index = index
+                        self.unexpected("]")
+                    index += 1
+                    term = ArrayEntry(extra, left)
+                else:
+                    extra[2].append(left)
+                    if value == ",":
+                        index += 1
+                        left = None
+                        break
+                    if value != ")":
+                        self.index = index
+                        self.unexpected(")")
+                    index += 1
+                    term = SubroutineCall(extra[0], extra[1], extra[2])
+                opened, left, op, unary_ops, extra = frames.pop()
+
+    def parse_subroutine_call(self, name):
+        # name '(' expressions ')' | (className|varName) '.' name '(' expressions ')'
+        tokens = self.tokens
+        receiver = None
+        if tokens[self.index].value == ".":
+            self.index += 1
+            receiver = name
+            name = self.expect_identifier()
+        if tokens[self.index].value != "(":
+            self.unexpected("(")
+        self.index += 1
+        arguments = self.parse_expression_list()
+        if tokens[self.index].value != ")":
+            self.unexpected(")")
+        self.index += 1
+        return SubroutineCall(receiver, name, arguments)
 
-class CompilationEngine:
-    def __init__(self, jk, vmw):
-        self.jk = jk
+    def parse_expression_list(self):
+        arguments = list()
+        if self.tokens[self.index].value == ")":
+            return arguments
+        arguments.append(self.parse_expression())
+        while self.tokens[self.index].value == ",":
+            self.index += 1
+            arguments.append(self.parse_expression())
+        return arguments
+
+
+# arguments of an inlined constant subroutine that are left out since evaluating them does nothing
+INLINE_SKIPPED_ARGUMENTS = (IntegerConstant, StringConstant, KeywordConstant, VarName)
+
+
+class CodeGenerator:
+    # walks a JackAST.ClassDec and emits it through a VMWriter, or anything with the same interface,
+    # inlining the calls to the trivial subroutines of the inliner if there is one and with rotate_loops
+    # testing the while conditions that are true or false at the bottom of their loops
+    def __init__(self, vmw, inliner=None, rotate_loops=False):
         self.vmw = vmw
-        self.current_token = jk.get_next_token()
+        # the instructions that go through no writer logic are appended straight to its buffer
+        self.emit = vmw.instructions.append
+        self.inliner = inliner
+        self.rotate_loops = rotate_loops
         self.class_name = ""
-        self.func_name = ""
-        self.call_name = ""
         self.class_st = SymbolTable()
-        self.func_st = SymbolTable()
-        self.is_void = False
-        self.is_method = False
-        self.is_ctor = False
-        self.argc = 1
-        self.add_arg = 0
+        self.func_st = SymbolTable(self.class_st)
+        self.subroutine_kinds = dict()
+        self.subroutine = None
         self.label_index = 1
-        self.first_is_array = False
-        self.second_is_array = False
 
-    def compile_all(self):
-        self.compile_class()
-
-    # def write_token(self):
-    #     self.out_file.write("\t" * self.tabs + "<" + self.current_token.type + "> " +
-    #                         self.current_token.value + " </" + self.current_token.type + ">\n")
-
-    def compile_class(self):
+    def compile_class(self, class_dec):
+        subroutine_kinds = dict()
+        if self.inliner is not None:
+            subroutine_kinds.update(self.inliner.kinds.get(class_dec.name, ()))
+        for subroutine in class_dec.subroutines:
+            subroutine_kinds[subroutine.name] = subroutine.kind
+        self.start_class(class_dec, subroutine_kinds)
+        for subroutine in class_dec.subroutines:
+            self.compile_subroutine(subroutine)
+
+    def start_class(self, class_dec, subroutine_kinds):
+        # takes the class's variables and the kinds of all its subroutines, which its calls depend on
+        self.class_name = class_dec.name
         self.class_st.start()
-        # 'class'
-        self.current_token = self.jk.get_next_token()
-        # class name
-        self.class_name = self.current_token.value
-        self.current_token = self.jk.get_next_token()
-        # {
-        self.current_token = self.jk.get_next_token()
-        while self.current_token.value in ALL_TOKENS["class"]\
-                or self.current_token.value in ALL_TOKENS["subroutine"]:
-            if self.current_token.value in ALL_TOKENS["class"]:
-                self.compile_class_var_dec()
-                self.current_token = self.jk.get_next_token()
-            elif self.current_token.value in ALL_TOKENS["subroutine"]:
-                self.compile_subroutine_dec()
-                self.current_token = self.jk.get_next_token()
-        # }
-
-    def compile_class_var_dec(self):
-        # ('static'|'field')
-        static_or_field = self.current_token.value
-        self.current_token = self.jk.get_next_token()
-        # type
-        var_type = self.current_token.value
-        self.current_token = self.jk.get_next_token()
-        # var name
-        self.class_st.define(self.current_token.value, var_type, static_or_field)
-        self.current_token = self.jk.get_next_token()
-        while self.current_token.value == ",":
-            # ','
-            self.current_token = self.jk.get_next_token()
-            # var name
-            self.class_st.define(self.current_token.value, var_type, static_or_field)
-            self.current_token = self.jk.get_next_token()
-        # ';'
-
-    def compile_subroutine_body(self):
-        # {
-        self.current_token = self.jk.get_next_token()
-        while self.current_token.value == "var":
-            self.compile_var_dec()
-            self.current_token = self.jk.get_next_token()
-        self.vmw.write_function(self.class_name + "." + self.func_name, self.func_st.var_count(LOCAL))
-        if self.is_method is True:
-            self.vmw.write_push(ARGUMENT, 0)
-            self.vmw.write_pop(POINTER, 0)
-        elif self.is_ctor is True:
-            self.vmw.write_push(CONSTANT, self.class_st.var_count(THIS))
-            self.vmw.write_call("Memory.alloc", 1)
-            self.vmw.write_pop(POINTER, 0)
-        self.compile_statements()
-        self.current_token = self.jk.get_next_token()
-        # }
+        for var_dec in class_dec.class_vars:
+            for var_name in var_dec.names:
+                self.class_st.define(var_name, var_dec.type, var_dec.kind)
+        self.subroutine_kinds = subroutine_kinds
 
-    def compile_subroutine_dec(self):
+    def compile_subroutine(self, subroutine):
+        self.subroutine = subroutine
         self.func_st.start()
-        # (constructor|function|method)
-        self.is_ctor, self.is_method = False, False
-        if self.current_token.value == METHOD:
+        if subroutine.kind == METHOD:
             self.func_st.define(THIS, self.class_name, ARGUMENT)
-            self.is_method = True
-        elif self.current_token.value == CTOR:
-            self.is_ctor = True
-        self.current_token = self.jk.get_next_token()
-        # (void|type)
-        if self.current_token.value == "void":
-            self.is_void = True
-        else:
-            self.is_void = False
-        self.current_token = self.jk.get_next_token()
-        # subroutine name
-        self.func_name = self.current_token.value
-        self.current_token = self.jk.get_next_token()
-        # (
-        self.current_token = self.jk.get_next_token()
-        self.compile_parameter_list()
-        self.current_token = self.jk.get_next_token()
-        # )
-        self.current_token = self.jk.get_next_token()
-        self.compile_subroutine_body()
-
-    def compile_parameter_list(self):
-        if self.current_token.value in ALL_TOKENS["type"]:
-            # type
-            var_type = self.current_token.value
-            self.current_token = self.jk.get_next_token()
-            # var name
-            self.func_st.define(self.current_token.value, var_type, ARGUMENT)
-            self.current_token = self.jk.get_next_token()
-            if self.current_token.value == ",":
-                while self.current_token.value == ",":
-                    # ,
-                    self.current_token = self.jk.get_next_token()
-                    # type
-                    var_type = self.current_token.value
-                    self.current_token = self.jk.get_next_token()
-                    # var name
-                    self.func_st.define(self.current_token.value, var_type, ARGUMENT)
-                    self.current_token = self.jk.get_next_token()
-                self.jk.go_back()
+        for var_type, var_name in subroutine.parameters:
+            self.func_st.define(var_name, var_type, ARGUMENT)
+        for var_type, var_name in subroutine.locals:
+            self.func_st.define(var_name, var_type, LOCAL)
+        self.emit(("function", self.class_name + "." + subroutine.name, self.func_st.var_count(LOCAL)))
+        if subroutine.kind == METHOD:
+            self.emit(("push", ARGUMENT, 0))
+            self.emit(("pop", POINTER, 0))
+        elif subroutine.kind == CTOR:
+            self.emit(("push", CONSTANT, self.class_st.var_count(THIS)))
+            self.emit(("call", "Memory.alloc", 1))
+            self.emit(("pop", POINTER, 0))
+        self.compile_entry(subroutine)
+        self.compile_statements(subroutine.statements)
+
+    def compile_entry(self, subroutine):
+        # code every call of the subroutine runs before its statements, for generators to extend
+        pass
+
+    def compile_statements(self, statements):
+        for statement in statements:
+            self.STATEMENT_HANDLERS[type(statement)](self, statement)
+
+    def resolve(self, var_name):
+        # the hot paths call func_st.resolve themselves and only come here to report a miss
+        symbol = self.func_st.resolve(var_name)
+        if symbol is None:
+            raise Exception("undefined variable '" + var_name + "' in " + self.class_name + "." + self.subroutine.name)
+        return symbol
+
+    def compile_let(self, statement):
+        symbol = self.func_st.resolve(statement.name)
+        if symbol is None:
+            symbol = self.resolve(statement.name)
+        if statement.index is None:
+            self.TERM_HANDLERS[type(statement.value)](self, statement.value)
+            self.emit(("pop", symbol.segment, symbol.index))
+            return
+        self.emit(("push", symbol.segment, symbol.index))
+        self.compile_expression(statement.index)
+        self.vmw.write_arithmetic("+")
+        self.compile_expression(statement.value)
+        self.emit(("pop", TEMP, 0))
+        self.emit(("pop", POINTER, 1))
+        self.emit(("push", TEMP, 0))
+        self.emit(("pop", THAT, 0))
+
+    def compile_if(self, statement):
+        self.compile_expression(statement.condition)
+        self.vmw.write_unary("~")
+        start_label = self.label_index
+        self.emit(("if-goto", "L" + str(start_label)))
+        self.label_index += 2
+        self.compile_statements(statement.statements)
+        self.emit(("goto", "L" + str(start_label + 1)))
+        self.emit(("label", "L" + str(start_label)))
+        if statement.else_statements is not None:
+            self.compile_statements(statement.else_statements)
+        self.emit(("label", "L" + str(start_label + 1)))
+
+    def compile_while(self, statement):
+        if self.rotate_loops and is_boolean(statement.condition):
+            self.compile_rotated_while(statement)
+            return
+        start_label = self.label_index
+        self.emit(("label", "L" + str(start_label)))
+        self.label_index += 2
+        self.compile_expression(statement.condition)
+        self.vmw.write_unary("~")
+        self.emit(("if-goto", "L" + str(start_label + 1)))
+        self.compile_statements(statement.statements)
+        self.emit(("goto", "L" + str(start_label)))
+        self.emit(("label", "L" + str(start_label + 1)))
+        self.label_index += 1
+
+    def compile_rotated_while(self, statement):
+        # jumps to the condition once, after that each iteration ends with a single if-goto on the
+        # condition itself, no not and no goto. Only for conditions that are true or false: if-goto
+        # jumps on any value but 0, where the usual layout's not and if-goto leave on any but -1
+        body_label = "L" + str(self.label_index)
+        condition_label = "L" + str(self.label_index + 1)
+        self.label_index += 2
+        self.emit(("goto", condition_label))
+        self.emit(("label", body_label))
+        self.compile_statements(statement.statements)
+        self.emit(("label", condition_label))
+        self.compile_expression(statement.condition)
+        self.emit(("if-goto", body_label))
+
+    def compile_do(self, statement):
+        self.compile_expression(statement.call)
+        self.emit(("pop", TEMP, 0))
+
+    def compile_return(self, statement):
+        if self.subroutine.kind == CTOR:
+            self.emit(("push", POINTER, 0))
+        elif statement.value is not None:
+            self.compile_expression(statement.value)
+        if self.subroutine.return_type == "void":
+            self.emit(("push", CONSTANT, 0))
+        self.emit(("return",))
+
+    def compile_expression(self, expression):
+        # with a work stack instead of recursion, so no nesting depth is too deep. Leaves are compiled
+        # as they come off the stack, an operation pushes what it is made of in reverse order of
+        # evaluation and, under them, what writes what follows them: the op of a binary operation, or
+        # a (method, arguments...) tuple. The operations of leaves alone compile at once, without it
+        term_handlers = self.TERM_HANDLERS
+        expanders = self.EXPANDERS
+        if type(expression) not in expanders:
+            term_handlers[type(expression)](self, expression)
+            return
+        write_arithmetic = self.vmw.write_arithmetic
+        stack = [expression]
+        pop = stack.pop
+        while stack:
+            item = pop()
+            item_type = type(item)
+            if item_type is str:
+                write_arithmetic(item)
+            elif item_type in expanders:
+                expanders[item_type](self, item, stack)
+            elif item_type is tuple:
+                item[0](*item[1:])
             else:
-                self.jk.go_back()
-        else:
-            self.jk.go_back()
-
-    def compile_var_dec(self):
-        # 'var'
-        self.current_token = self.jk.get_next_token()
-        # type
-        var_type = self.current_token.value
-        self.current_token = self.jk.get_next_token()
-        # var name
-        self.func_st.define(self.current_token.value, var_type, "local")
-        self.current_token = self.jk.get_next_token()
-        while self.current_token.value == ",":
-            # ,
-            self.current_token = self.jk.get_next_token()
-            # var name
-            self.func_st.define(self.current_token.value, var_type, "local")
-            self.current_token = self.jk.get_next_token()
-        # ;
+                term_handlers[item_type](self, item)
 
-    def compile_statements(self):
-        if is_statement(self.current_token):
-            while is_statement(self.current_token):
-                self.argc = 1
-                self.add_arg = 0
-                self.call_name = ""
-                if self.current_token.value == "let":
-                    self.compile_let()
-                    self.current_token = self.jk.get_next_token()
-                elif self.current_token.value == "if":
-                    self.compile_if()
-                    self.current_token = self.jk.get_next_token()
-                elif self.current_token.value == "while":
-                    self.compile_while()
-                    self.current_token = self.jk.get_next_token()
-                elif self.current_token.value == "do":
-                    self.compile_do()
-                    self.vmw.write_pop("temp", 0)
-                    self.current_token = self.jk.get_next_token()
-                elif self.current_token.value == "return":
-                    self.compile_return()
-                    self.current_token = self.jk.get_next_token()
-            self.jk.go_back()
-        else:
-            self.jk.go_back()
+    def compile_integer(self, term):
+        self.emit(("push", CONSTANT, term.value))
 
-    def compile_do(self):
-        # do
-        self.current_token = self.jk.get_next_token()
-        # subroutine identifier
-        if self.current_token.value in self.func_st.map:
-            self.call_name = self.func_st.type_of(self.current_token.value)
-            self.vmw.write_push(self.func_st.kind_of(self.current_token.value),
-                                self.func_st.index_of(self.current_token.value))
-            self.add_arg = 1
-        elif self.current_token.value in self.class_st.map:
-            self.call_name = self.class_st.type_of(self.current_token.value)
-            self.vmw.write_push(self.class_st.kind_of(self.current_token.value),
-                                self.class_st.index_of(self.current_token.value))
-            self.add_arg = 1
+    def compile_string(self, term):
+        self.vmw.write_string(term.value)
+
+    def compile_keyword(self, term):
+        if term.value == TRUE:
+            self.emit(("push", CONSTANT, 1))
+            self.vmw.write_unary("-")
+        elif term.value == THIS:
+            self.emit(("push", POINTER, 0))
+        else:
+            # false and null
+            self.emit(("push", CONSTANT, 0))
+
+    def compile_var_name(self, term):
+        symbol = self.func_st.resolve(term.name)
+        if symbol is None:
+            symbol = self.resolve(term.name)
+        self.emit(("push", symbol.segment, symbol.index))
+
+    def expand_array_entry(self, term, stack):
+        symbol = self.resolve(term.name)
+        self.emit(("push", symbol.segment, symbol.index))
+        index = term.index
+        if type(index) in self.EXPANDERS:
+            stack.append((self.read_that,))
+            stack.append(index)
         else:
-            # class name
-            if 'A' <= self.current_token.value[0] <= 'Z':
-                self.call_name = self.current_token.value
+            self.TERM_HANDLERS[type(index)](self, index)
+            self.read_that()
+
+    def read_that(self):
+        # the entry at the address on top of the stack
+        self.vmw.write_arithmetic("+")
+        self.emit(("pop", POINTER, 1))
+        self.emit(("push", THAT, 0))
+
+    def expand_subroutine_call(self, term, stack):
+        argc = len(term.arguments)
+        # where the object of a method call is, None for functions and constructors
+        receiver = None
+        if term.receiver is None:
+            # a method of this class unless the class declares it as a function or constructor
+            if self.subroutine_kinds.get(term.name, METHOD) == METHOD:
+                receiver = POINTER, 0
+            func_name = self.class_name + "." + term.name
+        else:
+            symbol = self.func_st.resolve(term.receiver)
+            if symbol is not None:
+                receiver = symbol.segment, symbol.index
+                func_name = symbol.type + "." + term.name
             else:
-            # subroutine name
-                self.call_name = self.current_token.value
-                self.vmw.write_push(POINTER, 0)
-                self.add_arg = 1
-        self.current_token = self.jk.get_next_token()
-        self.compile_subroutine_call()
-        self.current_token = self.jk.get_next_token()
-        # ;
-
-    def compile_let(self):
-        self.first_is_array = False
-        self.second_is_array = False
-        # let
-        self.current_token = self.jk.get_next_token()
-        # some var name
-        var_name = self.current_token.value
-        self.current_token = self.jk.get_next_token()
-        if self.current_token.value == "[":
-            # [
-            self.first_is_array = True
-            if var_name in self.func_st.map:
-                self.vmw.write_push(self.func_st.kind_of(var_name), self.func_st.index_of(var_name))
-            elif var_name in self.class_st.map:
-                self.vmw.write_push(self.class_st.kind_of(var_name), self.class_st.index_of(var_name))
-            self.current_token = self.jk.get_next_token()
-            self.compile_expression()
-            self.current_token = self.jk.get_next_token()
-            # ]
-            self.vmw.write_arithmetic("+")
-            self.current_token = self.jk.get_next_token()
-        self.argc = 1
-        self.call_name = ""
-        self.add_arg = 0
-        # =
-        self.current_token = self.jk.get_next_token()
-        self.compile_expression()
-        if self.first_is_array is True:
-            if self.second_is_array is True:
-                self.vmw.write_pop(TEMP, 0)
-                self.vmw.write_pop(POINTER, 1)
-                self.vmw.write_push(TEMP, 0)
-                self.vmw.write_pop(THAT, 0)
+                func_name = term.receiver + "." + term.name
+        if self.inliner is not None and func_name in self.inliner.bodies \
+                and self.expand_inline(func_name, receiver, term.arguments, stack):
+            return
+        if receiver is not None:
+            self.emit(("push", receiver[0], receiver[1]))
+            argc += 1
+        stack.append((self.emit, ("call", func_name, argc)))
+        stack.extend(reversed(term.arguments))
+
+    def expand_inline(self, func_name, receiver, arguments, stack):
+        # the body of a trivial subroutine in place of its call, False when the call does not fit it
+        kind, operand, argc = self.inliner.bodies[func_name]
+        if len(arguments) + (receiver is not None) != argc:
+            return False
+        if kind != "constant" and receiver is None:
+            # a method called like a function, its object an argument, has no receiver to read
+            return False
+        vmw = self.vmw
+        # counted once its arguments are compiled, as the calls inlined in them are
+        stack.append((self.count_inlined, func_name))
+        if kind == "field":
+            if receiver == (POINTER, 0):
+                vmw.write_push(THIS, operand)
             else:
-                # only first is array
-                self.vmw.write_pop(TEMP, 0)
-                self.vmw.write_pop(POINTER, 1)
-                self.vmw.write_push(TEMP, 0)
-                self.vmw.write_pop(THAT, 0)
+                vmw.write_push(receiver[0], receiver[1])
+                vmw.write_pop(POINTER, 1)
+                vmw.write_push(THAT, operand)
+        elif kind == "set":
+            if receiver != (POINTER, 0):
+                vmw.write_push(receiver[0], receiver[1])
+            stack.append((self.store_field, receiver, operand))
+            stack.append(arguments[0])
         else:
-            if var_name in self.func_st.map:
-                self.vmw.write_pop(self.func_st.kind_of(var_name), self.func_st.index_of(var_name))
-            elif var_name in self.class_st.map:
-                self.vmw.write_pop(self.class_st.kind_of(var_name), self.class_st.index_of(var_name))
-            else:
-                raise Exception("wow such code very bad")
-        self.current_token = self.jk.get_next_token()
-        # ;
+            # arguments still run for what they do, unless they only read a value
+            stack.append(constant_node(operand))
+            for argument in reversed(arguments):
+                if type(argument) not in INLINE_SKIPPED_ARGUMENTS:
+                    stack.append((vmw.write_pop, TEMP, 0))
+                    stack.append(argument)
+        return True
+
+    def store_field(self, receiver, operand):
+        # pops the value of an inlined setter into the field of receiver, leaving the value of a void call
+        vmw = self.vmw
+        if receiver == (POINTER, 0):
+            vmw.write_pop(THIS, operand)
+        else:
+            vmw.write_pop(TEMP, 0)
+            vmw.write_pop(POINTER, 1)
+            vmw.write_push(TEMP, 0)
+            vmw.write_pop(THAT, operand)
+        vmw.write_push(CONSTANT, 0)
+
+    def count_inlined(self, func_name):
+        self.inliner.sites[func_name] = self.inliner.sites.get(func_name, 0) + 1
+
+    def expand_unary(self, term, stack):
+        operand = term.operand
+        if type(operand) in self.EXPANDERS:
+            stack.append((self.vmw.write_unary, term.op))
+            stack.append(operand)
+        else:
+            self.TERM_HANDLERS[type(operand)](self, operand)
+            self.vmw.write_unary(term.op)
+
+    def expand_binary(self, term, stack):
+        # a leaf on the left is next in order of evaluation, so it compiles at once
+        expanders = self.EXPANDERS
+        left = term.left
+        right = term.right
+        if type(left) in expanders:
+            stack.append(term.op)
+            stack.append(right)
+            stack.append(left)
+            return
+        self.TERM_HANDLERS[type(left)](self, left)
+        if type(right) in expanders:
+            stack.append(term.op)
+            stack.append(right)
+        else:
+            self.TERM_HANDLERS[type(right)](self, right)
+            self.vmw.write_arithmetic(term.op)
+
+    # dispatch tables of plain functions, so building a generator per class stays cheap
+    STATEMENT_HANDLERS = {LetStatement: compile_let,
+                          IfStatement: compile_if,
+                          WhileStatement: compile_while,
+                          DoStatement: compile_do,
+                          ReturnStatement: compile_return}
+    TERM_HANDLERS = {IntegerConstant: compile_integer,
+                     StringConstant: compile_string,
+                     KeywordConstant: compile_keyword,
+                     VarName: compile_var_name,
+                     ArrayEntry: compile_expression,
+                     SubroutineCall: compile_expression,
+                     UnaryOp: compile_expression,
+                     BinaryOp: compile_expression}
+    EXPANDERS = {ArrayEntry: expand_array_entry,
+                 SubroutineCall: expand_subroutine_call,
+                 UnaryOp: expand_unary,
+                 BinaryOp: expand_binary}
+
+
+def string_literals(node):
+    # the distinct string literals under node, in order of first appearance
+    literals = dict()
+    for child in walk(node):
+        if type(child) is StringConstant and child.value not in literals:
+            literals[child.value] = len(literals)
+    return list(literals)
+
+
+def string_cost(literal):
+    # instructions of String.new and the appendChar calls that build literal
+    return 2 + 2 * len(literal)
+
+
+def declared_statics(class_dec):
+    return sum(len(var_dec.names) for var_dec in class_dec.class_vars if var_dec.kind == STATIC)
+
+
+def static_budget(class_decs):
+    # the static words left to pooled literals by the statics the classes declare
+    return max(0, STATIC_WORDS - sum(declared_statics(class_dec) for class_dec in class_decs))
+
+
+class StringPool:
+    # what string pooling did to the classes of a program, each pooling its own literals, or all of them
+    # when program_literals maps every class name to the string_literals it pools and the entry class
+    # builds each distinct literal once for all of them. budget is the static words the classes have
+    # left for literals, shared because every class's statics take words of the same 240. Literals past
+    # it are built where they are used
+    def __init__(self, budget, program_literals=None):
+        self.budget = budget
+        self.program_literals = program_literals
+        self.uses = 0
+        self.strings = 0
+        self.saved = 0
+        # distinct literals of a class left out of the pool for lack of static words
+        self.left = 0
+
+
+class Inliner:
+    # the trivial subroutines of a program by full name, as their trivial_body kind and operand and
+    # their number of arguments including the object, and how often each call was inlined. kinds has
+    # the kind of every subroutine by class and name, since leaving out dead subroutines can remove
+    # those whose calls are all inlined from their class, and their calls depend on it
+    def __init__(self, bodies, kinds):
+        self.bodies = bodies
+        self.kinds = kinds
+        self.sites = dict()
+
+
+class PooledCodeGenerator(CodeGenerator):
+    # builds each string literal of the class once into a static slot, so using it costs one push.
+    # The strings are shared: code that changes or disposes a literal sees the change at every use.
+    def __init__(self, vmw, pool, inliner=None, rotate_loops=False):
+        super().__init__(vmw, inliner, rotate_loops)
+        self.pool = pool
+        self.literals = list()
+        self.slots = dict()
+
+    def compile_class(self, class_dec):
+        first_slot = declared_statics(class_dec)
+        literals = string_literals(class_dec)
+        if self.pool.program_literals is not None:
+            self.literals = self.pool.program_literals[class_dec.name]
+        else:
+            self.literals = literals[:self.pool.budget]
+            self.pool.budget -= len(self.literals)
+        self.pool.left += len(literals) - len(self.literals)
+        self.slots = dict()
+        for literal in self.literals:
+            self.slots[literal] = first_slot + len(self.slots)
+        super().compile_class(class_dec)
+        if self.pool.program_literals is None:
+            self.compile_class_pool()
+        else:
+            self.compile_program_pool()
+
+    def compile_entry(self, subroutine):
+        vmw = self.vmw
+        if self.pool.program_literals is not None:
+            if self.class_name == ENTRY_CLASS and subroutine.name == ENTRY_FUNCTION \
+                    and any(self.pool.program_literals.values()):
+                vmw.write_call(ENTRY_CLASS + "." + PROGRAM_POOL_FUNCTION, 0)
+                vmw.write_pop(TEMP, 0)
+                self.pool.saved -= 2
+        elif any(literal in self.slots for literal in string_literals(subroutine)):
+            # the first slot stays null until the class's literals are built
+            label = "L" + str(self.label_index)
+            self.label_index += 1
+            vmw.write_push(STATIC, self.slots[self.literals[0]])
+            vmw.write_if(label)
+            vmw.write_call(self.class_name + "." + CLASS_POOL_FUNCTION, 0)
+            vmw.write_pop(TEMP, 0)
+            vmw.write_label(label)
+            self.pool.saved -= 5
+
+    def compile_class_pool(self):
+        if not self.literals:
+            return
+        self.vmw.write_function(self.class_name + "." + CLASS_POOL_FUNCTION, 0)
+        for literal in self.literals:
+            CodeGenerator.compile_string(self, StringConstant(literal))
+            self.vmw.write_pop(STATIC, self.slots[literal])
+            self.pool.saved -= string_cost(literal) + 1
+        self.vmw.write_push(CONSTANT, 0)
+        self.vmw.write_return()
+        self.pool.strings += len(self.literals)
+        self.pool.saved -= 3
+
+    def compile_program_pool(self):
+        vmw = self.vmw
+        if self.literals:
+            # the entry class hands this class its strings as arguments
+            vmw.write_function(self.class_name + "." + CLASS_POOL_FUNCTION, 0)
+            for i in range(len(self.literals)):
+                vmw.write_push(ARGUMENT, i)
+                vmw.write_pop(STATIC, self.slots[self.literals[i]])
+            vmw.write_push(CONSTANT, 0)
+            vmw.write_return()
+            self.pool.saved -= 3 + 2 * len(self.literals)
+        if self.class_name != ENTRY_CLASS or not any(self.pool.program_literals.values()):
+            return
+        program_literals = self.pool.program_literals
+        locals_of = dict()
+        for class_name in sorted(program_literals):
+            for literal in program_literals[class_name]:
+                if literal not in locals_of:
+                    locals_of[literal] = len(locals_of)
+        vmw.write_function(ENTRY_CLASS + "." + PROGRAM_POOL_FUNCTION, len(locals_of))
+        for literal in locals_of:
+            CodeGenerator.compile_string(self, StringConstant(literal))
+            vmw.write_pop(LOCAL, locals_of[literal])
+            self.pool.saved -= string_cost(literal) + 1
+        for class_name in sorted(program_literals):
+            literals = program_literals[class_name]
+            if not literals:
+                continue
+            for literal in literals:
+                vmw.write_push(LOCAL, locals_of[literal])
+            vmw.write_call(class_name + "." + CLASS_POOL_FUNCTION, len(literals))
+            vmw.write_pop(TEMP, 0)
+            self.pool.saved -= len(literals) + 2
+        vmw.write_push(CONSTANT, 0)
+        vmw.write_return()
+        self.pool.strings += len(locals_of)
+        self.pool.saved -= 3
+
+    def compile_string(self, term):
+        slot = self.slots.get(term.value)
+        if slot is None:
+            CodeGenerator.compile_string(self, term)
+            return
+        self.vmw.write_push(STATIC, slot)
+        self.pool.uses += 1
+        self.pool.saved += string_cost(term.value) - 1
+
+    TERM_HANDLERS = {**CodeGenerator.TERM_HANDLERS, StringConstant: compile_string}
 
-    def compile_while(self):
-        # while
-        start_label = self.label_index
-        self.vmw.write_label("L" + str(start_label))
-        self.label_index += 2
-        self.current_token = self.jk.get_next_token()
-        # (
-        self.current_token = self.jk.get_next_token()
-        self.compile_expression()
-        self.vmw.write_unary("~")
-        self.current_token = self.jk.get_next_token()
-        # )
-        self.vmw.write_if("L" + str(start_label + 1))
-        self.current_token = self.jk.get_next_token()
-        # {
-        self.current_token = self.jk.get_next_token()
+
+class CompilationEngine:
+    # parses a whole class and hands the tree, after any passes, to a code generator
+    def __init__(self, jk, vmw, passes=(), generator=CodeGenerator):
+        self.jk = jk
+        self.vmw = vmw
+        self.passes = passes
+        self.generator = generator
+        self.class_dec = None
+
+    def compile_all(self):
+        self.compile_class(self.parse())
+
+    def parse(self):
+        parser = Parser(self.jk)
+        self.class_dec = parser.parse_class()
+        parser.expect_end()
+        return self.class_dec
+
+    def compile_class(self, class_dec):
+        for optimization in self.passes:
+            class_dec = optimization(class_dec)
+        self.generator(self.vmw).compile_class(class_dec)
+
+    def compile_stream(self, subroutine_kinds):
+        # parses and generates a subroutine at a time and flushes the writer after each one, so only
+        # one subroutine's tree is ever held. A call can come before the declaration it depends on, so
+        # subroutine_kinds has those of the whole class
+        parser = Parser(self.jk)
+        generator = self.generator(self.vmw)
+        parts = parser.parse_class_stream()
+        class_dec = next(parts)
+        generator.start_class(class_dec, subroutine_kinds)
+        for subroutine in parts:
+            for optimization in self.passes:
+                subroutine = optimization(ClassDec(class_dec.name, class_dec.class_vars, [subroutine])).subroutines[0]
+            generator.compile_subroutine(subroutine)
+            self.vmw.flush()
+        parser.expect_end()
+
+
+class FusedCompiler(Parser):
+    # parses a class and emits its code in the same walk, without a tree: the code CompilationEngine
+    # gives with CodeGenerator, no passes and no loop rotation, but faster since no nodes are built.
+    # Errors are left to CompilationEngine to report. A call with no receiver pushes this unless the
+    # class declares the subroutine as a function or constructor, and the declaration can come after
+    # the call, so until then the call is taken for a method call and fixed at the end of the class
+    def __init__(self, jk, vmw):
+        super().__init__(jk)
+        self.vmw = vmw
+        self.instructions = vmw.instructions
+        self.emit = vmw.instructions.append
+        self.class_name = ""
+        self.class_st = SymbolTable()
+        self.func_st = SymbolTable(self.class_st)
+        self.subroutine_kinds = dict()
+        # [receiver position, call position, name] of each call taken for a method call
+        self.guesses = list()
+        self.kind = None
+        self.is_void = False
+        self.label_index = 1
+
+    def compile_class(self):
+        class_dec = self.parse_class_head()
+        self.class_name = class_dec.name
+        self.class_st.start()
+        for var_dec in class_dec.class_vars:
+            for var_name in var_dec.names:
+                self.class_st.define(var_name, var_dec.type, var_dec.kind)
+        while self.tokens[self.index].value in ALL_TOKENS["subroutine"]:
+            self.compile_subroutine()
+        self.expect("}")
+        self.jk.index = self.index
+        self.expect_end()
+        self.fix_guesses()
+
+    def compile_subroutine(self):
+        kind = self.next_token().value
+        return_type = self.expect_type(True)
+        name = self.expect_identifier()
+        if self.subroutine_kinds.setdefault(name, kind) != kind:
+            raise Exception("subroutine '" + name + "' declared twice")
+        self.expect("(")
+        parameters = self.parse_parameter_list()
+        self.expect(")")
+        self.expect("{")
+        local_vars = list()
+        while self.tokens[self.index].value == "var":
+            self.parse_var_dec(local_vars)
+        self.kind = kind
+        self.is_void = return_type == "void"
+        self.func_st.start()
+        if kind == METHOD:
+            self.func_st.define(THIS, self.class_name, ARGUMENT)
+        for var_type, var_name in parameters:
+            self.func_st.define(var_name, var_type, ARGUMENT)
+        for var_type, var_name in local_vars:
+            self.func_st.define(var_name, var_type, LOCAL)
+        self.emit(("function", self.class_name + "." + name, self.func_st.var_count(LOCAL)))
+        if kind == METHOD:
+            self.emit(("push", ARGUMENT, 0))
+            self.emit(("pop", POINTER, 0))
+        elif kind == CTOR:
+            self.emit(("push", CONSTANT, self.class_st.var_count(THIS)))
+            self.emit(("call", "Memory.alloc", 1))
+            self.emit(("pop", POINTER, 0))
         self.compile_statements()
-        self.vmw.write_goto("L" + str(start_label))
-        self.current_token = self.jk.get_next_token()
-        # }
-        self.vmw.write_label("L" + str(start_label + 1))
-        self.label_index += 1
+        self.expect("}")
+
+    def fix_guesses(self):
+        # drops the receiver of the calls taken for method calls that are not
+        instructions = self.instructions
+        wrong = [guess for guess in self.guesses if self.subroutine_kinds.get(guess[2], METHOD) != METHOD]
+        for receiver, call, name in wrong:
+            instructions[call] = ("call", instructions[call][1], instructions[call][2] - 1)
+        for receiver in sorted([guess[0] for guess in wrong], reverse=True):
+            del instructions[receiver]
+
+    def resolve(self, var_name):
+        symbol = self.func_st.resolve(var_name)
+        if symbol is None:
+            raise Exception("undefined variable '" + var_name + "'")
+        return symbol
 
-    def compile_return(self):
-        # 'return'
-        self.current_token = self.jk.get_next_token()
-        if self.is_ctor is True:
-            self.vmw.write_push(POINTER, 0)
-            self.current_token = self.jk.get_next_token()
-        elif self.current_token.value != ";":
+    def compile_statements(self):
+        tokens = self.tokens
+        while True:
+            value = tokens[self.index].value
+            if value == "let":
+                self.compile_let()
+            elif value == "if":
+                self.compile_if()
+            elif value == "while":
+                self.compile_while()
+            elif value == "do":
+                self.compile_do()
+            elif value == "return":
+                self.compile_return()
+            else:
+                return
+
+    def compile_let(self):
+        self.index += 1
+        symbol = self.resolve(self.expect_identifier())
+        if self.tokens[self.index].value != "[":
+            self.expect("=")
             self.compile_expression()
-            self.current_token = self.jk.get_next_token()
-        if self.is_void is True:
-            self.vmw.write_push("constant", 0)
-        self.vmw.write_return()
+            self.expect(";")
+            self.emit(("pop", symbol.segment, symbol.index))
+            return
+        self.index += 1
+        self.emit(("push", symbol.segment, symbol.index))
+        self.compile_expression()
+        self.expect("]")
+        self.vmw.write_arithmetic("+")
+        self.expect("=")
+        self.compile_expression()
+        self.expect(";")
+        self.emit(("pop", TEMP, 0))
+        self.emit(("pop", POINTER, 1))
+        self.emit(("push", TEMP, 0))
+        self.emit(("pop", THAT, 0))
 
     def compile_if(self):
-        # if
-        self.current_token = self.jk.get_next_token()
-        # (
-        self.current_token = self.jk.get_next_token()
+        self.index += 1
+        self.expect("(")
         self.compile_expression()
+        self.expect(")")
         self.vmw.write_unary("~")
         start_label = self.label_index
-        self.vmw.write_if("L" + str(start_label))
+        self.emit(("if-goto", "L" + str(start_label)))
         self.label_index += 2
-        self.current_token = self.jk.get_next_token()
-        # )
-        self.current_token = self.jk.get_next_token()
-        # {
-        self.current_token = self.jk.get_next_token()
+        self.expect("{")
         self.compile_statements()
-        self.vmw.write_goto("L" + str(start_label + 1))
-        self.vmw.write_label("L" + str(start_label))
-        self.current_token = self.jk.get_next_token()
-        # }
-        self.current_token = self.jk.get_next_token()
-        if self.current_token.value == "else":
-            # else
-            self.current_token = self.jk.get_next_token()
-            # {
-            # self.write_token()
-            self.current_token = self.jk.get_next_token()
+        self.expect("}")
+        self.emit(("goto", "L" + str(start_label + 1)))
+        self.emit(("label", "L" + str(start_label)))
+        if self.tokens[self.index].value == "else":
+            self.index += 1
+            self.expect("{")
             self.compile_statements()
-            self.current_token = self.jk.get_next_token()
-            # }
-        else:
-            self.jk.go_back()
-        self.vmw.write_label("L" + str(start_label + 1))
+            self.expect("}")
+        self.emit(("label", "L" + str(start_label + 1)))
 
-    def compile_expression(self):
-        self.compile_term()
-        if self.jk.has_more_tokens():
-            self.current_token = self.jk.get_next_token()
-            if self.current_token.value in ALL_TOKENS["op"]:
-                saved_op = self.current_token.value
-                self.current_token = self.jk.get_next_token()
-                self.compile_term()
-                self.vmw.write_arithmetic(saved_op)
-            else:
-                self.jk.go_back()
+    def compile_while(self):
+        self.index += 1
+        start_label = self.label_index
+        self.emit(("label", "L" + str(start_label)))
+        self.label_index += 2
+        self.expect("(")
+        self.compile_expression()
+        self.expect(")")
+        self.vmw.write_unary("~")
+        self.emit(("if-goto", "L" + str(start_label + 1)))
+        self.expect("{")
+        self.compile_statements()
+        self.expect("}")
+        self.emit(("goto", "L" + str(start_label)))
+        self.emit(("label", "L" + str(start_label + 1)))
+        self.label_index += 1
 
-    def compile_term(self):
-        # (expression)
-        if self.current_token.value == "(":
-            # (
-            self.current_token = self.jk.get_next_token()
+    def compile_do(self):
+        self.index += 1
+        name = self.expect_identifier()
+        following = self.tokens[self.index].value
+        if following != "(" and following != ".":
+            self.error("expected a subroutine call")
+        func_name, argc, guess = self.start_call(name)
+        if self.tokens[self.index].value != ")":
             self.compile_expression()
-            self.current_token = self.jk.get_next_token()
-            # )
-        # unaryOp term
-        elif self.current_token.value in ALL_TOKENS["unary"]:
-            # some unary op
-            save_un = self.current_token.value
-            self.current_token = self.jk.get_next_token()
-            self.compile_term()
-            self.vmw.write_unary(save_un)
-        # all the others start with int constant or string constant or identifier
-        else:
-            # int constant or string constant or identifier
-            if is_integer_constant(self.current_token.value):
-                self.vmw.write_push("constant", self.current_token.value)
-            elif is_string_constant(self.current_token.value):
-                self.vmw.write_push(CONSTANT, len(self.current_token.value) - 2)
-                self.vmw.write_call("String.new", 1)
-                for char in self.current_token.value[1:-1]:
-                    self.vmw.write_push(CONSTANT, ord(char))
-                    self.vmw.write_call("String.appendChar", 2)
-            elif is_identifier(self.current_token.value):
-                if self.current_token.value == TRUE:
-                    self.vmw.write_push("constant", 1)
-                    self.vmw.write_unary("-")
-                elif self.current_token.value == NULL or self.current_token.value == FALSE:
-                    self.vmw.write_push("constant", 0)
-                elif self.current_token.value in self.func_st.map:
-                    self.vmw.write_push(self.func_st.kind_of(self.current_token.value),
-                                        self.func_st.index_of(self.current_token.value))
-                    if self.func_st.type_of(self.current_token.value) not in REG_TYPES\
-                            and self.current_token.value != THIS and \
-                            self.func_st.type_of(self.current_token.value) not in OS_CLASSES:
-                        self.add_arg = 1
-                    if self.call_name == "":
-                        self.call_name = self.func_st.type_of(self.current_token.value)
-                elif self.current_token.value in self.class_st.map:
-                    self.vmw.write_push(self.class_st.kind_of(self.current_token.value),
-                                        self.class_st.index_of(self.current_token.value))
-                    if self.class_st.type_of(self.current_token.value) not in REG_TYPES \
-                            and self.func_st.type_of(self.current_token.value) not in OS_CLASSES:
-                        self.add_arg = 1
-                    if self.call_name == "":
-                        self.call_name = self.class_st.type_of(self.current_token.value)
-                else:
-                    self.call_name = self.current_token.value
-                    self.add_arg = 0
-
-            self.current_token = self.jk.get_next_token()
-            # var name [expression]
-            if self.current_token.value == "[":
-                # [
-                self.current_token = self.jk.get_next_token()
+            argc += 1
+            while self.tokens[self.index].value == ",":
+                self.index += 1
                 self.compile_expression()
-                self.current_token = self.jk.get_next_token()
-                # ]
-                self.vmw.write_arithmetic("+")
-                self.vmw.write_pop(POINTER, 1)
-                self.vmw.write_push(THAT, 0)
-            elif self.current_token.value == "(" or self.current_token.value == ".":
-                self.compile_subroutine_call()
-            else:
-                self.jk.go_back()
+                argc += 1
+            if self.tokens[self.index].value != ")":
+                self.unexpected(")")
+        self.index += 1
+        self.write_call(func_name, argc, guess)
+        self.expect(";")
+        self.emit(("pop", TEMP, 0))
 
-    def compile_expression_list(self):
-        if is_term(self.current_token):
-            while is_term(self.current_token):
+    def compile_return(self):
+        self.index += 1
+        if self.tokens[self.index].value != ";":
+            if self.kind == CTOR:
+                # a constructor returns this whatever its return statement says
+                self.parse_expression()
+            else:
                 self.compile_expression()
-                self.current_token = self.jk.get_next_token()
-                if self.current_token.value == ",":
-                    self.argc += 1
-                    # ','
-                    self.current_token = self.jk.get_next_token()
+        self.expect(";")
+        if self.kind == CTOR:
+            self.emit(("push", POINTER, 0))
+        if self.is_void:
+            self.emit(("push", CONSTANT, 0))
+        self.emit(("return",))
+
+    def compile_expression(self):
+        # parse_expression emitting as it reads: a term once it is read, its unary ops after it and then
+        # the op before it. The frames hold what opened them, the op and unary ops waiting on the term
+        # they become, and for a call what start_call returned, counting the arguments as they end
+        tokens = self.tokens
+        index = self.index
+        emit = self.emit
+        vmw = self.vmw
+        frames = list()
+        opened = op = unary_ops = extra = None
+        while True:
+            token = tokens[index]
+            index += 1
+            tok_type = token.type
+            if tok_type == IDENTIFIER:
+                following = tokens[index].value
+                if following == "[":
+                    index += 1
+                    symbol = self.resolve(token.value)
+                    emit(("push", symbol.segment, symbol.index))
+                    frames.append((opened, op, unary_ops, extra))
+                    opened, op, unary_ops, extra = ArrayEntry, None, None, None
+                    continue
+                if following == "(" or following == ".":
+                    self.index = index
+                    call = self.start_call(token.value)
+                    index = self.index
+                    if tokens[index].value != ")":
+                        frames.append((opened, op, unary_ops, extra))
+                        opened, op, unary_ops, extra = SubroutineCall, None, None, call
+                        continue
+                    index += 1
+                    self.write_call(call[0], call[1], call[2])
                 else:
-                    self.jk.go_back()
+                    symbol = self.func_st.resolve(token.value)
+                    if symbol is None:
+                        symbol = self.resolve(token.value)
+                    emit(("push", symbol.segment, symbol.index))
+            elif tok_type == INT_CONST:
+                emit(("push", CONSTANT, int(token.value)))
+            elif tok_type == STR_CONST:
+                vmw.write_string(token.value[1:-1])
+            else:
+                value = token.value
+                if value == TRUE:
+                    emit(("push", CONSTANT, 1))
+                    vmw.write_unary("-")
+                elif value == THIS:
+                    emit(("push", POINTER, 0))
+                elif value in KEYWORD_CONSTANTS:
+                    # false and null
+                    emit(("push", CONSTANT, 0))
+                elif value == "(":
+                    frames.append((opened, op, unary_ops, extra))
+                    opened, op, unary_ops, extra = "(", None, None, None
+                    continue
+                elif value in UNARY_OPS:
+                    if unary_ops is None:
+                        unary_ops = [value]
+                    else:
+                        unary_ops.append(value)
+                    continue
+                else:
+                    self.index = index
+                    self.error("expected a term but found '" + value + "'")
+            # a term ends here, and so may the expressions of the frames it closes
+            while True:
+                if unary_ops is not None:
+                    while unary_ops:
+                        vmw.write_unary(unary_ops.pop())
+                    unary_ops = None
+                if op is not None:
+                    vmw.write_arithmetic(op)
+                    op = None
+                value = tokens[index].value
+                if value in OPS:
+                    op = value
+                    index += 1
                     break
+                if opened is None:
+                    self.index = index
+                    return
+                if opened == "(":
+                    if value != ")":
+                        self.index = index
+                        self.unexpected(")")
+                    index += 1
+                elif opened is ArrayEntry:
+                    if value != "]":
+                        self.index = index
+                        self.unexpected("]")
+                    index += 1
+                    vmw.write_arithmetic("+")
+                    emit(("pop", POINTER, 1))
+                    emit(("push", THAT, 0))
+                else:
+                    extra[1] += 1
+                    if value == ",":
+                        index += 1
+                        break
+                    if value != ")":
+                        self.index = index
+                        self.unexpected(")")
+                    index += 1
+                    self.write_call(extra[0], extra[1], extra[2])
+                opened, op, unary_ops, extra = frames.pop()
+
+    def start_call(self, name):
+        # pushes the receiver of the call to name whose "." or "(" is next and reads up to its arguments,
+        # returns its function name, argument count so far and guess, None unless it is one
+        tokens = self.tokens
+        guess = None
+        argc = 0
+        if tokens[self.index].value == ".":
+            self.index += 1
+            subroutine_name = self.expect_identifier()
+            symbol = self.func_st.resolve(name)
+            if symbol is not None:
+                self.emit(("push", symbol.segment, symbol.index))
+                argc = 1
+                func_name = symbol.type + "." + subroutine_name
+            else:
+                func_name = name + "." + subroutine_name
         else:
-            self.argc = 0
-            self.jk.go_back()
-
-    def compile_subroutine_call(self):
-        if self.current_token.value == "(":
-            # (
-            self.current_token = self.jk.get_next_token()
-            self.compile_expression_list()
-            self.current_token = self.jk.get_next_token()
-            # )
-            self.vmw.write_call(self.class_name + "." + self.call_name, self.argc + self.add_arg)
-        elif self.current_token.value == ".":
-            # .
-            self.current_token = self.jk.get_next_token()
-            # subroutine name
-            self.call_name += "." + self.current_token.value
-            self.current_token = self.jk.get_next_token()
-            # (
-            self.current_token = self.jk.get_next_token()
-            self.compile_expression_list()
-            self.current_token = self.jk.get_next_token()
-            self.vmw.write_call(self.call_name, self.argc + self.add_arg)
-            # )
+            kind = self.subroutine_kinds.get(name)
+            if kind is None:
+                guess = [len(self.instructions), None, name]
+            if kind is None or kind == METHOD:
+                self.emit(("push", POINTER, 0))
+                argc = 1
+            func_name = self.class_name + "." + name
+        if tokens[self.index].value != "(":
+            self.unexpected("(")
+        self.index += 1
+        return [func_name, argc, guess]
+
+    def write_call(self, func_name, argc, guess):
+        if guess is not None:
+            guess[1] = len(self.instructions)
+            self.guesses.append(guess)
+        self.emit(("call", func_name, argc))
+
+
+class CompileOptions:
+    # code generation switches, part of the build cache key since they change the output
+    __slots__ = ("optimize", "strength_reduce", "string_pool", "eliminate_dead", "inline", "target", "rotate_loops")
+
+    def __init__(self, optimize=False, strength_reduce=False, string_pool=None, eliminate_dead=False, inline=None,
+                 target="vm", rotate_loops=False):
+        self.optimize = optimize
+        self.strength_reduce = strength_reduce
+        # None, "class" or "program"
+        self.string_pool = string_pool
+        self.eliminate_dead = eliminate_dead
+        # None, or the largest body in VM instructions inlined at a call
+        self.inline = inline
+        # "vm" for a .vm file per class, "vmb" for a VMBytecode .vmb file per class, "asm" for one Hack
+        # assembly program
+        self.target = target
+        self.rotate_loops = rotate_loops
+
+    def key(self):
+        key = ("O" if self.optimize else "") + ("S" if self.strength_reduce else "")
+        if self.string_pool:
+            key += "P" + self.string_pool
+        if self.eliminate_dead:
+            key += "D"
+        if self.inline is not None:
+            key += "I" + str(self.inline)
+        if self.target != "vm":
+            key += "T" + self.target
+        if self.rotate_loops:
+            key += "R"
+        return key
+
+    def whole_program(self):
+        # modes that need every class of the program at once, pooling because the literals of all the
+        # classes take static words of the same 240
+        return self.string_pool is not None or self.eliminate_dead or self.inline is not None or self.target == "asm"
+
+    def extension(self):
+        # of the file written per class
+        return EXTENSION if self.target == "vmb" else ".vm"
+
+    def passes(self):
+        return (fold_constants,) if self.optimize else ()
 
 
 def read_file(file_name):
@@ -746,36 +1837,668 @@ def read_file(file_name):
     return lines
 
 
-def main():
+class BuildCache:
+    # .vm outputs stored by a hash of the compiler version and the source, evicted least recently used first
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key_of(self, source, options_key=""):
+        return hashlib.sha256((COMPILER_VERSION + "\0" + options_key + "\0" + source).encode()).hexdigest()
+
+    def path_of(self, key):
+        return os.path.join(self.directory, key + ".vm")
+
+    def get(self, key):
+        path = self.path_of(key)
+        try:
+            with open(path, "rb") as file:
+                code = file.read()
+            # the modification time doubles as the last use time for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return code
+
+    def put(self, key, code):
+        write_atomically(self.path_of(key), code)
+
+    def evict(self):
+        entries = list()
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".vm"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        entries.sort()
+        removed = 0
+        for mtime, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed += 1
+        return removed
+
+
+def write_atomically(path, data):
+    temp_path = path + "." + str(os.getpid()) + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def write_if_changed(path, data):
+    # leaves identical outputs untouched so tools keyed on mtime do not rebuild
+    try:
+        with open(path, "rb") as file:
+            if file.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    write_atomically(path, data)
+    return True
+
+
+def run_phase(profiler, file_name, phase, func, *args):
+    # func(*args), measured as a phase of the file when profiling
+    if profiler is None:
+        return func(*args)
+    return profiler.measure(file_name, phase, func, *args)
+
+
+def parse_file(file_name, profiler=None, jack_lines=None):
+    if jack_lines is None:
+        jack_lines = run_phase(profiler, file_name, "read", read_file, file_name)
+    jk = run_phase(profiler, file_name, "tokenize", JackTokenizer, jack_lines)
+    if profiler is not None:
+        profiler.count_tokens(file_name, len(jk.tokens))
+    return run_phase(profiler, file_name, "parse", CompilationEngine(jk, None).parse)
+
+
+def compile_file(file_name, cache=None, options=None, profiler=None):
+    # returns statistics of the compilation, empty when the output came from the cache
+    if options is None:
+        options = CompileOptions()
+    code, stats = build_file(file_name, cache, options, profiler)
+    run_phase(profiler, file_name, "write", write_if_changed, os.path.splitext(file_name)[0] + options.extension(),
+              code)
+    return stats
+
+
+def compile_stream(file_name, options=None, chunk_size=STREAM_CHUNK_SIZE):
+    # compile_file for sources too large to hold: reads the file in chunks twice, once for the kinds of
+    # its subroutines, and writes the code of each subroutine as soon as it is parsed
+    if options is None:
+        options = CompileOptions()
+    if options.whole_program():
+        raise Exception("pooling strings and the whole program modes need whole classes, they cannot stream")
+    subroutine_kinds = declared_kinds(read_chunks(file_name, chunk_size))
+    writer = BytecodeWriter if options.target == "vmb" else VMWriter
+    new_file = os.path.splitext(file_name)[0] + options.extension()
+    temp_path = new_file + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temp_path, "wb" if writer.BINARY_OUTPUT else "w") as file:
+            with writer(file, optimize=options.optimize, strength_reduce=options.strength_reduce) as vmw:
+                jk = StreamingTokenizer(read_chunks(file_name, chunk_size))
+                generator = functools.partial(CodeGenerator, rotate_loops=options.rotate_loops)
+                CompilationEngine(jk, vmw, options.passes(), generator).compile_stream(subroutine_kinds)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, new_file)
+    return writer_stats(vmw)
+
+
+def build_file(file_name, cache=None, options=None, profiler=None):
+    # the code of a file and statistics of the compilation, empty when the code came from the cache
+    if options is None:
+        options = CompileOptions()
+    if options.whole_program():
+        raise Exception("pooling strings and the whole program modes compile every class together, "
+                        "see compile_program")
+    jack_lines = run_phase(profiler, file_name, "read", read_file, file_name)
+    if cache is not None:
+        key = cache.key_of("".join(jack_lines), options.key())
+        code = run_phase(profiler, file_name, "cache", cache.get, key)
+        if code is not None:
+            return code, dict()
+    result = None
+    if profiler is None:
+        # the profiler times parsing and code generation apart, which only the tree route does
+        result = fused_class(jack_lines, options)
+    if result is None:
+        class_dec = parse_file(file_name, profiler, jack_lines)
+        result = generate_class(class_dec, options, None, profiler, file_name)
+    code, stats = result
+    if cache is not None:
+        run_phase(profiler, file_name, "cache", cache.put, key, code)
+    return code, stats
+
+
+def generate_class(class_dec, options, pool=None, profiler=None, file_name=None, inliner=None, translator=None):
+    # the .vm code of a parsed class and statistics of it, pool is the StringPool when literals are pooled
+    # and inliner the Inliner of the program when trivial calls are inlined. With a HackTranslator the
+    # code is Hack assembly instead
+    generator = CodeGenerator
+    if pool is not None:
+        generator = functools.partial(PooledCodeGenerator, pool=pool)
+        uses, strings, saved, left = pool.uses, pool.strings, pool.saved, pool.left
+    if inliner is not None:
+        generator = functools.partial(generator, inliner=inliner)
+        sites = dict(inliner.sites)
+    if options.rotate_loops:
+        generator = functools.partial(generator, rotate_loops=True)
+    for optimization in options.passes():
+        class_dec = run_phase(profiler, file_name, "passes", optimization, class_dec)
+    if translator is not None:
+        writer = functools.partial(HackWriter, translator=translator)
+    elif options.target == "vmb":
+        writer = BytecodeWriter
+    else:
+        writer = VMWriter
+    with writer(io.BytesIO(), optimize=options.optimize, strength_reduce=options.strength_reduce) as vmw:
+        if profiler is not None:
+            vmw.function_sizes = dict()
+        run_phase(profiler, file_name, "codegen", CompilationEngine(None, vmw, (), generator).compile_class,
+                  class_dec)
+        # the peephole pass and rendering of the buffered instructions
+        code = run_phase(profiler, file_name, "emit", vmw.getvalue)
+    if profiler is not None:
+        profiler.count_code(file_name, vmw.function_sizes)
+    stats = writer_stats(vmw)
+    if translator is not None:
+        stats["asm_written"] = vmw.asm_written
+        stats["asm_reference"] = vmw.asm_reference
+    if pool is not None:
+        stats["string_uses"] = pool.uses - uses
+        stats["strings"] = pool.strings - strings
+        stats["string_saved"] = pool.saved - saved
+        stats["strings_left"] = pool.left - left
+    if inliner is not None:
+        stats["inlined"] = dict()
+        for func_name, count in inliner.sites.items():
+            if count != sites.get(func_name, 0):
+                stats["inlined"][func_name] = count - sites.get(func_name, 0)
+    return code, stats
+
+
+def fused_class(source, options):
+    # generate_class straight from the Jack source of a class with FusedCompiler, which builds no tree
+    # and so is faster, None when the options need the tree or the class has an error for the tree
+    # route to report
+    if options.passes() or options.rotate_loops:
+        return None
+    writer = BytecodeWriter if options.target == "vmb" else VMWriter
+    try:
+        with writer(io.BytesIO(), optimize=options.optimize, strength_reduce=options.strength_reduce) as vmw:
+            FusedCompiler(JackTokenizer(source), vmw).compile_class()
+            code = vmw.getvalue()
+    except Exception:
+        return None
+    return code, writer_stats(vmw)
+
+
+def writer_stats(vmw):
+    return {"written": vmw.written, "removed": vmw.removed, "calls_saved": vmw.calls_saved,
+            "locals_saved": vmw.locals_saved}
+
+
+def compile_program(list_of_files, options, profiler=None, output=None, bundle=False):
+    # compiles the files together as one program and writes nothing unless all of them compile,
+    # returns the same (file name, error, statistics) results as try_compile_file. The asm target
+    # writes the whole program to output, by default named after the directory of the files, and so
+    # does bundle with a bundle of the code of every class
+    classes = list()
+    errors = list()
+    for file_name in list_of_files:
+        try:
+            classes.append((file_name, parse_file(file_name, profiler)))
+        except Exception as error:
+            errors.append((file_name, str(error) or type(error).__name__, None))
+    if errors:
+        return errors
+    try:
+        class_decs, removed, pool, inliner = prepare_program([class_dec for file_name, class_dec in classes],
+                                                             options)
+    except Exception as error:
+        return [(file_name, str(error), None) for file_name in list_of_files]
+    translator = HackTranslator() if options.target == "asm" else None
+    outputs = list()
+    for (file_name, unused), class_dec, class_removed in zip(classes, class_decs, removed):
+        try:
+            code, stats = generate_class(class_dec, options, pool, profiler, file_name, inliner, translator)
+        except Exception as error:
+            errors.append((file_name, str(error) or type(error).__name__, None))
+            continue
+        stats.update(class_removed)
+        outputs.append((file_name, code, stats))
+    if errors:
+        return errors
+    if output is None:
+        output = program_output(list_of_files[0] if len(list_of_files) == 1 else os.path.dirname(list_of_files[0]),
+                                BUNDLE_EXTENSION if bundle else ".asm")
+    if translator is not None:
+        try:
+            program = link_program(list_of_files, [code for file_name, code, stats in outputs], translator)
+        except Exception as error:
+            return [(file_name, str(error), None) for file_name in list_of_files]
+        run_phase(profiler, output, "write", write_if_changed, output, program)
+        missing = translator.undefined_calls()
+        if missing:
+            # HackEmulator stands in for them, a Hack computer would not
+            print(output + ": warning: no .vm file next to the sources defines the OS functions " +
+                  ", ".join(missing) + ", the program only runs in HackEmulator", file=sys.stderr)
+        return [(file_name, None, stats) for file_name, code, stats in outputs]
+    if bundle:
+        return write_bundle(output, outputs, profiler)
+    results = list()
+    for file_name, code, stats in outputs:
+        run_phase(profiler, file_name, "write", write_if_changed, os.path.splitext(file_name)[0] + options.extension(),
+                  code)
+        results.append((file_name, None, stats))
+    return results
+
+
+def program_output(path, extension=".asm"):
+    # the file of the program at path, a .jack file or a directory named like the program
+    path = os.path.normpath(path)
+    if os.path.isdir(path):
+        return os.path.join(path, os.path.basename(os.path.abspath(path)) + extension)
+    return os.path.splitext(path)[0] + extension
+
+
+def write_bundle(output, outputs, profiler=None):
+    # writes the (file name, code, statistics) outputs as one bundle in a single write, returns the
+    # try_compile_file results
+    classes = [(os.path.splitext(os.path.basename(file_name))[0], code) for file_name, code, stats in outputs]
+    run_phase(profiler, output, "write", write_if_changed, output, pack(classes))
+    return [(file_name, None, stats) for file_name, code, stats in outputs]
+
+
+def library_files(list_of_files):
+    # the .vm files next to the sources that none of them compiles to, such as the OS classes
+    directory = os.path.dirname(list_of_files[0])
+    compiled = {os.path.splitext(os.path.basename(file_name))[0] for file_name in list_of_files}
+    libraries = list()
+    for name in sorted(os.listdir(directory or ".")):
+        if name.endswith(".vm") and name[:-3] not in compiled:
+            libraries.append(os.path.join(directory, name))
+    return libraries
+
+
+def link_program(list_of_files, codes, translator):
+    # one Hack program of the bootstrap, the translated classes, the libraries and the trampolines
+    parts = ["\n".join(translator.bootstrap()) + "\n"]
+    parts.extend(code.decode() for code in codes)
+    for file_name in library_files(list_of_files):
+        with open(file_name) as file:
+            parts.append("\n".join(translator.translate(parse_vm(file.read()))) + "\n")
+    undefined = [name for name in translator.undefined_calls() if name.split(".")[0] not in OS_CLASSES]
+    if undefined:
+        raise Exception("no class of the program defines " + ", ".join(undefined))
+    parts.append("\n".join(translator.shared_code()) + "\n")
+    program = "".join(parts)
+    check_rom(program.splitlines())
+    return program.encode()
+
+
+def compile_source(source, options=None):
+    # the .vm code of one class given as Jack source text, bytes for the vmb target, touches no files
+    if options is None:
+        options = CompileOptions()
+    if options.whole_program():
+        return compile_many({"": source}, options)[""]
+    result = fused_class(source, options)
+    if result is None:
+        result = generate_class(CompilationEngine(JackTokenizer(source), None).parse(), options)
+    return class_output(result[0], options)
+
+
+def compile_many(sources, options=None):
+    # compiles a dict of name to Jack source text, returns a dict of name to .vm code, or bytecode for
+    # the vmb target, and touches no files, errors name the source they came from
+    if options is None:
+        options = CompileOptions()
+    if options.target == "asm":
+        raise Exception("compile_many returns the code of each class, compile_program builds whole programs")
+    class_decs = dict()
+    for name, source in sources.items():
+        try:
+            class_decs[name] = CompilationEngine(JackTokenizer(source), None).parse()
+        except Exception as error:
+            raise Exception(name + ": " + str(error)) from error
+    names = list(class_decs)
+    pruned, removed, pool, inliner = prepare_program(list(class_decs.values()), options)
+    outputs = dict()
+    for name, class_dec in zip(names, pruned):
+        try:
+            outputs[name] = class_output(generate_class(class_dec, options, pool, inliner=inliner)[0], options)
+        except Exception as error:
+            raise Exception(name + ": " + str(error)) from error
+    return outputs
+
+
+def class_output(code, options):
+    return code if options.target == "vmb" else code.decode()
+
+
+def prepare_program(class_decs, options):
+    # the whole program steps before code generation, returns the classes left to generate, what dead
+    # subroutine elimination removed from each, the StringPool the classes share and the Inliner, None
+    # when unused
+    inliner = program_inliner(class_decs, options)
+    class_decs, removed = eliminate_dead_subroutines(class_decs, options, inliner)
+    pool = None
+    if options.string_pool == "program":
+        pool = program_string_pool(class_decs)
+    elif options.string_pool == "class":
+        pool = StringPool(static_budget(class_decs))
+    return class_decs, removed, pool, inliner
+
+
+def program_inliner(class_decs, options):
+    if options.inline is None:
+        return None
+    bodies = dict()
+    kinds = dict()
+    for class_dec in class_decs:
+        kinds[class_dec.name] = {subroutine.name: subroutine.kind for subroutine in class_dec.subroutines}
+        # the passes can turn a body into a constant
+        for optimization in options.passes():
+            class_dec = optimization(class_dec)
+        for subroutine in class_dec.subroutines:
+            body = trivial_body(class_dec, subroutine)
+            # a negative constant takes a neg after its push
+            if body is not None and INLINE_SIZES[body[0]] + (body[1] < 0) <= options.inline:
+                argc = len(subroutine.parameters) + (subroutine.kind == METHOD)
+                bodies[class_dec.name + "." + subroutine.name] = body + (argc,)
+    return Inliner(bodies, kinds)
+
+
+def call_graph(code):
+    # the functions called by each function of some .vm code, and how many instructions each one has
+    calls = dict()
+    sizes = dict()
+    name = None
+    for line in code.decode().splitlines():
+        if line.startswith("function "):
+            name = line.split()[1]
+            calls[name] = set()
+            sizes[name] = 0
+        elif name is not None:
+            if line.startswith("call "):
+                calls[name].add(line.split()[1])
+            sizes[name] += 1
+    return calls, sizes
+
+
+def eliminate_dead_subroutines(class_decs, options, inliner=None):
+    # leaves out the subroutines that no call chain from the entry point reaches, returns the pruned
+    # classes and what was removed from each. the calls come from the generated code, where every
+    # method call is already resolved to its class and inlined calls are gone, and constructors are
+    # reached through their calls
+    if not options.eliminate_dead:
+        return class_decs, [dict() for class_dec in class_decs]
+    if not has_entry(class_decs):
+        raise Exception("leaving out dead subroutines needs " + ENTRY_CLASS + "." + ENTRY_FUNCTION)
+    calls = dict()
+    sizes = dict()
+    graph_options = CompileOptions(options.optimize, options.strength_reduce)
+    for class_dec in class_decs:
+        graph_inliner = Inliner(inliner.bodies, inliner.kinds) if inliner is not None else None
+        class_calls, class_sizes = call_graph(generate_class(class_dec, graph_options, inliner=graph_inliner)[0])
+        calls.update(class_calls)
+        sizes.update(class_sizes)
+    reachable = set()
+    pending = [ENTRY_CLASS + "." + ENTRY_FUNCTION]
+    if "Sys.init" in calls:
+        pending.append("Sys.init")
+    while pending:
+        name = pending.pop()
+        if name not in reachable and name in calls:
+            reachable.add(name)
+            pending.extend(calls[name])
+    pruned = list()
+    removed = list()
+    for class_dec in class_decs:
+        kept = list()
+        instructions = 0
+        for subroutine in class_dec.subroutines:
+            name = class_dec.name + "." + subroutine.name
+            if name in reachable:
+                kept.append(subroutine)
+            else:
+                instructions += sizes[name]
+        pruned.append(ClassDec(class_dec.name, class_dec.class_vars, kept))
+        removed.append({"subroutines": len(class_dec.subroutines),
+                        "subroutines_removed": len(class_dec.subroutines) - len(kept),
+                        "instructions_removed": instructions})
+    return pruned, removed
+
+
+def program_string_pool(class_decs):
+    # the StringPool that every class of the program shares, with the literals of the classes in the
+    # order the entry class builds them until the static words run out
+    program_literals = dict()
+    budget = static_budget(class_decs)
+    for class_dec in sorted(class_decs, key=lambda class_dec: class_dec.name):
+        program_literals[class_dec.name] = string_literals(class_dec)[:budget]
+        budget -= len(program_literals[class_dec.name])
+    if any(program_literals.values()) and not has_entry(class_decs):
+        raise Exception("pooling strings across the program needs " + ENTRY_CLASS + "." + ENTRY_FUNCTION)
+    return StringPool(budget, program_literals)
+
+
+def has_entry(class_decs):
+    for class_dec in class_decs:
+        if class_dec.name == ENTRY_CLASS:
+            for subroutine in class_dec.subroutines:
+                if subroutine.name == ENTRY_FUNCTION and subroutine.kind == FUNCTION:
+                    return True
+    return False
+
+
+def try_compile_file(file_name, cache_dir=None, cache_size=CACHE_MAX_BYTES, options=None, profiler=None,
+                     stream=False):
+    # runs in the worker processes too, so errors come back as plain strings
+    try:
+        if stream:
+            stats = compile_stream(file_name, options)
+        else:
+            cache = BuildCache(cache_dir, cache_size) if cache_dir else None
+            stats = compile_file(file_name, cache, options, profiler)
+    except Exception as error:
+        return file_name, str(error) or type(error).__name__, None
+    return file_name, None, stats
+
+
+def try_build_file(file_name, cache_dir=None, cache_size=CACHE_MAX_BYTES, options=None, profiler=None):
+    # try_compile_file for bundles, returns the code after the results instead of writing it
+    try:
+        cache = BuildCache(cache_dir, cache_size) if cache_dir else None
+        code, stats = build_file(file_name, cache, options, profiler)
+    except Exception as error:
+        return file_name, str(error) or type(error).__name__, None, None
+    return file_name, None, stats, code
+
+
+def should_use_pool(list_of_files, jobs):
+    if jobs < 2 or len(list_of_files) < PARALLEL_MIN_FILES:
+        return False
+    total_size = 0
+    for file_name in list_of_files:
+        total_size += os.path.getsize(file_name)
+    return total_size >= PARALLEL_MIN_BYTES
+
+
+def find_jack_files(path):
     list_of_files = list()
     # check if the path is a directory and fills list_of_files with all the files names
-    st = sys.argv[JACK_FILE]
-    if os.path.isdir(st):
-        for filename in os.listdir(st):
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
             if filename.endswith(".jack"):
                 list_of_files.append(
-                    os.path.join(os.path.normpath(st), filename))
+                    os.path.join(os.path.normpath(path), filename))
+    else:
+        list_of_files.append(os.path.join(path))
+    return list_of_files
+
+
+def add_option_arguments(parser):
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="fold constant expressions, run the peephole optimizer over the VM code, "
+                             "share the slots of locals that are never live together and report what it "
+                             "saved, implies --strength-reduce")
+    parser.add_argument("--strength-reduce", action="store_true",
+                        help="multiply by small constants with additions instead of Math.multiply calls")
+    parser.add_argument("--string-pool", choices=["class", "program"],
+                        help="build each distinct string literal once per class, or once per program, in "
+                             "the static words the classes leave (compiles all files together and skips the "
+                             "build cache)")
+    parser.add_argument("--eliminate-dead", action="store_true",
+                        help="leave out the subroutines that " + ENTRY_CLASS + "." + ENTRY_FUNCTION + " can never "
+                             "call (compiles all files together and skips the build cache)")
+    parser.add_argument("--target", choices=["vm", "vmb", "asm"], default="vm",
+                        help="write a .vm file per class, a binary " + EXTENSION + " file of VM bytecode per class, "
+                             "or one Hack assembly program named after the directory with any other .vm files "
+                             "there, such as the OS, linked in (asm compiles all files together and skips the build "
+                             "cache)")
+    parser.add_argument("--inline", type=int, nargs="?", const=INLINE_MAX_INSTRUCTIONS, metavar="BUDGET",
+                        help="replace calls of getters, setters and constant subroutines with their body when "
+                             "it takes at most BUDGET VM instructions (default " + str(INLINE_MAX_INSTRUCTIONS) +
+                             "; compiles all files together and skips the build cache)")
+    parser.add_argument("--rotate-loops", action="store_true",
+                        help="test while conditions at the bottom of their loops, one if-goto per iteration "
+                             "instead of a not, an if-goto and a goto (only the loops whose conditions are "
+                             "comparisons, true, false or the ~, & and | of those)")
+
+
+def options_from(args):
+    return CompileOptions(optimize=args.optimize, strength_reduce=args.strength_reduce or args.optimize,
+                          string_pool=args.string_pool, eliminate_dead=args.eliminate_dead, inline=args.inline,
+                          target=args.target, rotate_loops=args.rotate_loops)
+
+
+def report_results(results, options):
+    # prints errors and statistics of try_compile_file results on stderr, returns how many failed
+    failed = 0
+    for file_name, error, stats in results:
+        if error is not None:
+            print(file_name + ": " + error, file=sys.stderr)
+            failed += 1
+        elif options.key():
+            if not stats:
+                print(file_name + ": unchanged, taken from the build cache", file=sys.stderr)
+                continue
+            report = list()
+            if options.optimize:
+                before = stats["written"] + stats["removed"]
+                report.append("removed " + str(stats["removed"]) + " of " + str(before) + " VM instructions")
+                saved = stats["locals_saved"]
+                if saved:
+                    report.append("saved " + str(sum(saved.values())) + " local slots (" +
+                                  ", ".join(func_name + " " + str(saved[func_name]) for func_name in sorted(saved)) +
+                                  ")")
+            if options.strength_reduce:
+                report.append("replaced " + str(stats["calls_saved"]) + " Math.multiply calls")
+            if options.eliminate_dead and stats["subroutines_removed"]:
+                report.append("left out " + str(stats["subroutines_removed"]) + " of " + str(stats["subroutines"]) +
+                              " subroutines, " + str(stats["instructions_removed"]) + " VM instructions")
+            if options.inline is not None and stats["inlined"]:
+                inlined = stats["inlined"]
+                report.append("inlined " + str(sum(inlined.values())) + " calls (" +
+                              ", ".join(func_name + " " + str(inlined[func_name]) for func_name in sorted(inlined)) +
+                              ")")
+            if options.target == "asm":
+                report.append(str(stats["asm_written"]) + " Hack instructions against " + str(stats["asm_reference"]) +
+                              " translating the .vm text")
+            if options.string_pool and stats["string_uses"]:
+                saved = stats["string_saved"]
+                report.append("pooled " + str(stats["string_uses"]) + " string literals into " +
+                              str(stats["strings"]) + " allocations, " +
+                              ("saving " + str(saved) if saved >= 0 else "costing " + str(-saved) + " more") +
+                              " instructions")
+            if options.string_pool and stats["strings_left"]:
+                report.append("left " + str(stats["strings_left"]) + " string literals out of the pool, the " +
+                              str(STATIC_WORDS) + " static words are taken")
+            if report:
+                print(file_name + ": " + ", ".join(report), file=sys.stderr)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compiles Jack classes to VM code.")
+    parser.add_argument("path", help="a .jack file or a directory of .jack files")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of files compiled in parallel, 0 uses every core")
+    parser.add_argument("--cache-dir", help="directory of the incremental build cache")
+    parser.add_argument("--cache-size", type=int, default=CACHE_MAX_BYTES // (1024 * 1024),
+                        help="size limit of the build cache in megabytes (default %(default)s)")
+    add_option_arguments(parser)
+    parser.add_argument("--bundle", nargs="?", const="", metavar="PATH",
+                        help="write the code of every class to one indexed file, PATH or one named after the "
+                             "directory with " + BUNDLE_EXTENSION + ", in a single write instead of a file per class, "
+                             "and nothing unless every file compiles")
+    parser.add_argument("--stream", action="store_true",
+                        help="read each file in chunks and write the code of each subroutine once it is parsed, "
+                             "for sources too large to hold in memory (not with --bundle, --cache-dir, --profile, "
+                             "--string-pool or the modes that compile all files together)")
+    parser.add_argument("--profile", metavar="REPORT",
+                        help="measure each phase of each file, write the measurements as JSON to REPORT and "
+                             "summarize them on stderr (compiles in this process, without workers, run Python "
+                             "with -X tracemalloc to also measure the peak memory of each phase)")
+    args = parser.parse_args(argv)
+    list_of_files = find_jack_files(args.path)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    options = options_from(args)
+    bundle = None
+    if args.bundle is not None:
+        if options.target == "asm":
+            parser.error("--bundle puts the code of each class together, the asm target is one program already")
+        bundle = args.bundle or program_output(args.path, BUNDLE_EXTENSION)
+    if args.stream and (bundle is not None or args.cache_dir or args.profile or options.whole_program()):
+        parser.error("--stream writes each file as it compiles, so it takes none of --bundle, --cache-dir, "
+                     "--profile, --string-pool and the modes that compile all files together")
+    profiler = Profiler() if args.profile else None
+    if bundle is not None:
+        compile_one = functools.partial(try_build_file, cache_dir=args.cache_dir,
+                                        cache_size=args.cache_size * 1024 * 1024, options=options, profiler=profiler)
     else:
-        list_of_files.append(os.path.join(st))
+        compile_one = functools.partial(try_compile_file, cache_dir=args.cache_dir,
+                                        cache_size=args.cache_size * 1024 * 1024, options=options, profiler=profiler,
+                                        stream=args.stream)
 
-    for file_name in list_of_files:
-        jack_lines = read_file(file_name)
-        tokenizer = JackTokenizer(jack_lines)
-        pre, ext = os.path.splitext(file_name)
-        new_file = pre + ".vm"
-        vmw = VMWriter(new_file)
-        compiler = CompilationEngine(tokenizer, vmw)
-        compiler.compile_all()
-
-    # for file_name in list_of_files:
-    #     jack_lines = read_file(file_name)
-    #     tokenizer = JackTokenizer(jack_lines)
-    #     pre, ext = os.path.splitext(file_name)
-    #     new_file = pre + ".xml"
-    #     with open(new_file, "w") as this_file:
-    #         compiler = CompilationEngine(tokenizer, this_file)
-    #         compiler.compile_all()
+    if options.whole_program():
+        results = compile_program(list_of_files, options, profiler, bundle or program_output(args.path),
+                                  bundle is not None)
+    else:
+        if profiler is None and should_use_pool(list_of_files, jobs):
+            with concurrent.futures.ProcessPoolExecutor(min(jobs, len(list_of_files))) as pool:
+                results = list(pool.map(compile_one, list_of_files))
+        else:
+            results = [compile_one(file_name) for file_name in list_of_files]
+        if bundle is not None:
+            outputs = [(file_name, code, stats) for file_name, error, stats, code in results]
+            results = [(file_name, error, stats) for file_name, error, stats, code in results]
+            if all(error is None for file_name, error, stats in results):
+                results = write_bundle(bundle, outputs, profiler)
+    if args.cache_dir:
+        BuildCache(args.cache_dir, args.cache_size * 1024 * 1024).evict()
+    if profiler is not None:
+        print(format_summary(profiler.write_report(args.profile)), file=sys.stderr)
+
+    failed = report_results(results, options)
+    if failed:
+        print(str(failed) + " of " + str(len(results)) + " files failed to compile", file=sys.stderr)
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,173 @@
+# Keeps the compiler loaded between builds: watches a project directory and recompiles the .jack files
+# that change, and serves compile requests over a Unix socket.
+# Run as: python JackDaemon.py [--watch DIR] [--socket PATH] [-O ...]
+import argparse
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+
+from JackCompiler import CompileOptions, add_option_arguments, compile_many, compile_program, options_from, \
+    program_output, report_results, try_compile_file
+
+DEFAULT_INTERVAL = 0.05
+
+
+class Watcher:
+    # polls a directory for .jack files whose size or modification time changed since the last poll
+    def __init__(self, directory, options=None, lock=None):
+        self.directory = directory
+        self.options = options if options is not None else CompileOptions()
+        self.lock = lock if lock is not None else threading.Lock()
+        self.seen = dict()
+
+    def scan(self):
+        found = dict()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".jack") and entry.is_file():
+                info = entry.stat()
+                found[entry.path] = (info.st_mtime_ns, info.st_size)
+        return found
+
+    def poll(self):
+        # compiles what changed, returns the try_compile_file results, empty when nothing did. Only the
+        # files that compiled are seen, the others are tried again on the next poll
+        found = self.scan()
+        changed = sorted(path for path, signature in found.items() if self.seen.get(path) != signature)
+        removed = [path for path in self.seen if path not in found]
+        for path in removed:
+            del self.seen[path]
+        with self.lock:
+            if self.options.whole_program():
+                if not changed and not removed:
+                    return list()
+                # the pool spans every class, so any change or removed class rebuilds all of them
+                results = compile_program(sorted(found), self.options, output=program_output(self.directory))
+            else:
+                results = [try_compile_file(path, options=self.options) for path in changed]
+        for file_name, error, stats in results:
+            if error is None:
+                self.seen[file_name] = found[file_name]
+        return results
+
+    def run(self, interval=DEFAULT_INTERVAL):
+        # a file that keeps failing is reported again only when its error changes
+        reported = dict()
+        while True:
+            results = [result for result in self.poll() if result[1] is None or reported.get(result[0]) != result[1]]
+            reported.update((file_name, error) for file_name, error, stats in results)
+            if results:
+                report_results(results, self.options)
+                print("compiled " + str(len(results)) + " files", file=sys.stderr)
+            time.sleep(interval)
+
+
+class CompileHandler(socketserver.StreamRequestHandler):
+    # one JSON request per line, {"sources": {name: text}} compiles in memory and answers
+    # {"outputs": {name: vm}}, {"files": [path, ...]} writes .vm files and answers {"results": [...]},
+    # a failure answers {"error": message}
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                with self.server.lock:
+                    response = self.server.serve(request)
+            except Exception as error:
+                response = {"error": str(error) or type(error).__name__}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, options=None, lock=None):
+        # a socket left by an earlier daemon is replaced, anything else at path is not
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise Exception(path + " is not a socket, not replacing it")
+            os.remove(path)
+        super().__init__(path, CompileHandler)
+        self.options = options if options is not None else CompileOptions()
+        self.lock = lock if lock is not None else threading.Lock()
+
+    def serve(self, request):
+        if "sources" in request:
+            if self.options.target != "vm":
+                raise Exception("sources compile to .vm text, the daemon runs with --target " + self.options.target)
+            return {"outputs": compile_many(request["sources"], self.options)}
+        if "files" in request:
+            if self.options.whole_program():
+                results = compile_program(request["files"], self.options)
+            else:
+                results = [try_compile_file(path, options=self.options) for path in request["files"]]
+            return {"results": [{"file": file_name, "error": error} for file_name, error, stats in results]}
+        raise Exception("a request needs sources or files")
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def send_request(path, request):
+    # a client for CompileServer, returns the decoded response
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode() + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as stream:
+            return json.loads(stream.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keeps the Jack compiler running to recompile changed files "
+                                                 "and to serve compile requests.")
+    parser.add_argument("--watch", metavar="DIR", help="recompile the .jack files of DIR when they change")
+    parser.add_argument("--socket", metavar="PATH", help="serve compile requests on a Unix socket at PATH")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help="seconds between polls of the watched directory (default %(default)s)")
+    add_option_arguments(parser)
+    args = parser.parse_args(argv)
+    if not args.watch and not args.socket:
+        parser.error("nothing to do, give --watch, --socket or both")
+    options = options_from(args)
+    lock = threading.Lock()
+    server = None
+    if args.socket:
+        try:
+            server = CompileServer(args.socket, options, lock)
+        except Exception as error:
+            print(str(error), file=sys.stderr)
+            return 1
+        if not args.watch:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        Watcher(args.watch, options, lock).run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
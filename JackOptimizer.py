@@ -0,0 +1,281 @@
+# Optimization passes over JackAST trees, run by JackCompiler.CompilationEngine before code generation.
+# Like every pass they build new nodes and leave the tree they were given as it was.
+
+from JackAST import ArrayEntry, BinaryOp, ClassDec, DoStatement, IfStatement, IntegerConstant, KeywordConstant, \
+    LetStatement, ReturnStatement, StringConstant, SubroutineCall, SubroutineDec, UnaryOp, VarName, \
+    WhileStatement, walk
+
+MAX_CONSTANT = 32767
+MIN_WORD = -32768
+KEYWORD_VALUES = {"true": -1, "false": 0, "null": 0}
+COMPARISONS = ("<", ">", "=")
+LOGICAL_OPS = ("&", "|")
+
+
+def to_word(value):
+    # wraps a Python int to a signed 16 bit word, like the Hack ALU does
+    return ((value + 32768) & 0xFFFF) - 32768
+
+
+def constant_value(node):
+    # the value of a folded constant expression, None for anything else
+    node_type = type(node)
+    if node_type is IntegerConstant:
+        return node.value
+    if node_type is KeywordConstant:
+        return KEYWORD_VALUES.get(node.value)
+    if node_type is UnaryOp and type(node.operand) is IntegerConstant:
+        if node.op == "-":
+            return to_word(-node.operand.value)
+        return ~node.operand.value
+    return None
+
+
+def constant_node(value):
+    # the shortest expression for a word, integer constants in Jack are never negative
+    if value >= 0:
+        return IntegerConstant(value)
+    if value > MIN_WORD:
+        return UnaryOp("-", IntegerConstant(-value))
+    return UnaryOp("~", IntegerConstant(MAX_CONSTANT))
+
+
+def has_call(node):
+    for child in walk(node):
+        if type(child) is SubroutineCall:
+            return True
+    return False
+
+
+def is_boolean(node):
+    # whether an expression is always -1 or 0: comparisons, true, false and the ~, & and | of expressions
+    # that are. Any other value is neither true nor false to if and while
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is BinaryOp and node.op in COMPARISONS:
+            continue
+        if node_type is BinaryOp and node.op in LOGICAL_OPS:
+            stack.append(node.left)
+            stack.append(node.right)
+        elif node_type is UnaryOp and node.op == "~":
+            stack.append(node.operand)
+        elif constant_value(node) not in (0, -1):
+            return False
+    return True
+
+
+def evaluate(op, left, right):
+    if op == "+":
+        return to_word(left + right)
+    if op == "-":
+        return to_word(left - right)
+    if op == "*":
+        return to_word(left * right)
+    if op == "/":
+        # Math.divide truncates towards zero, division by zero is left to fail at run time
+        if right == 0:
+            return None
+        quotient = abs(left) // abs(right)
+        return to_word(quotient if (left < 0) == (right < 0) else -quotient)
+    if op == "&":
+        return left & right
+    if op == "|":
+        return left | right
+    if op == "=":
+        return -1 if left == right else 0
+    if op == "<":
+        return -1 if left < right else 0
+    return -1 if left > right else 0
+
+
+class ConstantFolder:
+    # evaluates constant expressions at compile time and drops operations that cannot change a value
+    def fold_class(self, class_dec):
+        subroutines = list()
+        for subroutine in class_dec.subroutines:
+            subroutines.append(SubroutineDec(subroutine.kind, subroutine.return_type, subroutine.name,
+                                             subroutine.parameters, subroutine.locals,
+                                             self.fold_statements(subroutine.statements)))
+        return ClassDec(class_dec.name, class_dec.class_vars, subroutines)
+
+    def fold_statements(self, statements):
+        return [self.STATEMENT_HANDLERS[type(statement)](self, statement) for statement in statements]
+
+    def fold_let(self, statement):
+        index = statement.index
+        if index is not None:
+            index = self.fold(index)
+        return LetStatement(statement.name, index, self.fold(statement.value))
+
+    def fold_if(self, statement):
+        else_statements = statement.else_statements
+        if else_statements is not None:
+            else_statements = self.fold_statements(else_statements)
+        return IfStatement(self.fold(statement.condition), self.fold_statements(statement.statements),
+                           else_statements)
+
+    def fold_while(self, statement):
+        return WhileStatement(self.fold(statement.condition), self.fold_statements(statement.statements))
+
+    def fold_do(self, statement):
+        return DoStatement(self.fold(statement.call))
+
+    def fold_return(self, statement):
+        if statement.value is None:
+            return statement
+        return ReturnStatement(self.fold(statement.value))
+
+    def fold(self, expression):
+        # in post-order with a stack of its own instead of recursion, so no nesting depth is too deep.
+        # a node is pushed again as a (node, number of children) pair under its children, and is
+        # folded from their folded forms once they are all on the results stack
+        handlers = self.EXPRESSION_HANDLERS
+        stack = [expression]
+        results = list()
+        while stack:
+            node = stack.pop()
+            if type(node) is tuple:
+                node, count = node
+                if count:
+                    children = results[-count:]
+                    del results[-count:]
+                else:
+                    children = ()
+                results.append(handlers[type(node)](self, node, children))
+                continue
+            children = node.children()
+            stack.append((node, len(children)))
+            children.reverse()
+            stack.extend(children)
+        return results[0]
+
+    def fold_leaf(self, term, children):
+        return term
+
+    def fold_array_entry(self, term, children):
+        return ArrayEntry(term.name, children[0])
+
+    def fold_call(self, term, children):
+        return SubroutineCall(term.receiver, term.name, list(children))
+
+    def fold_unary(self, term, children):
+        operand = children[0]
+        value = constant_value(operand)
+        if value is not None:
+            return constant_node(to_word(-value) if term.op == "-" else ~value)
+        if type(operand) is UnaryOp and operand.op == term.op:
+            # -(-x) and ~(~x)
+            return operand.operand
+        return UnaryOp(term.op, operand)
+
+    def fold_binary(self, term, children):
+        left, right = children
+        op = term.op
+        left_value = constant_value(left)
+        right_value = constant_value(right)
+        if left_value is not None and right_value is not None:
+            value = evaluate(op, left_value, right_value)
+            if value is not None:
+                return constant_node(value)
+        simplified = self.simplify(op, left, right, left_value, right_value)
+        if simplified is not None:
+            return simplified
+        return BinaryOp(op, left, right)
+
+    def simplify(self, op, left, right, left_value, right_value):
+        # identities with one constant side, an operand is only dropped when it makes no call
+        if op == "+":
+            if right_value == 0:
+                return left
+            if left_value == 0:
+                return right
+        elif op == "-":
+            if right_value == 0:
+                return left
+            if left_value == 0:
+                return UnaryOp("-", right)
+        elif op == "*":
+            if right_value == 1:
+                return left
+            if left_value == 1:
+                return right
+            if right_value == -1:
+                return UnaryOp("-", left)
+            if left_value == -1:
+                return UnaryOp("-", right)
+            if right_value == 0 and not has_call(left) or left_value == 0 and not has_call(right):
+                return IntegerConstant(0)
+        elif op == "/":
+            if right_value == 1:
+                return left
+            if right_value == -1:
+                return UnaryOp("-", left)
+        elif op == "&":
+            if right_value == -1:
+                return left
+            if left_value == -1:
+                return right
+        elif op == "|":
+            if right_value == 0:
+                return left
+            if left_value == 0:
+                return right
+        return None
+
+    STATEMENT_HANDLERS = {LetStatement: fold_let,
+                          IfStatement: fold_if,
+                          WhileStatement: fold_while,
+                          DoStatement: fold_do,
+                          ReturnStatement: fold_return}
+    EXPRESSION_HANDLERS = {IntegerConstant: fold_leaf,
+                           StringConstant: fold_leaf,
+                           KeywordConstant: fold_leaf,
+                           VarName: fold_leaf,
+                           ArrayEntry: fold_array_entry,
+                           SubroutineCall: fold_call,
+                           UnaryOp: fold_unary,
+                           BinaryOp: fold_binary}
+
+
+def fold_constants(class_dec):
+    return ConstantFolder().fold_class(class_dec)
+
+
+def trivial_body(class_dec, subroutine):
+    # what a subroutine does when it is simple enough to inline at its calls: ("field", i) for a method
+    # that returns field i, ("set", i) for a void method that stores its one parameter in field i,
+    # ("constant", value) for one that only returns a constant, None for anything else
+    if subroutine.kind == "constructor":
+        return None
+    statements = subroutine.statements
+    if len(statements) == 1 and type(statements[0]) is ReturnStatement:
+        value = statements[0].value
+        if value is None:
+            return "constant", 0
+        constant = constant_value(value)
+        if constant is not None:
+            return "constant", constant
+    if subroutine.kind != "method":
+        return None
+    fields = dict()
+    for var_dec in class_dec.class_vars:
+        if var_dec.kind == "field":
+            for name in var_dec.names:
+                fields[name] = len(fields)
+    hidden = {name for var_type, name in subroutine.parameters + subroutine.locals}
+    if len(statements) == 1 and type(statements[0]) is ReturnStatement and not subroutine.parameters:
+        value = statements[0].value
+        if type(value) is VarName and value.name in fields and value.name not in hidden:
+            return "field", fields[value.name]
+    if len(statements) == 2 and len(subroutine.parameters) == 1 and subroutine.return_type == "void" \
+            and type(statements[0]) is LetStatement and type(statements[1]) is ReturnStatement \
+            and statements[1].value is None:
+        let = statements[0]
+        parameter = subroutine.parameters[0][1]
+        if let.index is None and type(let.value) is VarName and let.value.name == parameter \
+                and let.name in fields and let.name not in hidden:
+            return "set", fields[let.name]
+    return None
+
@@ -0,0 +1,110 @@
+# Per file and per phase measurements of a compilation, handed to JackCompiler.compile_file and friends
+# as their profiler argument. Without one the compiler skips every measurement.
+import json
+import sys
+import time
+import tracemalloc
+
+SLOWEST_FILES = 10
+
+
+class Profiler:
+    # hooks are called as hook(file_name, phase, seconds, live_blocks, peak_bytes) after each measured
+    # phase. live_blocks is the net change in the memory blocks Python has allocated, what the phase kept
+    # alive and not how much it allocated. peak_bytes is the most memory the phase had allocated at once
+    # on top of what there was before it, which only tracemalloc knows, so it is None unless Python
+    # traces memory (python -X tracemalloc), as tracing slows every allocation down
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.files = dict()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def file(self, file_name):
+        record = self.files.get(file_name)
+        if record is None:
+            record = {"phases": dict(), "tokens": 0, "instructions": 0, "subroutines": dict()}
+            self.files[file_name] = record
+        return record
+
+    def measure(self, file_name, phase, func, *args):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        live_blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        live_blocks = sys.getallocatedblocks() - live_blocks
+        peak_bytes = tracemalloc.get_traced_memory()[1] - traced if tracing else None
+        phases = self.file(file_name)["phases"]
+        entry = phases.get(phase)
+        if entry is None:
+            phases[phase] = {"seconds": seconds, "live_blocks": live_blocks, "peak_bytes": peak_bytes, "calls": 1}
+        else:
+            # passes run once each, their times and what they kept alive add up, their peaks do not
+            entry["seconds"] += seconds
+            entry["live_blocks"] += live_blocks
+            entry["peak_bytes"] = highest(entry["peak_bytes"], peak_bytes)
+            entry["calls"] += 1
+        for hook in self.hooks:
+            hook(file_name, phase, seconds, live_blocks, peak_bytes)
+        return result
+
+    def count_tokens(self, file_name, tokens):
+        self.file(file_name)["tokens"] += tokens
+
+    def count_code(self, file_name, sizes):
+        # the VM instructions of each subroutine after its function header, as the writer counted them
+        # before rendering, so they are the same for .vm text, bytecode and assembly
+        record = self.file(file_name)
+        record["subroutines"].update(sizes)
+        record["instructions"] += len(sizes) + sum(sizes.values())
+
+    def report(self, slowest=SLOWEST_FILES):
+        files = dict()
+        phases = dict()
+        for file_name, record in self.files.items():
+            seconds = 0
+            for phase, entry in record["phases"].items():
+                seconds += entry["seconds"]
+                total = phases.setdefault(phase, {"seconds": 0, "live_blocks": 0, "peak_bytes": None, "calls": 0})
+                total["seconds"] += entry["seconds"]
+                total["live_blocks"] += entry["live_blocks"]
+                total["peak_bytes"] = highest(total["peak_bytes"], entry["peak_bytes"])
+                total["calls"] += entry["calls"]
+            files[file_name] = dict(record, seconds=seconds)
+        ranked = sorted(files, key=lambda file_name: files[file_name]["seconds"], reverse=True)
+        return {"seconds": sum(record["seconds"] for record in files.values()),
+                "tokens": sum(record["tokens"] for record in files.values()),
+                "instructions": sum(record["instructions"] for record in files.values()),
+                "phases": phases,
+                "slowest": [{"file": file_name, "seconds": files[file_name]["seconds"]}
+                            for file_name in ranked[:slowest]],
+                "files": files}
+
+    def write_report(self, path, slowest=SLOWEST_FILES):
+        report = self.report(slowest)
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+        return report
+
+
+def highest(peak, other):
+    # the larger of two peaks, either of which is None when memory was not traced
+    if peak is None or other is None:
+        return other if peak is None else peak
+    return max(peak, other)
+
+
+def format_summary(report):
+    lines = ["%-10s %10s %12s %10s" % ("phase", "ms", "live blocks", "peak KB")]
+    for phase, entry in report["phases"].items():
+        peak = "-" if entry["peak_bytes"] is None else "%.1f" % (entry["peak_bytes"] / 1024)
+        lines.append("%-10s %10.2f %12d %10s" % (phase, 1000 * entry["seconds"], entry["live_blocks"], peak))
+    lines.append("slowest files:")
+    for entry in report["slowest"]:
+        lines.append("%10.2f ms %s" % (1000 * entry["seconds"], entry["file"]))
+    return "\n".join(lines)
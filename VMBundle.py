@@ -0,0 +1,112 @@
+# The code of many classes in one file written in one go: an index of "// class <name> <offset> <length>"
+# lines, offsets counted in bytes from the end of the index, then the code of every class back to back.
+# The index reads as comments in .vm text, one class is read by seeking past the others, and the code is
+# .vm text or VMBytecode.
+# Run as: python VMBundle.py <bundle> [--extract CLASS ...] [--unpack DIR]
+import argparse
+import os
+import sys
+
+from VMBytecode import EXTENSION, is_bytecode
+
+HEADER = b"// bundle 1\n"
+END = b"// end\n"
+BUNDLE_EXTENSION = ".vmbundle"
+
+
+class BundleError(Exception):
+    pass
+
+
+def pack(classes):
+    # the bundle of (class name, code) pairs, code being bytes
+    index = [HEADER]
+    offset = 0
+    for name, code in classes:
+        if not name or any(character.isspace() for character in name):
+            raise BundleError("cannot bundle a class named " + repr(name))
+        index.append(("// class " + name + " " + str(offset) + " " + str(len(code)) + "\n").encode())
+        offset += len(code)
+    index.append(END)
+    return b"".join(index) + b"".join(code for name, code in classes)
+
+
+def is_bundle(data):
+    return data[:len(HEADER)] == HEADER
+
+
+def read_index(stream):
+    # the position and length of each class from a binary stream at the start of a bundle, reading
+    # no further than the index
+    if stream.readline() != HEADER:
+        raise BundleError("not a bundle")
+    entries = dict()
+    while True:
+        line = stream.readline()
+        if line == END:
+            break
+        parts = line.split()
+        if len(parts) != 5 or parts[:2] != [b"//", b"class"] or not parts[3].isdigit() or not parts[4].isdigit():
+            raise BundleError("bad bundle index line " + repr(line.decode(errors="replace")))
+        entries[parts[2].decode()] = (int(parts[3]), int(parts[4]))
+    start = stream.tell()
+    return {name: (start + offset, length) for name, (offset, length) in entries.items()}
+
+
+def extract(path, name):
+    # the code of one class of the bundle at path
+    with open(path, "rb") as stream:
+        index = read_index(stream)
+        if name not in index:
+            raise BundleError("no class " + name + " in " + path)
+        position, length = index[name]
+        stream.seek(position)
+        code = stream.read(length)
+    if len(code) != length:
+        raise BundleError(path + " is truncated")
+    return code
+
+
+def unpack(path):
+    # the code of every class of the bundle at path by class name, in bundle order
+    with open(path, "rb") as stream:
+        index = read_index(stream)
+        start = stream.tell()
+        data = stream.read()
+    classes = dict()
+    for name, (position, length) in index.items():
+        code = data[position - start:position - start + length]
+        if len(code) != length:
+            raise BundleError(path + " is truncated")
+        classes[name] = code
+    return classes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lists the classes of a bundle or extracts some of them.")
+    parser.add_argument("path", help="a bundle written by JackCompiler.py --bundle")
+    parser.add_argument("--extract", nargs="+", metavar="CLASS", help="print the code of these classes")
+    parser.add_argument("--unpack", metavar="DIR", help="write every class to a file of its own in DIR")
+    args = parser.parse_args(argv)
+    try:
+        if args.extract:
+            for name in args.extract:
+                sys.stdout.buffer.write(extract(args.path, name))
+        elif args.unpack:
+            os.makedirs(args.unpack, exist_ok=True)
+            for name, code in unpack(args.path).items():
+                extension = EXTENSION if is_bytecode(code) else ".vm"
+                with open(os.path.join(args.unpack, name + extension), "wb") as file:
+                    file.write(code)
+        else:
+            with open(args.path, "rb") as stream:
+                for name, (position, length) in read_index(stream).items():
+                    print("%-24s %10d %10d" % (name, position, length))
+    except (OSError, BundleError) as error:
+        print("error: " + str(error), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# A binary form of VM code: one byte per command, push and pop followed by a segment code byte, counts
+# and indexes as varints and function and label names as indexes into a string table. A name enters
+# the table where it is first used, so a writer can flush its code in batches that concatenate.
+# Run as: python VMBytecode.py <.vm or .vmb file or directory> ... [--to-text]
+import argparse
+import os
+import sys
+
+from VMInterpreter import VMError, parse_vm, render_vm
+
+MAGIC = b"JVMB"
+VERSION = 1
+EXTENSION = ".vmb"
+COMMANDS = ("push", "pop", "add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not", "label", "goto", "if-goto",
+            "function", "call", "return")
+OPCODES = {command: code for code, command in enumerate(COMMANDS)}
+PUSH, POP = OPCODES["push"], OPCODES["pop"]
+# the next string table entry, its length in bytes then its UTF-8 bytes
+NAME = len(COMMANDS)
+SEGMENTS = ("constant", "argument", "local", "static", "this", "that", "pointer", "temp")
+SEGMENT_CODES = {segment: code for code, segment in enumerate(SEGMENTS)}
+NAMED = frozenset(OPCODES[command] for command in ("label", "goto", "if-goto"))
+COUNTED = frozenset(OPCODES[command] for command in ("function", "call"))
+BARE = frozenset(range(len(COMMANDS))) - NAMED - COUNTED - {PUSH, POP}
+
+
+def write_varint(out, value):
+    if value < 0:
+        raise VMError("cannot encode the negative operand " + str(value))
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, position):
+    # returns the value and the position after it
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class BytecodeEncoder:
+    # the header comes out with the first batch and the string table grows across batches, so one
+    # encoder writes one file
+    def __init__(self):
+        self.names = dict()
+        self.started = False
+
+    def encode(self, instructions):
+        out = bytearray()
+        if not self.started:
+            out += MAGIC
+            out.append(VERSION)
+            self.started = True
+        for instruction in instructions:
+            code = OPCODES.get(instruction[0])
+            if code is None:
+                raise VMError("unknown VM command " + instruction[0])
+            if code == PUSH or code == POP:
+                segment = SEGMENT_CODES.get(instruction[1])
+                if segment is None:
+                    raise VMError("unknown segment " + instruction[1])
+                out.append(code)
+                out.append(segment)
+                write_varint(out, instruction[2])
+            elif code in NAMED or code in COUNTED:
+                index = self.name_index(out, instruction[1])
+                out.append(code)
+                write_varint(out, index)
+                if code in COUNTED:
+                    write_varint(out, instruction[2])
+            else:
+                out.append(code)
+        return bytes(out)
+
+    def name_index(self, out, name):
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.names)
+            data = name.encode()
+            out.append(NAME)
+            write_varint(out, len(data))
+            out += data
+        return index
+
+
+def encode(instructions):
+    return BytecodeEncoder().encode(instructions)
+
+
+def is_bytecode(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def decode(data):
+    # the instruction tuples of bytecode, as parse_vm gives them for .vm text
+    if not is_bytecode(data):
+        raise VMError("not VM bytecode")
+    if len(data) <= len(MAGIC) or data[len(MAGIC)] != VERSION:
+        raise VMError("unsupported VM bytecode version")
+    # commands without operands are the same tuple every time, and so are pushes and pops of the
+    # indexes below 128 that take a single byte, most of them
+    bare = [(command,) for command in COMMANDS]
+    small = [[[(command, segment, index) for index in range(0x80)] for segment in SEGMENTS]
+             for command in COMMANDS[:POP + 1]]
+    names = list()
+    instructions = list()
+    append = instructions.append
+    position = len(MAGIC) + 1
+    end = len(data)
+    try:
+        while position < end:
+            code = data[position]
+            if code <= POP:
+                index = data[position + 2]
+                if index < 0x80:
+                    append(small[code][data[position + 1]][index])
+                    position += 3
+                else:
+                    segment = SEGMENTS[data[position + 1]]
+                    index, position = read_varint(data, position + 2)
+                    append((COMMANDS[code], segment, index))
+            elif code in BARE:
+                append(bare[code])
+                position += 1
+            elif code == NAME:
+                length, position = read_varint(data, position + 1)
+                if position + length > end:
+                    raise IndexError
+                names.append(data[position:position + length].decode())
+                position += length
+            else:
+                index = data[position + 1]
+                if index < 0x80:
+                    position += 2
+                else:
+                    index, position = read_varint(data, position + 1)
+                if code in COUNTED:
+                    count = data[position]
+                    if count < 0x80:
+                        position += 1
+                    else:
+                        count, position = read_varint(data, position)
+                    append((COMMANDS[code], names[index], count))
+                else:
+                    append((COMMANDS[code], names[index]))
+    except IndexError:
+        raise VMError("truncated or corrupt VM bytecode at byte " + str(position))
+    return instructions
+
+
+def to_bytecode(text):
+    return encode(parse_vm(text))
+
+
+def to_text(data):
+    return render_vm(decode(data))
+
+
+def read_bytecode(path):
+    with open(path, "rb") as file:
+        return decode(file.read())
+
+
+def convert(path):
+    # writes the .vmb file of a .vm file or the .vm file of a .vmb file next to it, returns its path
+    pre, ext = os.path.splitext(path)
+    if ext == EXTENSION:
+        with open(path, "rb") as file:
+            output = to_text(file.read()).encode()
+        new_file = pre + ".vm"
+    else:
+        with open(path) as file:
+            output = to_bytecode(file.read())
+        new_file = pre + EXTENSION
+    with open(new_file, "wb") as file:
+        file.write(output)
+    return new_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Converts .vm files to VM bytecode and back.")
+    parser.add_argument("paths", nargs="+", help=".vm files to encode, .vmb files to decode or directories")
+    parser.add_argument("--to-text", action="store_true", help="decode the .vmb files of the directories instead "
+                                                               "of encoding their .vm files")
+    args = parser.parse_args(argv)
+    extension = EXTENSION if args.to_text else ".vm"
+    file_names = list()
+    for path in args.paths:
+        if os.path.isdir(path):
+            file_names.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(extension))
+        else:
+            file_names.append(path)
+    failed = 0
+    for file_name in file_names:
+        try:
+            new_file = convert(file_name)
+        except (OSError, VMError) as error:
+            print(file_name + ": " + str(error), file=sys.stderr)
+            failed += 1
+            continue
+        print(file_name + ": " + str(os.path.getsize(file_name)) + " bytes, " + new_file + ": " +
+              str(os.path.getsize(new_file)) + " bytes", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,659 @@
+# Runs the compiler's VM output in process, with the Jack OS classes stood in for by Python, and
+# counts what the program executed so changes to the generated code can be measured.
+# Run as: python VMInterpreter.py <.vm file or directory> [--json report.json]
+import argparse
+import bisect
+import json
+import os
+import sys
+
+RAM_SIZE = 32768
+SP = 0
+LCL = 1
+ARG = 2
+THIS = 3
+THAT = 4
+TEMP_BASE = 5
+STATIC_BASE = 16
+STATIC_END = 256
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+SCREEN_BASE = 16384
+SCREEN_WIDTH = 512
+SCREEN_HEIGHT = 256
+KEYBOARD = 24576
+TRUE = -1
+NEW_LINE = 128
+BACKSPACE = 129
+DOUBLE_QUOTE = 34
+DEFAULT_MAX_JUMPS = 10 * 1000 * 1000
+DEFAULT_ENTRIES = ("Sys.init", "Main.main")
+HOT_SPOTS = 10
+
+(PUSH_CONSTANT, PUSH_SEGMENT, PUSH_ADDRESS, POP_SEGMENT, POP_ADDRESS, ADD, SUB, NEG, EQ, GT, LT, AND, OR,
+ NOT, GOTO, IF_GOTO, CALL, CALL_OS, FUNCTION, RETURN) = range(20)
+ARITHMETIC = {"add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT, "lt": LT, "and": AND, "or": OR,
+              "not": NOT}
+SEGMENT_REGISTERS = {"local": LCL, "argument": ARG, "this": THIS, "that": THAT}
+
+
+class VMError(Exception):
+    pass
+
+
+class Halt(Exception):
+    pass
+
+
+def to_word(value):
+    # wraps a Python int to a signed 16 bit word
+    return ((value + 32768) & 0xFFFF) - 32768
+
+
+def render_vm(instructions):
+    # .vm text of instruction tuples
+    lines = list()
+    for instruction in instructions:
+        if len(instruction) == 1:
+            lines.append(instruction[0])
+        elif len(instruction) == 2:
+            lines.append(instruction[0] + " " + instruction[1])
+        else:
+            lines.append(instruction[0] + " " + instruction[1] + " " + str(instruction[2]))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def parse_vm(text):
+    # the inverse of render_vm
+    instructions = list()
+    for line in text.splitlines():
+        parts = line.split("//", 1)[0].split()
+        if not parts:
+            continue
+        if len(parts) == 3:
+            instructions.append((parts[0], parts[1], int(parts[2])))
+        else:
+            instructions.append(tuple(parts))
+    return instructions
+
+
+def read_classes(path):
+    # the .vm files at path, a file or a directory, by class name
+    if os.path.isdir(path):
+        file_names = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".vm")]
+    else:
+        file_names = [path]
+    classes = dict()
+    for file_name in file_names:
+        with open(file_name) as file:
+            classes[os.path.splitext(os.path.basename(file_name))[0]] = file.read()
+    return classes
+
+
+def int_value(text):
+    # the leading integer of text, like String.intValue
+    sign = -1 if text.startswith("-") else 1
+    digits = ""
+    for char in text[1:] if sign < 0 else text:
+        if not char.isdigit():
+            break
+        digits += char
+    return to_word(sign * int(digits or "0"))
+
+
+class JackOS:
+    # the OS classes, called with the popped arguments and returning the value the call pushes.
+    # Output and the keyboard are text, the screen is the RAM memory map the real OS draws into.
+    def __init__(self, ram, keyboard=""):
+        self.ram = ram
+        self.free_pointer = HEAP_BASE
+        self.free_blocks = dict()
+        self.output = list()
+        self.keyboard = keyboard
+        self.key_index = 0
+        self.color = True
+        self.functions = {"Memory.alloc": self.alloc, "Memory.deAlloc": self.de_alloc,
+                          "Memory.peek": self.peek, "Memory.poke": self.poke,
+                          "Array.new": self.alloc, "Array.dispose": self.de_alloc,
+                          "String.new": self.string_new, "String.dispose": self.de_alloc,
+                          "String.length": self.string_length, "String.charAt": self.string_char_at,
+                          "String.setCharAt": self.string_set_char_at,
+                          "String.appendChar": self.string_append_char,
+                          "String.eraseLastChar": self.string_erase_last_char,
+                          "String.intValue": self.string_int_value, "String.setInt": self.string_set_int,
+                          "String.newLine": lambda: NEW_LINE, "String.backSpace": lambda: BACKSPACE,
+                          "String.doubleQuote": lambda: DOUBLE_QUOTE,
+                          "Output.printChar": self.print_char, "Output.printString": self.print_string,
+                          "Output.printInt": self.print_int, "Output.println": self.println,
+                          "Output.backSpace": self.back_space, "Output.moveCursor": lambda i, j: 0,
+                          "Math.multiply": lambda x, y: to_word(x * y), "Math.divide": self.divide,
+                          "Math.min": min, "Math.max": max, "Math.abs": lambda x: to_word(abs(x)),
+                          "Math.sqrt": lambda x: int(max(x, 0) ** 0.5),
+                          "Keyboard.keyPressed": self.key_pressed, "Keyboard.readChar": self.read_char,
+                          "Keyboard.readLine": self.read_line, "Keyboard.readInt": self.read_int,
+                          "Screen.clearScreen": self.clear_screen, "Screen.setColor": self.set_color,
+                          "Screen.drawPixel": self.draw_pixel, "Screen.drawLine": self.draw_line,
+                          "Screen.drawRectangle": self.draw_rectangle, "Screen.drawCircle": self.draw_circle,
+                          "Sys.halt": self.halt, "Sys.error": self.error, "Sys.wait": lambda duration: 0}
+
+    def alloc(self, size):
+        if size <= 0:
+            raise VMError("allocated block size must be positive")
+        blocks = self.free_blocks.get(size)
+        if blocks:
+            return blocks.pop()
+        address = self.free_pointer + 1
+        if address + size > HEAP_END:
+            raise VMError("out of heap memory")
+        # the block size sits just before the block so it can be freed
+        self.ram[address - 1] = size
+        self.free_pointer = address + size
+        return address
+
+    def de_alloc(self, address):
+        self.free_blocks.setdefault(self.ram[address - 1], list()).append(address)
+        return 0
+
+    def peek(self, address):
+        return self.ram[address]
+
+    def poke(self, address, value):
+        self.ram[address] = value
+        return 0
+
+    # a string is its length, its capacity and then its characters
+    def string_new(self, max_length):
+        if max_length < 0:
+            raise VMError("string capacity must not be negative")
+        address = self.alloc(max_length + 2)
+        self.ram[address] = 0
+        self.ram[address + 1] = max_length
+        return address
+
+    def string_length(self, string):
+        return self.ram[string]
+
+    def string_char_at(self, string, index):
+        if not 0 <= index < self.ram[string]:
+            raise VMError("string index out of range")
+        return self.ram[string + 2 + index]
+
+    def string_set_char_at(self, string, index, char):
+        if not 0 <= index < self.ram[string]:
+            raise VMError("string index out of range")
+        self.ram[string + 2 + index] = char
+        return 0
+
+    def string_append_char(self, string, char):
+        length = self.ram[string]
+        if length >= self.ram[string + 1]:
+            raise VMError("string is full")
+        self.ram[string + 2 + length] = char
+        self.ram[string] = length + 1
+        return string
+
+    def string_erase_last_char(self, string):
+        if self.ram[string] == 0:
+            raise VMError("string is empty")
+        self.ram[string] -= 1
+        return 0
+
+    def string_value(self, string):
+        return "".join(chr(self.ram[string + 2 + i]) for i in range(self.ram[string]))
+
+    def string_int_value(self, string):
+        return int_value(self.string_value(string))
+
+    def string_set_int(self, string, value):
+        text = str(value)
+        if len(text) > self.ram[string + 1]:
+            raise VMError("string is full")
+        self.ram[string] = len(text)
+        for i, char in enumerate(text):
+            self.ram[string + 2 + i] = ord(char)
+        return 0
+
+    def print_char(self, char):
+        if char == NEW_LINE:
+            self.output.append("\n")
+        elif char == BACKSPACE:
+            self.back_space()
+        else:
+            self.output.append(chr(char))
+        return 0
+
+    def print_string(self, string):
+        self.output.append(self.string_value(string))
+        return 0
+
+    def print_int(self, value):
+        self.output.append(str(value))
+        return 0
+
+    def println(self):
+        self.output.append("\n")
+        return 0
+
+    def back_space(self):
+        if self.output:
+            self.output[-1] = self.output[-1][:-1]
+        return 0
+
+    def divide(self, x, y):
+        if y == 0:
+            raise VMError("division by zero")
+        quotient = abs(x) // abs(y)
+        return to_word(quotient if (x < 0) == (y < 0) else -quotient)
+
+    # the keyboard types out the input text one key at a time, a newline is the Jack newline key
+    def key_pressed(self):
+        if self.key_index >= len(self.keyboard):
+            return 0
+        char = self.keyboard[self.key_index]
+        return NEW_LINE if char == "\n" else ord(char)
+
+    def next_key(self):
+        key = self.key_pressed()
+        if key == 0:
+            raise VMError("the program read past the end of its input")
+        self.key_index += 1
+        return key
+
+    def read_char(self):
+        key = self.next_key()
+        self.print_char(key)
+        return key
+
+    def read_text(self, message):
+        self.print_string(message)
+        chars = list()
+        key = self.next_key()
+        while key != NEW_LINE:
+            chars.append(chr(key))
+            key = self.next_key()
+        text = "".join(chars)
+        self.output.append(text + "\n")
+        return text
+
+    def read_line(self, message):
+        text = self.read_text(message)
+        string = self.string_new(len(text))
+        for char in text:
+            self.string_append_char(string, ord(char))
+        return string
+
+    def read_int(self, message):
+        return int_value(self.read_text(message))
+
+    def clear_screen(self):
+        for address in range(SCREEN_BASE, KEYBOARD):
+            self.ram[address] = 0
+        return 0
+
+    def set_color(self, color):
+        self.color = color != 0
+        return 0
+
+    def draw_pixel(self, x, y):
+        if not (0 <= x < SCREEN_WIDTH and 0 <= y < SCREEN_HEIGHT):
+            raise VMError("pixel " + str(x) + ", " + str(y) + " is off the screen")
+        address = SCREEN_BASE + y * (SCREEN_WIDTH // 16) + x // 16
+        bit = 1 << (x % 16)
+        word = self.ram[address] & 0xFFFF
+        self.ram[address] = to_word(word | bit if self.color else word & ~bit)
+        return 0
+
+    def draw_line(self, x1, y1, x2, y2):
+        steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+        for i in range(steps + 1):
+            self.draw_pixel(x1 + round((x2 - x1) * i / steps), y1 + round((y2 - y1) * i / steps))
+        return 0
+
+    def draw_rectangle(self, x1, y1, x2, y2):
+        for y in range(y1, y2 + 1):
+            for x in range(x1, x2 + 1):
+                self.draw_pixel(x, y)
+        return 0
+
+    def draw_circle(self, x, y, r):
+        for dy in range(-r, r + 1):
+            dx = int((r * r - dy * dy) ** 0.5)
+            for px in range(x - dx, x + dx + 1):
+                self.draw_pixel(px, y + dy)
+        return 0
+
+    def halt(self):
+        raise Halt()
+
+    def error(self, code):
+        raise VMError("Sys.error " + str(code))
+
+
+class VirtualMachine:
+    # loads the instructions of every class, then runs them from an entry function and counts how
+    # often each instruction ran
+    def __init__(self, classes, keyboard=""):
+        # classes maps a class name to its instruction tuples or its .vm text
+        self.ram = [0] * RAM_SIZE
+        self.os = JackOS(self.ram, keyboard)
+        self.code = list()
+        # the VM command of every loaded instruction and the function each call names, for the report
+        self.commands = list()
+        self.targets = dict()
+        self.functions = dict()
+        self.function_starts = list()
+        self.function_names = list()
+        static_base = STATIC_BASE
+        pending = list()
+        for class_name in sorted(classes):
+            instructions = classes[class_name]
+            if isinstance(instructions, str):
+                instructions = parse_vm(instructions)
+            statics = 1 + max((instruction[2] for instruction in instructions
+                               if len(instruction) == 3 and instruction[1] == "static"), default=-1)
+            if static_base + statics > STATIC_END:
+                raise VMError("too many static variables")
+            pending.append((instructions, static_base))
+            static_base += statics
+        for instructions, static_base in pending:
+            self.load(instructions, static_base)
+        self.link()
+        # how often control arrived at each instruction by a jump, call or return, see instruction_counts
+        self.counts = [0] * len(self.code)
+
+    def load(self, instructions, static_base):
+        labels = dict()
+        for instruction in instructions:
+            op = instruction[0]
+            if op == "label":
+                # labels are local to their function and take no step of their own
+                labels[instruction[1]] = len(self.code)
+                continue
+            if op == "function":
+                function_name = instruction[1]
+                if function_name in self.functions:
+                    raise VMError("function " + function_name + " is defined twice")
+                self.functions[function_name] = len(self.code)
+                self.function_starts.append(len(self.code))
+                self.function_names.append(function_name)
+                labels = dict()
+                self.code.append((FUNCTION, instruction[2], None))
+            elif not self.function_starts:
+                raise VMError("instruction outside of a function")
+            elif op == "push" or op == "pop":
+                segment, index = instruction[1], instruction[2]
+                if segment == "constant":
+                    if op == "pop":
+                        raise VMError("cannot pop to the constant segment")
+                    self.code.append((PUSH_CONSTANT, index, None))
+                elif segment in SEGMENT_REGISTERS:
+                    self.code.append((PUSH_SEGMENT if op == "push" else POP_SEGMENT,
+                                      SEGMENT_REGISTERS[segment], index))
+                else:
+                    if segment == "temp":
+                        address = TEMP_BASE + index
+                    elif segment == "pointer":
+                        address = THIS + index
+                    elif segment == "static":
+                        address = static_base + index
+                    else:
+                        raise VMError("unknown segment " + segment)
+                    self.code.append((PUSH_ADDRESS if op == "push" else POP_ADDRESS, address, None))
+            elif op in ARITHMETIC:
+                self.code.append((ARITHMETIC[op], None, None))
+            elif op == "goto" or op == "if-goto":
+                self.code.append((GOTO if op == "goto" else IF_GOTO, (labels, instruction[1]), None))
+            elif op == "call":
+                self.targets[len(self.code)] = instruction[1]
+                self.code.append((CALL, instruction[1], instruction[2]))
+            elif op == "return":
+                self.code.append((RETURN, None, None))
+            else:
+                raise VMError("unknown instruction " + " ".join(str(part) for part in instruction))
+            self.commands.append(op)
+
+    def link(self):
+        # replaces label and function names with code addresses
+        for i, (op, a, b) in enumerate(self.code):
+            if op == GOTO or op == IF_GOTO:
+                labels, label = a
+                if label not in labels:
+                    raise VMError("undefined label " + label)
+                self.code[i] = (op, labels[label], None)
+            elif op == CALL:
+                if a in self.functions:
+                    self.code[i] = (CALL, self.functions[a], b)
+                elif a in self.os.functions:
+                    self.code[i] = (CALL_OS, self.os.functions[a], b)
+                else:
+                    raise VMError("undefined function " + a)
+
+    def entry(self):
+        for entry in DEFAULT_ENTRIES:
+            if entry in self.functions:
+                return entry
+        raise VMError("there is no " + " or ".join(DEFAULT_ENTRIES) + " to start from")
+
+    def run(self, entry=None, max_jumps=DEFAULT_MAX_JUMPS):
+        # returns what the program printed. A run ends when the entry function returns or the program
+        # calls Sys.halt, and fails after max_jumps jumps and calls, the only way to loop forever
+        if entry is None:
+            entry = self.entry()
+        elif entry not in self.functions:
+            raise VMError("undefined function " + entry)
+        ram = self.ram
+        code = self.code
+        counts = self.counts
+        sp = STACK_BASE
+        # a frame whose return address ends the run
+        for value in (-1, 0, 0, 0, 0):
+            ram[sp] = value
+            sp += 1
+        ram[ARG] = STACK_BASE
+        ram[LCL] = sp
+        pc = self.functions[entry]
+        counts[pc] += 1
+        jumps_left = max_jumps
+        try:
+            while pc >= 0:
+                op, a, b = code[pc]
+                pc += 1
+                if op == PUSH_CONSTANT:
+                    ram[sp] = a
+                    sp += 1
+                elif op == PUSH_SEGMENT:
+                    ram[sp] = ram[ram[a] + b]
+                    sp += 1
+                elif op == PUSH_ADDRESS:
+                    ram[sp] = ram[a]
+                    sp += 1
+                elif op == POP_SEGMENT:
+                    sp -= 1
+                    ram[ram[a] + b] = ram[sp]
+                elif op == POP_ADDRESS:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif op == ADD:
+                    sp -= 1
+                    ram[sp - 1] = to_word(ram[sp - 1] + ram[sp])
+                elif op == SUB:
+                    sp -= 1
+                    ram[sp - 1] = to_word(ram[sp - 1] - ram[sp])
+                elif op == NEG:
+                    ram[sp - 1] = to_word(-ram[sp - 1])
+                elif op == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] == ram[sp] else 0
+                elif op == GT:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] > ram[sp] else 0
+                elif op == LT:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] < ram[sp] else 0
+                elif op == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp] == 0:
+                        counts[pc] += 1
+                        continue
+                    pc = a
+                    counts[a] += 1
+                    jumps_left -= 1
+                    if jumps_left < 0:
+                        raise VMError("gave up after " + str(max_jumps) + " jumps and calls")
+                elif op == GOTO:
+                    pc = a
+                    counts[a] += 1
+                    jumps_left -= 1
+                    if jumps_left < 0:
+                        raise VMError("gave up after " + str(max_jumps) + " jumps and calls")
+                elif op == CALL:
+                    ram[sp] = pc
+                    ram[sp + 1] = ram[LCL]
+                    ram[sp + 2] = ram[ARG]
+                    ram[sp + 3] = ram[THIS]
+                    ram[sp + 4] = ram[THAT]
+                    sp += 5
+                    ram[ARG] = sp - 5 - b
+                    ram[LCL] = sp
+                    pc = a
+                    counts[a] += 1
+                    jumps_left -= 1
+                    if jumps_left < 0:
+                        raise VMError("gave up after " + str(max_jumps) + " jumps and calls")
+                elif op == CALL_OS:
+                    sp -= b
+                    ram[sp] = a(*ram[sp:sp + b])
+                    sp += 1
+                    counts[pc] += 1
+                elif op == FUNCTION:
+                    for i in range(a):
+                        ram[sp + i] = 0
+                    sp += a
+                    if sp >= HEAP_BASE:
+                        raise VMError("stack overflow")
+                elif op == RETURN:
+                    frame = ram[LCL]
+                    pc = ram[frame - 5]
+                    ram[ram[ARG]] = ram[sp - 1]
+                    sp = ram[ARG] + 1
+                    ram[THAT] = ram[frame - 1]
+                    ram[THIS] = ram[frame - 2]
+                    ram[ARG] = ram[frame - 3]
+                    ram[LCL] = ram[frame - 4]
+                    if pc >= 0:
+                        counts[pc] += 1
+        except Halt:
+            pass
+        return "".join(self.os.output)
+
+    def instruction_counts(self):
+        # how often each instruction ran. The run loop only counts where control arrives by a jump,
+        # call or return, any other instruction runs as often as the one before it plus those arrivals.
+        result = list()
+        total = 0
+        previous = RETURN
+        for i, (op, a, b) in enumerate(self.code):
+            if previous in (GOTO, IF_GOTO, CALL, CALL_OS, RETURN):
+                total = self.counts[i]
+            else:
+                total += self.counts[i]
+            result.append(total)
+            previous = op
+        return result
+
+    @property
+    def steps(self):
+        # VM instructions executed, a call to the OS counts as the one call instruction
+        return sum(self.instruction_counts())
+
+    @property
+    def os_calls(self):
+        counts = self.instruction_counts()
+        total = 0
+        for i, target in self.targets.items():
+            if target not in self.functions:
+                total += counts[i]
+        return total
+
+    def function_of(self, index):
+        return self.function_names[bisect.bisect_right(self.function_starts, index) - 1]
+
+    def report(self, top=HOT_SPOTS):
+        # instruction counts by command, call counts by function, and the functions that executed the
+        # most instructions of their own
+        counts = self.instruction_counts()
+        commands = dict()
+        function_steps = dict()
+        for i, count in enumerate(counts):
+            if count:
+                command = self.commands[i]
+                commands[command] = commands.get(command, 0) + count
+                function_name = self.function_of(i)
+                function_steps[function_name] = function_steps.get(function_name, 0) + count
+        calls = dict()
+        for i, target in self.targets.items():
+            if counts[i]:
+                calls[target] = calls.get(target, 0) + counts[i]
+        steps = sum(counts)
+        hot_spots = list()
+        for function_name in sorted(function_steps, key=function_steps.get, reverse=True)[:top]:
+            hot_spots.append({"function": function_name, "steps": function_steps[function_name],
+                              "share": round(function_steps[function_name] / steps, 4),
+                              "calls": calls.get(function_name, 0)})
+        return {"steps": steps, "calls": sum(calls.values()), "os_calls": self.os_calls,
+                "commands": dict(sorted(commands.items(), key=lambda item: item[1], reverse=True)),
+                "call_counts": dict(sorted(calls.items(), key=lambda item: item[1], reverse=True)),
+                "hot_spots": hot_spots}
+
+
+def format_report(report):
+    lines = [str(report["steps"]) + " VM instructions, " + str(report["calls"]) + " calls, " +
+             str(report["os_calls"]) + " of them to the OS"]
+    lines.append("%-36s %12s %7s %10s" % ("hot spot", "steps", "share", "calls"))
+    for spot in report["hot_spots"]:
+        lines.append("%-36s %12d %6.1f%% %10d" % (spot["function"], spot["steps"], 100 * spot["share"],
+                                                  spot["calls"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs compiled Jack programs and reports what they executed.")
+    parser.add_argument("path", help="a .vm file or a directory of .vm files")
+    parser.add_argument("--entry", help="function to start from (default Sys.init, else Main.main)")
+    parser.add_argument("--input", default="", help="what the program reads from the keyboard, \\n ends a line")
+    parser.add_argument("--max-jumps", type=int, default=DEFAULT_MAX_JUMPS,
+                        help="stop the program after this many jumps and calls (default %(default)s)")
+    parser.add_argument("--top", type=int, default=HOT_SPOTS, help="number of hot spots to list")
+    parser.add_argument("--json", help="write the report as JSON to this file, - for stdout")
+    args = parser.parse_args(argv)
+    try:
+        vm = VirtualMachine(read_classes(args.path), args.input.replace("\\n", "\n"))
+        output = vm.run(args.entry, args.max_jumps)
+    except VMError as error:
+        print("error: " + str(error), file=sys.stderr)
+        return 1
+    report = vm.report(args.top)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    sys.stdout.write(output)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    print(format_report(report), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
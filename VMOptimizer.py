@@ -0,0 +1,316 @@
+# Optimization passes over the instruction tuples buffered by JackCompiler.VMWriter, such as
+# ("push", "local", 0), ("add",) or ("if-goto", "L3"). Every pass returns a new list.
+
+MAX_CONSTANT = 32767
+# longest add chain worth trading for a call to Math.multiply, which loops over all 16 bits
+MULTIPLY_MAX_INSTRUCTIONS = 32
+JUMPS = ("goto", "if-goto")
+# temp 0 is the code generator's scratch cell, it never stays live across any of these
+TEMP_BARRIERS = ("label", "goto", "if-goto", "call", "function", "return")
+
+
+def peephole(instructions):
+    # runs the local rewrites until none of them applies, returns the new code and how many
+    # instructions it saved
+    code = list(instructions)
+    while True:
+        before = code
+        code = fold_window(code)
+        code = remove_dead_temp_stores(code)
+        code = thread_jumps(code)
+        code = remove_unreachable(code)
+        code = remove_unused_labels(code)
+        if code == before:
+            return code, len(instructions) - len(code)
+
+
+def is_push_constant(instruction):
+    return instruction[0] == "push" and instruction[1] == "constant"
+
+
+def fold_window(code):
+    # rewrites the tail of the output each time an instruction is appended, so a rewrite can
+    # expose the next one
+    out = list()
+    for instruction in code:
+        op = instruction[0]
+        if op == "not":
+            if out and out[-1] == ("not",):
+                out.pop()
+                continue
+            if len(out) >= 2 and out[-1] == ("neg",) and is_push_constant(out[-2]) and out[-2][2] >= 1:
+                # ~(-a) is a - 1
+                value = out[-2][2] - 1
+                del out[-2:]
+                out.append(("push", "constant", value))
+                continue
+            if len(out) >= 2 and is_push_constant(out[-2]):
+                value = out[-2][2]
+                # not (x < k) is x > k - 1 and not (x > k) is x < k + 1
+                if out[-1] == ("lt",) and value >= 1:
+                    out[-2:] = [("push", "constant", value - 1), ("gt",)]
+                    continue
+                if out[-1] == ("gt",) and value < MAX_CONSTANT:
+                    out[-2:] = [("push", "constant", value + 1), ("lt",)]
+                    continue
+        elif op == "if-goto":
+            if out and is_push_constant(out[-1]):
+                value = out.pop()[2]
+                if value != 0:
+                    out.append(("goto", instruction[1]))
+                continue
+            if len(out) >= 2 and out[-1] in (("neg",), ("not",)) and is_push_constant(out[-2]):
+                # -a is zero only for a zero and ~a never is for a constant
+                taken = out[-2][2] != 0 or out[-1] == ("not",)
+                del out[-2:]
+                if taken:
+                    out.append(("goto", instruction[1]))
+                continue
+            if len(out) >= 2 and out[-2] == ("eq",) and out[-1] == ("not",):
+                # a != b exactly when a - b is not zero
+                out[-2:] = [("sub",)]
+        elif op == "pop":
+            if out and out[-1][0] == "push" and out[-1][1:] == instruction[1:]:
+                out.pop()
+                continue
+            if instruction == ("pop", "that", 0) and len(out) >= 4 \
+                    and out[-3:] == [("pop", "temp", 0), ("pop", "pointer", 1), ("push", "temp", 0)] \
+                    and out[-4][0] == "push" and out[-4][1] != "that" and out[-4][1:] != ("pointer", 1):
+                # a[i] = simple value: point that at a[i] first and skip the round trip through temp 0
+                value = out[-4]
+                out[-4:] = [("pop", "pointer", 1), value]
+        elif op == "label":
+            if out and out[-1] == ("goto", instruction[1]):
+                out.pop()
+        out.append(instruction)
+    return out
+
+
+def temp_is_dead(code, start):
+    for i in range(start, len(code)):
+        instruction = code[i]
+        if instruction[0] in TEMP_BARRIERS:
+            return True
+        if instruction[1:] == ("temp", 0):
+            return instruction[0] == "pop"
+    return True
+
+
+def remove_dead_temp_stores(code):
+    # a value pushed only to be popped into an unused temp 0 costs nothing to drop
+    out = list()
+    i = 0
+    while i < len(code):
+        if i + 1 < len(code) and code[i][0] == "push" and code[i + 1] == ("pop", "temp", 0) \
+                and temp_is_dead(code, i + 2):
+            i += 2
+            continue
+        if i + 1 < len(code) and code[i] == ("pop", "temp", 0) and code[i + 1] == ("push", "temp", 0) \
+                and temp_is_dead(code, i + 2):
+            i += 2
+            continue
+        out.append(code[i])
+        i += 1
+    return out
+
+
+def thread_jumps(code):
+    # a jump to a label that only leads to another goto goes straight to its final target
+    next_goto = dict()
+    for i in range(len(code)):
+        if code[i][0] == "label":
+            j = i + 1
+            while j < len(code) and code[j][0] == "label":
+                j += 1
+            if j < len(code) and code[j][0] == "goto":
+                next_goto[code[i][1]] = code[j][1]
+    out = list()
+    for i in range(len(code)):
+        instruction = code[i]
+        if instruction[0] in JUMPS and instruction[1] in next_goto:
+            target = instruction[1]
+            seen = {target}
+            while target in next_goto and next_goto[target] not in seen:
+                target = next_goto[target]
+                seen.add(target)
+            instruction = (instruction[0], target)
+        if instruction[0] == "goto":
+            # a goto over nothing but labels, one of them its target, does nothing
+            j = i + 1
+            while j < len(code) and code[j][0] == "label" and code[j][1] != instruction[1]:
+                j += 1
+            if j < len(code) and code[j] == ("label", instruction[1]):
+                continue
+        out.append(instruction)
+    return out
+
+
+def remove_unreachable(code):
+    out = list()
+    reachable = True
+    for instruction in code:
+        if instruction[0] in ("label", "function"):
+            reachable = True
+        if reachable:
+            out.append(instruction)
+        if instruction[0] in ("goto", "return"):
+            reachable = False
+    return out
+
+
+def remove_unused_labels(code):
+    targets = set()
+    for instruction in code:
+        if instruction[0] in JUMPS:
+            targets.add(instruction[1])
+    return [instruction for instruction in code if instruction[0] != "label" or instruction[1] in targets]
+
+
+def pack_locals(code):
+    # gives locals that are never live at the same time one slot, so functions declare fewer of them
+    # to zero on every call. Returns the new code and the slots saved by function name
+    starts = [i for i in range(len(code)) if code[i][0] == "function"]
+    if not starts:
+        return code, dict()
+    out = code[:starts[0]]
+    saved = dict()
+    starts.append(len(code))
+    for start, end in zip(starts, starts[1:]):
+        function = code[start:end]
+        packed = pack_function(function)
+        if packed is None:
+            out.extend(function)
+        else:
+            saved[function[0][1]] = function[0][2] - packed[0][2]
+            out.extend(packed)
+    return out, saved
+
+
+def pack_function(code):
+    # the code of one function, its header first, with its locals renumbered into as few slots as
+    # their lifetimes allow, None when that saves nothing
+    count = code[0][2]
+    if count == 0 or len(code) < 2:
+        return None
+    # basic blocks: a label starts one, a jump or return ends one
+    starts = [1]
+    for i in range(1, len(code)):
+        op = code[i][0]
+        if op == "label" and i != starts[-1]:
+            starts.append(i)
+        elif op in JUMPS or op == "return":
+            if i + 1 < len(code):
+                starts.append(i + 1)
+    ends = starts[1:] + [len(code)]
+    blocks = len(starts)
+    block_of = dict()
+    for b in range(blocks):
+        if code[starts[b]][0] == "label":
+            block_of[code[starts[b]][1]] = b
+    # per block the locals read before any write (uses) and those written (defs), as bit sets
+    uses = [0] * blocks
+    defs = [0] * blocks
+    successors = list()
+    for b in range(blocks):
+        for i in range(starts[b], ends[b]):
+            instruction = code[i]
+            if instruction[1:2] == ("local",):
+                bit = 1 << instruction[2]
+                if instruction[0] == "push":
+                    uses[b] |= bit & ~defs[b]
+                else:
+                    defs[b] |= bit
+        last = code[ends[b] - 1]
+        targets = list()
+        if last[0] in JUMPS:
+            if last[1] not in block_of:
+                return None
+            targets.append(block_of[last[1]])
+        if last[0] != "goto" and last[0] != "return" and b + 1 < blocks:
+            targets.append(b + 1)
+        successors.append(targets)
+    live_in = [0] * blocks
+    live_out = [0] * blocks
+    changed = True
+    while changed:
+        changed = False
+        for b in range(blocks - 1, -1, -1):
+            out = 0
+            for successor in successors[b]:
+                out |= live_in[successor]
+            live_out[b] = out
+            new_in = uses[b] | out & ~defs[b]
+            if new_in != live_in[b]:
+                live_in[b] = new_in
+                changed = True
+    # a write interferes with every other local live after it. Locals read before they are written
+    # hold the zero of the entry, which every slot holds then, so they need nothing more
+    interferes = [0] * count
+    used = 0
+    for b in range(blocks):
+        live = live_out[b]
+        for i in range(ends[b] - 1, starts[b] - 1, -1):
+            instruction = code[i]
+            if instruction[1:2] == ("local",):
+                local = instruction[2]
+                bit = 1 << local
+                used |= bit
+                if instruction[0] == "push":
+                    live |= bit
+                else:
+                    interferes[local] |= live & ~bit
+                    live &= ~bit
+    for local in range(count):
+        for other in range(count):
+            if interferes[local] >> other & 1:
+                interferes[other] |= 1 << local
+    slots = dict()
+    for local in range(count):
+        if used >> local & 1:
+            taken = {slots[other] for other in slots if interferes[local] >> other & 1}
+            slot = 0
+            while slot in taken:
+                slot += 1
+            slots[local] = slot
+    new_count = max(slots.values()) + 1 if slots else 0
+    if new_count >= count:
+        return None
+    out = [("function", code[0][1], new_count)]
+    for instruction in code[1:]:
+        if instruction[1:2] == ("local",):
+            instruction = (instruction[0], "local", slots[instruction[2]])
+        out.append(instruction)
+    return out
+
+
+def is_plain_push(instruction):
+    # a push that can be repeated for the same value, temp 1 and 2 belong to multiply_sequence
+    return instruction[0] == "push" and instruction[1] != "temp"
+
+
+def multiply_sequence(factor, operand=None):
+    # code that multiplies a value by a constant factor with additions, doubling once per bit of the
+    # factor, or None when it would be longer than the call. operand is a plain push of the value,
+    # otherwise the value is expected on the stack
+    if operand is None:
+        code = [("pop", "temp", 1)]
+        operand = ("push", "temp", 1)
+    else:
+        code = list()
+    if factor == 0:
+        # the popped value still has to leave the stack
+        return code + [("push", "constant", 0)]
+    code.append(operand)
+    # the first doubling can push the value again, later ones copy the sum through temp 2
+    doubled = False
+    for bit in bin(factor)[3:]:
+        if doubled:
+            code.extend([("pop", "temp", 2), ("push", "temp", 2), ("push", "temp", 2), ("add",)])
+        else:
+            code.extend([operand, ("add",)])
+            doubled = True
+        if bit == "1":
+            code.extend([operand, ("add",)])
+        if len(code) > MULTIPLY_MAX_INSTRUCTIONS:
+            return None
+    return code
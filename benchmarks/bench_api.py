@@ -0,0 +1,58 @@
+# Latency of compiling one class in memory with compile_source against running the command line compiler
+# on a file in a fresh process, as a build server compiling snippets would.
+# Run from the repository root: python -m benchmarks.bench_api
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from JackCompiler import compile_source
+from benchmarks.corpus import ProgramGenerator
+from benchmarks.harness import run_main
+
+COMPILER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "JackCompiler.py")
+
+
+def latencies(func, snippets):
+    times = list()
+    for snippet in snippets:
+        start = time.perf_counter()
+        func(snippet)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def compile_with_cli(directory):
+    def compile_one(snippet):
+        path = os.path.join(directory, "Snippet.jack")
+        with open(path, "w") as file:
+            file.write(snippet)
+        subprocess.run([sys.executable, COMPILER, path], check=True)
+        with open(os.path.join(directory, "Snippet.vm")) as file:
+            return file.read()
+    return compile_one
+
+
+def main():
+    count = 50
+    snippets = list()
+    for seed in range(count):
+        sources = ProgramGenerator(seed=seed, files=1, subroutines=4, statements=8).generate()
+        snippets.append(sources["Gen0"].replace("Gen0", "Snippet"))
+    with tempfile.TemporaryDirectory() as directory:
+        cli = compile_with_cli(directory)
+        for snippet in snippets[:3]:
+            assert cli(snippet) == compile_source(snippet)
+        results = [("compile_source", latencies(compile_source, snippets)),
+                   ("command line", latencies(cli, snippets))]
+    print("%-16s %12s %12s %12s" % ("entry point", "median (ms)", "p95 (ms)", "snippets/s"))
+    for name, times in results:
+        times.sort()
+        print("%-16s %12.3f %12.3f %12.0f" % (name, 1000 * statistics.median(times),
+                                             1000 * times[int(0.95 * (len(times) - 1))], len(times) / sum(times)))
+
+
+if __name__ == '__main__':
+    run_main(main)
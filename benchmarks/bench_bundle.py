@@ -0,0 +1,35 @@
+# Time to write the code of a large generated program as a file per class against one bundle, and to
+# read one class back from the bundle by its index against unpacking all of it.
+# Run from the repository root: python -m benchmarks.bench_bundle [directory on the file system to measure]
+import os
+import sys
+import tempfile
+
+from JackCompiler import compile_many, write_atomically
+from VMBundle import extract, pack, unpack
+from benchmarks.corpus import ProgramGenerator
+from benchmarks.harness import best_of, run_main
+
+
+def main():
+    outputs = compile_many(ProgramGenerator(files=300, subroutines=4, statements=8).generate())
+    classes = [(name, code.encode()) for name, code in outputs.items()]
+    with tempfile.TemporaryDirectory(dir=sys.argv[1] if len(sys.argv) > 1 else None) as directory:
+        def write_files():
+            for name, code in classes:
+                write_atomically(os.path.join(directory, name + ".vm"), code)
+
+        bundle = os.path.join(directory, "program.vmbundle")
+        files_time = best_of(write_files)
+        bundle_time = best_of(lambda: write_atomically(bundle, pack(classes)))
+        extract_time = best_of(lambda: extract(bundle, classes[-1][0]))
+        unpack_time = best_of(lambda: unpack(bundle))
+        assert unpack(bundle) == dict(classes)
+    print("%d classes, %d bytes of code" % (len(classes), sum(len(code) for name, code in classes)))
+    print("file per class: %.2f ms, bundle: %.2f ms" % (1000 * files_time, 1000 * bundle_time))
+    print("one class from the bundle: %.3f ms, unpacking all of it: %.3f ms" % (1000 * extract_time,
+                                                                             1000 * unpack_time))
+
+
+if __name__ == '__main__':
+    run_main(main)
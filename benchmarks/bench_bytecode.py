@@ -0,0 +1,35 @@
+# Size and load time of VM bytecode against .vm text for the classes of a large generated program, loading
+# being the decode of the bytecode or the parse of the text back into instruction tuples.
+# Run from the repository root: python -m benchmarks.bench_bytecode
+from JackCompiler import CompileOptions, compile_many
+from VMBytecode import decode
+from VMInterpreter import parse_vm
+from benchmarks.corpus import ProgramGenerator
+from benchmarks.harness import best_of, run_main
+
+
+def load_all(func, outputs):
+    for output in outputs:
+        func(output)
+
+
+def main():
+    sources = ProgramGenerator(files=200, subroutines=8, statements=12).generate()
+    texts = compile_many(sources)
+    bytecodes = compile_many(sources, CompileOptions(target="vmb"))
+    for name in texts:
+        assert decode(bytecodes[name]) == parse_vm(texts[name])
+    text_size = sum(len(text.encode()) for text in texts.values())
+    bytecode_size = sum(len(bytecode) for bytecode in bytecodes.values())
+    text_time = best_of(load_all, parse_vm, texts.values())
+    bytecode_time = best_of(load_all, decode, bytecodes.values())
+    print("%d classes, %d instructions" % (len(texts), sum(len(parse_vm(text)) for text in texts.values())))
+    print("%-10s %12s %12s" % ("format", "bytes", "load (ms)"))
+    print("%-10s %12d %12.2f" % (".vm", text_size, 1000 * text_time))
+    print("%-10s %12d %12.2f" % (".vmb", bytecode_size, 1000 * bytecode_time))
+    print("bytecode is %.1f%% of the text and loads %.2fx as fast" % (100 * bytecode_size / text_size,
+                                                                    text_time / bytecode_time))
+
+
+if __name__ == '__main__':
+    run_main(main)
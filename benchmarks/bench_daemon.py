@@ -0,0 +1,58 @@
+# Edit to .vm latency of the watch mode on a generated project of hundreds of classes, and round trip
+# latency of an in-memory compile request over the daemon's socket.
+# Run from the repository root: python -m benchmarks.bench_daemon
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from JackDaemon import CompileServer, Watcher, send_request
+from benchmarks.corpus import ProgramGenerator, write_program
+from benchmarks.harness import run_main
+
+
+def main():
+    edits = 20
+    sources = ProgramGenerator(files=300, subroutines=4, statements=8).generate()
+    with tempfile.TemporaryDirectory() as directory:
+        write_program(directory, sources)
+        watcher = Watcher(directory)
+        start = time.perf_counter()
+        watcher.poll()
+        print("initial build of %d classes: %.1f ms" % (len(sources), 1000 * (time.perf_counter() - start)))
+        idle = list()
+        for _ in range(edits):
+            start = time.perf_counter()
+            watcher.poll()
+            idle.append(time.perf_counter() - start)
+        latencies = list()
+        for i in range(edits):
+            path = os.path.join(directory, "Gen" + str(i) + ".jack")
+            with open(path, "a") as file:
+                file.write("// edit " + str(i) + "\n")
+            start = time.perf_counter()
+            results = watcher.poll()
+            latencies.append(time.perf_counter() - start)
+            assert [file_name for file_name, error, stats in results] == [path]
+        print("poll with no change: median %.2f ms" % (1000 * statistics.median(idle)))
+        print("edit to .vm: median %.2f ms, max %.2f ms" % (1000 * statistics.median(latencies),
+                                                           1000 * max(latencies)))
+        socket_path = os.path.join(directory, "daemon.sock")
+        server = CompileServer(socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            round_trips = list()
+            for _ in range(edits):
+                start = time.perf_counter()
+                response = send_request(socket_path, {"sources": {"Gen0": sources["Gen0"]}})
+                round_trips.append(time.perf_counter() - start)
+                assert "outputs" in response
+        finally:
+            server.shutdown()
+            server.server_close()
+        print("socket request: median %.2f ms" % (1000 * statistics.median(round_trips)))
+
+
+if __name__ == '__main__':
+    run_main(main)
@@ -0,0 +1,56 @@
+# Time to compile one expression nested ever deeper, per level of nesting, which stays flat when the
+# compiler is linear in the depth, against the recursive single-walk engine while it runs out of neither
+# stack nor operators: it compiles only the first operator of a chain.
+# Run from the repository root: python -m benchmarks.bench_depth
+import time
+
+from JackCompiler import CompilationEngine, JackTokenizer, VMWriter
+from benchmarks.harness import run_main
+from benchmarks.legacy import FusedCompilationEngine
+
+SHAPES = {"parentheses": lambda depth: "(" * depth + "a" + ")" * depth,
+          "chain": lambda depth: "a" + " + a" * depth,
+          "unary": lambda depth: "-" * depth + "a",
+          "calls": lambda depth: "Main.id(" * depth + "a" + ")" * depth,
+          "arrays": lambda depth: "b[" * depth + "0" + "]" * depth,
+          "mixed": lambda depth: "(a + -b[" * depth + "1" + "]) * 2" * depth}
+DEPTHS = (250, 1000, 4000, 16000, 64000)
+
+
+def program(expression):
+    return ("class Main {\n"
+            "    function int id(int x) { return x; }\n"
+            "    function void main() { var int a; var Array b; let a = " + expression + "; return; }\n"
+            "}\n")
+
+
+def measure(engine, source):
+    # the time and the code, None for the time when the engine ran out of stack
+    tokenizer = JackTokenizer(source)
+    vmw = VMWriter()
+    start = time.perf_counter()
+    try:
+        engine(tokenizer, vmw).compile_all()
+    except RecursionError:
+        return None, None
+    return time.perf_counter() - start, vmw.getvalue()
+
+
+def main():
+    print("%-12s %8s %18s %18s" % ("shape", "depth", "engine (us/level)", "recursive (us/level)"))
+    for name, shape in SHAPES.items():
+        for depth in DEPTHS:
+            source = program(shape(depth))
+            elapsed, code = measure(CompilationEngine, source)
+            recursive, recursive_code = measure(FusedCompilationEngine, source)
+            if recursive is None:
+                recursive = "recursion limit"
+            elif recursive_code != code:
+                recursive = "wrong code"
+            else:
+                recursive = "%.2f" % (1e6 * recursive / depth)
+            print("%-12s %8d %18.2f %18s" % (name, depth, 1e6 * elapsed / depth, recursive))
+
+
+if __name__ == '__main__':
+    run_main(main)
@@ -0,0 +1,76 @@
+# Parse plus code generation against the frozen fused engine: in FusedCompiler's one walk from the
+# tokens, which plain builds use, through the AST, and code generation alone from already parsed
+# (cached) trees. Building the tree costs the AST path more than it saves in code generation, so it
+# stays slower than the fused engine end to end, which is why plain builds take the one walk, while
+# the cached trees that the whole program passes share with every generator compile faster than both.
+# Run from the repository root: python -m benchmarks.bench_engine
+import sys
+
+from JackCompiler import CodeGenerator, CompilationEngine, FusedCompiler, JackTokenizer, Parser, VMWriter
+from benchmarks.bench_lexer import SAMPLE
+from benchmarks.harness import best_of, run_main
+from benchmarks.legacy import FusedCompilationEngine
+
+
+def compile_fused(tokenizers):
+    outputs = list()
+    for tokenizer in tokenizers:
+        tokenizer.index = 0
+        vmw = VMWriter()
+        FusedCompilationEngine(tokenizer, vmw).compile_all()
+        outputs.append(vmw.getvalue())
+    return outputs
+
+
+def compile_one_walk(tokenizers):
+    outputs = list()
+    for tokenizer in tokenizers:
+        tokenizer.index = 0
+        vmw = VMWriter()
+        FusedCompiler(tokenizer, vmw).compile_class()
+        outputs.append(vmw.getvalue())
+    return outputs
+
+
+def compile_ast(tokenizers):
+    outputs = list()
+    for tokenizer in tokenizers:
+        tokenizer.index = 0
+        vmw = VMWriter()
+        CompilationEngine(tokenizer, vmw).compile_all()
+        outputs.append(vmw.getvalue())
+    return outputs
+
+
+def generate_only(class_decs):
+    outputs = list()
+    for class_dec in class_decs:
+        vmw = VMWriter()
+        CodeGenerator(vmw).compile_class(class_dec)
+        outputs.append(vmw.getvalue())
+    return outputs
+
+
+def main():
+    repeat = 15
+    print("%8s %10s %13s %7s %10s %7s %15s %7s" % ("classes", "fused (s)", "one walk (s)", "ratio", "ast (s)", "ratio",
+                                                   "cached ast (s)", "ratio"))
+    for classes in (50, 200, 800):
+        tokenizers = [JackTokenizer(SAMPLE.format(n=n)) for n in range(classes)]
+        class_decs = list()
+        for tokenizer in tokenizers:
+            class_decs.append(Parser(tokenizer).parse_class())
+        expected = compile_fused(tokenizers)
+        if compile_one_walk(tokenizers) != expected or compile_ast(tokenizers) != expected \
+                or generate_only(class_decs) != expected:
+            sys.exit("the engines disagree on the sample classes")
+        fused = best_of(compile_fused, tokenizers, repeat=repeat)
+        one_walk = best_of(compile_one_walk, tokenizers, repeat=repeat)
+        ast = best_of(compile_ast, tokenizers, repeat=repeat)
+        cached = best_of(generate_only, class_decs, repeat=repeat)
+        print("%8d %10.4f %13.4f %6.2fx %10.4f %6.2fx %15.4f %6.2fx" % (classes, fused, one_walk, one_walk / fused,
+                                                                     ast, ast / fused, cached, cached / fused))
+
+
+if __name__ == '__main__':
+    run_main(main)
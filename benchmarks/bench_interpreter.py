@@ -0,0 +1,30 @@
+# Speed of the VM interpreter on the regression corpus, in executed VM instructions per second.
+# Run from the repository root: python -m benchmarks.bench_interpreter
+import os
+import time
+
+from VMInterpreter import VirtualMachine
+from benchmarks.harness import run_main
+from regression.check import CORPUS, MODES, compile_program, find_programs, parse_program
+
+
+def main():
+    repeat = 5
+    print("%-12s %-6s %10s %10s %14s" % ("program", "mode", "steps", "best (s)", "steps/s"))
+    for name in find_programs():
+        class_decs = parse_program(os.path.join(CORPUS, name))
+        for mode in ("plain", "-O"):
+            classes = compile_program(class_decs, MODES[mode])[0]
+            best = None
+            for _ in range(repeat):
+                vm = VirtualMachine(classes)
+                start = time.perf_counter()
+                vm.run()
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            print("%-12s %-6s %10d %10.4f %14.0f" % (name, mode, vm.steps, best, vm.steps / best))
+
+
+if __name__ == '__main__':
+    run_main(main)
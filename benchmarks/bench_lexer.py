@@ -0,0 +1,63 @@
+# Throughput of the single-pass lexer against the legacy first_pass/rid_of_spaces/create_st path.
+# Run from the repository root: python -m benchmarks.bench_lexer
+import sys
+
+from JackCompiler import lex
+from benchmarks.harness import best_of, run_main
+from benchmarks.legacy import legacy_tokens
+
+SAMPLE = """/** Generated class number {n} */
+class Sample{n} {{
+    field int x, y;
+    static Array cache;
+
+    /** Builds a sample.
+     * Nothing interesting happens here.
+     */
+    constructor Sample{n} new(int ax, int ay) {{
+        let x = ax;   // first coordinate
+        let y = ay;
+        return this;
+    }}
+
+    method int area(int scale) {{
+        var int i, total;
+        let i = 0;
+        while (i < scale) {{
+            let total = total + ((x * y) / (i + 1));
+            let cache[i] = total;
+            let i = i + 1;
+        }}
+        do Output.printString("area of sample {n} is ");
+        return total;
+    }}
+}}
+"""
+
+
+def make_lines(classes):
+    lines = list()
+    for n in range(classes):
+        lines.extend(SAMPLE.format(n=n).splitlines(True))
+    return lines
+
+
+def lex_lines(lines):
+    return [token.value for token in lex("".join(lines))[0]]
+
+
+def main():
+    repeat = 3
+    print("%8s %10s %12s %12s %8s" % ("lines", "tokens", "legacy (s)", "lexer (s)", "speedup"))
+    for classes in (25, 100, 400):
+        lines = make_lines(classes)
+        expected = legacy_tokens(lines)
+        if lex_lines(lines) != expected:
+            sys.exit("token streams differ for " + str(classes) + " classes")
+        legacy = best_of(legacy_tokens, lines, repeat=repeat)
+        lexer = best_of(lex_lines, lines, repeat=repeat)
+        print("%8d %10d %12.4f %12.4f %7.1fx" % (len(lines), len(expected), legacy, lexer, legacy / lexer))
+
+
+if __name__ == '__main__':
+    run_main(main)
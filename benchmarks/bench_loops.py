@@ -0,0 +1,63 @@
+# Instructions executed by loop-heavy programs with while conditions tested at the top of the loop and
+# with --rotate-loops, VM instructions in the interpreter and Hack instructions in the emulator.
+# Run from the repository root: python -m benchmarks.bench_loops
+import os
+
+from JackCompiler import CompilationEngine, CompileOptions, JackTokenizer
+from benchmarks.harness import run_main
+from regression.check import CORPUS, compile_program, parse_program, run_program
+
+PROGRAMS = ("Arithmetic", "Control", "Arrays", "Objects")
+# nested counting loops, an array fill and a search, bodies as short as loops get
+LOOPS = """class Main {
+    function void main() {
+        var Array a;
+        var int i, j, sum, found;
+        let a = Array.new(200);
+        let i = 0;
+        while (i < 200) {
+            let a[i] = i + i;
+            let i = i + 1;
+        }
+        let i = 0;
+        while (i < 60) {
+            let j = 0;
+            while (j < 60) {
+                let sum = sum + j;
+                let j = j + 1;
+            }
+            let i = i + 1;
+        }
+        let i = 0;
+        while ((i < 200) & ~(a[i] = 398)) {
+            let i = i + 1;
+        }
+        let found = i;
+        do Output.printInt(sum);
+        do Output.printInt(found);
+        return;
+    }
+}
+"""
+MODES = (("VM", CompileOptions(), CompileOptions(rotate_loops=True)),
+         ("-O VM", CompileOptions(optimize=True, strength_reduce=True),
+          CompileOptions(optimize=True, strength_reduce=True, rotate_loops=True)),
+         ("-O asm", CompileOptions(optimize=True, strength_reduce=True, target="asm"),
+          CompileOptions(optimize=True, strength_reduce=True, target="asm", rotate_loops=True)))
+
+
+def main():
+    programs = [(name, parse_program(os.path.join(CORPUS, name))) for name in PROGRAMS]
+    programs.append(("Loops", [CompilationEngine(JackTokenizer(LOOPS), None).parse()]))
+    print("%-12s %-8s %12s %12s %8s" % ("program", "mode", "top test", "rotated", "saved"))
+    for name, class_decs in programs:
+        for mode, options, rotated in MODES:
+            output, steps = run_program(compile_program(class_decs, options)[0])[:2]
+            rotated_output, rotated_steps = run_program(compile_program(class_decs, rotated)[0])[:2]
+            assert rotated_output == output
+            print("%-12s %-8s %12d %12d %7.1f%%" % (name, mode, steps, rotated_steps,
+                                                    100 * (steps - rotated_steps) / steps))
+
+
+if __name__ == '__main__':
+    run_main(main)
@@ -0,0 +1,44 @@
+# Peak memory and time of compiling one generated class of growing size with the whole file held against
+# --stream, which holds a window of its tokens and one subroutine at a time.
+# Run from the repository root: python -m benchmarks.bench_stream
+import os
+import tempfile
+import time
+import tracemalloc
+
+from JackCompiler import compile_file, compile_stream
+from benchmarks.corpus import ProgramGenerator
+from benchmarks.harness import run_main
+
+
+def measure(func, file_name):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(file_name)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    print("%12s %14s %14s %14s %14s" % ("source KB", "whole (s)", "whole peak KB", "stream (s)",
+                                        "stream peak KB"))
+    with tempfile.TemporaryDirectory() as directory:
+        for subroutines in (250, 1000, 4000):
+            source = ProgramGenerator(files=1, subroutines=subroutines, statements=12).generate()["Gen0"]
+            file_name = os.path.join(directory, "Gen0.jack")
+            with open(file_name, "w") as file:
+                file.write(source)
+            whole_time, whole_peak = measure(compile_file, file_name)
+            with open(os.path.join(directory, "Gen0.vm")) as file:
+                whole = file.read()
+            stream_time, stream_peak = measure(compile_stream, file_name)
+            with open(os.path.join(directory, "Gen0.vm")) as file:
+                assert file.read() == whole
+            print("%12.0f %14.3f %14.0f %14.3f %14.0f" % (len(source) / 1024, whole_time, whole_peak / 1024,
+                                                          stream_time, stream_peak / 1024))
+
+
+if __name__ == '__main__':
+    run_main(main)
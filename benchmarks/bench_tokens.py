@@ -0,0 +1,59 @@
+# Memory and throughput of the pre-classified token stream against per-call classification.
+# Run from the repository root: python -m benchmarks.bench_tokens
+import time
+import tracemalloc
+
+from JackCompiler import JackTokenizer
+from benchmarks.bench_lexer import make_lines
+from benchmarks.harness import run_main
+from benchmarks.legacy import LegacyTokenizer, legacy_tokens
+
+
+def build_legacy(lines):
+    return LegacyTokenizer(legacy_tokens(lines))
+
+
+def build_current(lines):
+    return JackTokenizer(lines)
+
+
+def walk(tokenizer):
+    # the engine reads one token ahead and pushes it back for nearly every token it consumes
+    count = 0
+    while tokenizer.has_more_tokens():
+        tokenizer.get_next_token()
+        tokenizer.go_back()
+        tokenizer.get_next_token()
+        count += 1
+    return count
+
+
+def measure(build, lines):
+    start = time.perf_counter()
+    tokenizer = build(lines)
+    built = time.perf_counter()
+    count = walk(tokenizer)
+    walked = time.perf_counter()
+    tracemalloc.start()
+    tokenizer = build(lines)
+    retained = tracemalloc.get_traced_memory()[0]
+    walk(tokenizer)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, built - start, walked - built, retained, peak
+
+
+def main():
+    print("%-8s %8s %10s %10s %12s %12s %12s" % ("stream", "tokens", "build (s)", "walk (s)", "tokens/s",
+                                                  "retained KB", "peak KB"))
+    for classes in (100, 400):
+        lines = make_lines(classes)
+        for name, build in (("legacy", build_legacy), ("current", build_current)):
+            count, build_time, walk_time, retained, peak = measure(build, lines)
+            print("%-8s %8d %10.4f %10.4f %12.0f %12.0f %12.0f" % (name, count, build_time, walk_time,
+                                                                  count / (build_time + walk_time),
+                                                                  retained / 1024, peak / 1024))
+
+
+if __name__ == '__main__':
+    run_main(main)
@@ -0,0 +1,148 @@
+# Seeded generator of synthetic Jack programs for the benchmarks. The same seed and parameters always
+# give the same sources, which compile cleanly and run to completion.
+# Run from the repository root: python -m benchmarks.corpus <directory> [--files N ...]
+import argparse
+import os
+import random
+
+OPERATORS = ("+", "-", "*", "/", "&", "|", "<", ">", "=")
+WORDS = ("alpha", "beta", "gamma", "delta", "score", "count", "index", "total", "width", "height", "left",
+         "right", "value", "offset", "limit", "step", "cell", "row", "column", "pixel")
+
+
+class ProgramGenerator:
+    # files: number of classes, subroutines: per class, statements: per subroutine, depth: of the
+    # nesting of expressions, identifiers: locals per subroutine, strings: share of string literal
+    # statements from 0 to 1
+    def __init__(self, seed=0, files=10, subroutines=8, statements=12, depth=3, identifiers=6, strings=0.1):
+        self.random = random.Random(seed)
+        self.files = files
+        self.subroutines = subroutines
+        self.statements = statements
+        self.depth = depth
+        self.identifiers = identifiers
+        self.strings = strings
+        self.names = list()
+
+    def generate(self):
+        # class name to Jack source
+        sources = dict()
+        for n in range(self.files):
+            sources["Gen" + str(n)] = self.generate_class(n)
+        sources["Main"] = self.generate_main()
+        return sources
+
+    def identifier(self, i):
+        return WORDS[i % len(WORDS)] + str(i // len(WORDS))
+
+    def generate_main(self):
+        lines = ["class Main {", "    function void main() {", "        var int result;"]
+        for n in range(self.files):
+            lines.append("        let result = Gen" + str(n) + ".f" + str(self.subroutines - 1) + "(" + str(n) +
+                         ", result);")
+        lines.extend(["        do Output.printInt(result);", "        return;", "    }", "}", ""])
+        return "\n".join(lines)
+
+    def generate_class(self, n):
+        lines = ["/** Generated class " + str(n) + " */", "class Gen" + str(n) + " {",
+                 "    static int calls;", "    field int x, y;", ""]
+        for i in range(self.subroutines):
+            lines.extend(self.generate_function(n, i))
+        lines.extend(["    method int sum() {", "        return x + y;", "    }", "}", ""])
+        return "\n".join(lines)
+
+    def generate_function(self, n, i):
+        self.names = [self.identifier(k) for k in range(self.identifiers)]
+        lines = ["    // function " + str(i) + " of class " + str(n),
+                 "    function int f" + str(i) + "(int a, int b) {",
+                 "        var int " + ", ".join(self.names) + ";",
+                 "        var Array buffer;",
+                 "        let buffer = Array.new(" + str(self.identifiers + 1) + ");"]
+        self.names = self.names + ["a", "b"]
+        for _ in range(self.statements):
+            lines.extend(self.generate_statement(n, i, "        "))
+        lines.extend(["        do buffer.dispose();", "        let calls = calls + 1;",
+                      "        return " + self.expression(self.depth) + ";", "    }", ""])
+        return lines
+
+    def generate_statement(self, n, i, indent):
+        choice = self.random.random()
+        if choice < self.strings:
+            text = " ".join(self.random.choice(WORDS) for _ in range(self.random.randint(1, 6)))
+            return [indent + 'do Output.printString("' + text + '");']
+        choice = self.random.random()
+        name = self.random.choice(self.names)
+        if choice < 0.45:
+            return [indent + "let " + name + " = " + self.expression(self.depth) + ";"]
+        if choice < 0.6:
+            index = str(self.random.randrange(self.identifiers + 1))
+            return [indent + "let buffer[" + index + "] = " + self.expression(self.depth) + ";"]
+        if choice < 0.75:
+            return [indent + "if (" + self.expression(self.depth) + ") {",
+                    indent + "    let " + name + " = " + self.expression(self.depth - 1) + ";",
+                    indent + "} else {",
+                    indent + "    let " + name + " = " + self.expression(self.depth - 1) + ";",
+                    indent + "}"]
+        if choice < 0.9:
+            return [indent + "while (" + name + " < " + str(self.random.randrange(1, 100)) + ") {",
+                    indent + "    let " + name + " = " + name + " + 1;",
+                    indent + "}"]
+        # calls go to earlier functions only, so no program recurses forever
+        if i > 0:
+            target = "f" + str(self.random.randrange(i))
+            return [indent + "let " + name + " = Gen" + str(n) + "." + target + "(" + self.expression(1) + ", " +
+                    name + ");"]
+        return [indent + "do Output.printInt(" + self.expression(self.depth) + ");"]
+
+    def expression(self, depth):
+        # one side nests further and the other is a term, so the size grows with the depth, not 2 ** depth
+        if depth <= 0 or self.random.random() < 0.1:
+            return self.term()
+        if self.random.random() < 0.5:
+            left, right = self.expression(depth - 1), self.term()
+        else:
+            left, right = self.term(), self.expression(depth - 1)
+        op = self.random.choice(OPERATORS)
+        if op == "/":
+            # a constant divisor keeps the programs runnable
+            right = str(self.random.randrange(1, 100))
+        if self.random.random() < 0.15:
+            return "-(" + left + " " + op + " " + right + ")"
+        return "(" + left + " " + op + " " + right + ")"
+
+    def term(self):
+        choice = self.random.random()
+        if choice < 0.4:
+            return self.random.choice(self.names)
+        if choice < 0.7:
+            return str(self.random.randrange(1, 1000))
+        if choice < 0.85:
+            return "buffer[" + str(self.random.randrange(self.identifiers + 1)) + "]"
+        return "~" + self.random.choice(self.names)
+
+
+def write_program(directory, sources):
+    os.makedirs(directory, exist_ok=True)
+    for class_name, source in sources.items():
+        with open(os.path.join(directory, class_name + ".jack"), "w") as file:
+            file.write(source)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes a synthetic Jack program.")
+    parser.add_argument("directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--subroutines", type=int, default=8)
+    parser.add_argument("--statements", type=int, default=12)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--identifiers", type=int, default=6)
+    parser.add_argument("--strings", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    generator = ProgramGenerator(args.seed, args.files, args.subroutines, args.statements, args.depth,
+                                 args.identifiers, args.strings)
+    write_program(args.directory, generator.generate())
+
+
+if __name__ == '__main__':
+    main()
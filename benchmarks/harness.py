@@ -0,0 +1,27 @@
+# Timing and running shared by the benchmarks.
+import os
+import sys
+import time
+
+
+def best_of(func, *args, repeat=5):
+    # the shortest of repeat runs of func(*args), in seconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_main(main):
+    # exits with the status main returns, quietly when the output is piped into head, which stops reading
+    try:
+        status = main()
+    except BrokenPipeError:
+        # nor a traceback from flushing stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        status = 1
+    sys.exit(status)
@@ -0,0 +1,573 @@
+# Frozen copies of the pipeline stages that have been replaced in JackCompiler.py.
+# They are kept only so the benchmarks can compare the current code against them.
+
+from JackCompiler import ALL_TOKENS, ARGUMENT, CONSTANT, CTOR, FALSE, IDENTIFIER, INT_CONST, KEYWORD, LOCAL, \
+    METHOD, NULL, POINTER, STR_CONST, TEMP, THAT, THIS, TRUE, SymbolTable
+
+GARBAGE = "<>"
+SYMBOLS = ["{", "}", "(", ")", "[", "]", ".", ",", ";", "+", "-", "*", "/", "&",
+           "|", "<", ">", "=", "~"]
+
+
+def make_jack_st(lines):
+    lines = first_pass(lines)
+    return create_st(lines)
+
+
+def rid_of_spaces(st):
+    new_st = ""
+    add_space = False
+    for sym in SYMBOLS:
+        if sym in st:
+            st = st.replace(sym, " " + sym + " ")
+    # get rid of all spaces
+    i = 0
+    while i < len(st):
+        if st[i] == "\"":
+            if add_space is True:
+                new_st += " "
+                add_space = False
+            index = st[i + 1:].index("\"")
+            new_st += st[i:i + index + 2].replace(" ", GARBAGE)
+            i += index + 2
+            continue
+        if st[i] == " " or st[i] == "\t" or st[i] == "\n" or st[i] == "\r":
+            add_space = True
+            i += 1
+            continue
+        if add_space is True:
+            new_st += " "
+            add_space = False
+        new_st += st[i]
+        i += 1
+    if len(new_st) > 0 and new_st[-1] != " ":
+        new_st += " "
+    return new_st
+
+
+def first_pass(lines):
+    i = 0
+    while i < len(lines):
+        if "//" in lines[i]:
+            lines[i] = lines[i][:lines[i].index("//")]
+        elif "/**" in lines[i]:
+            while "*/" not in lines[i]:
+                lines[i] = ""
+                i += 1
+            lines[i] = ""
+        elif "/*" in lines[i]:
+            lines[i] = lines[i][:lines[i].index("/*")]
+        lines[i] = rid_of_spaces(lines[i])
+        i += 1
+    return lines
+
+
+def create_st(lines):
+    st = ""
+    for i in range(len(lines)):
+        if lines[i]:
+            st = st + str(lines[i])
+    return st
+
+
+def legacy_tokens(lines):
+    tokens = make_jack_st(list(lines)).split()
+    return [token.replace(GARBAGE, " ") if token[0] == "\"" else token for token in tokens]
+
+
+KEYWORDS = ["class", "constructor", "function", "method", "field", "static", "var",
+            "int", "char", "boolean", "void", "true", "false", "null", "this",
+            "let", "do", "if", "else", "while", "return"]
+
+
+class LegacyToken:
+    def __init__(self, value, tok_type):
+        self.value = value
+        self.type = tok_type
+
+
+def is_keyword(token):
+    return token in KEYWORDS
+
+
+def is_symbol(token):
+    return token in SYMBOLS
+
+
+def is_integer_constant(token):
+    int_st = ""
+    for char in token:
+        if "0" <= char <= "9":
+            int_st += char
+        else:
+            return False
+    return 0 <= int(int_st) <= 32767
+
+
+def is_string_constant(token):
+    for char in token[1:-1]:
+        if char == "\"" or char == "\n":
+            return False
+    return token[0] == "\"" and token[-1] == "\""
+
+
+def is_identifier(token):
+    for char in token:
+        if "0" <= char <= "9" or "A" <= char <= "Z" or "a" <= char <= "z" or char == "_":
+            continue
+        else:
+            return False
+    return True
+
+
+class LegacyTokenizer:
+    # classifies and allocates a new token on every get_next_token call
+    def __init__(self, string_list):
+        self.index = 0
+        self.string_list = string_list
+
+    def has_more_tokens(self):
+        if self.index < len(self.string_list):
+            return True
+        return False
+
+    def get_next_token(self):
+        if is_keyword(self.string_list[self.index]):
+            token = LegacyToken(self.string_list[self.index], "keyword")
+        elif is_symbol(self.string_list[self.index]):
+            token = LegacyToken(self.string_list[self.index], "symbol")
+        elif is_integer_constant(self.string_list[self.index]):
+            token = LegacyToken(self.string_list[self.index], "integerConstant")
+        elif is_string_constant(self.string_list[self.index]):
+            token = LegacyToken(self.string_list[self.index], "stringConstant")
+        elif is_identifier(self.string_list[self.index]):
+            token = LegacyToken(self.string_list[self.index], "identifier")
+        self.index += 1
+        return token
+
+    def go_back(self):
+        self.index -= 1
+
+
+def is_term(token):
+    return token.type == IDENTIFIER or token.type == INT_CONST or token.type == STR_CONST \
+           or token.value in ALL_TOKENS["keyConst"] or token.value == "(" \
+           or token.value in ALL_TOKENS["unary"]
+
+
+def is_statement(token):
+    return token.value in ALL_TOKENS["statements"]
+
+
+class FusedCompilationEngine:
+    # parses and emits VM code in the same walk, as CompilationEngine did before the AST stage
+    def __init__(self, jk, vmw):
+        self.jk = jk
+        self.vmw = vmw
+        self.current_token = jk.get_next_token()
+        self.class_name = ""
+        self.func_name = ""
+        self.class_st = SymbolTable()
+        self.func_st = SymbolTable(self.class_st)
+        self.subroutine_kinds = dict()
+        self.is_void = False
+        self.is_method = False
+        self.is_ctor = False
+        self.label_index = 1
+        self.first_is_array = False
+        self.second_is_array = False
+
+    def compile_all(self):
+        self.compile_class()
+
+    # def write_token(self):
+    #     self.out_file.write("\t" * self.tabs + "<" + self.current_token.type + "> " +
+    #                         self.current_token.value + " </" + self.current_token.type + ">\n")
+
+    def compile_class(self):
+        self.class_st.start()
+        # a call can come before the declaration of what it calls, so the kinds of all the subroutines first
+        tokens = self.jk.tokens
+        for i in range(self.jk.index, len(tokens) - 2):
+            if tokens[i].type == KEYWORD and tokens[i].value in ALL_TOKENS["subroutine"]:
+                self.subroutine_kinds[tokens[i + 2].value] = tokens[i].value
+        # 'class'
+        self.current_token = self.jk.get_next_token()
+        # class name
+        self.class_name = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        # {
+        self.current_token = self.jk.get_next_token()
+        while self.current_token.value in ALL_TOKENS["class"]\
+                or self.current_token.value in ALL_TOKENS["subroutine"]:
+            if self.current_token.value in ALL_TOKENS["class"]:
+                self.compile_class_var_dec()
+                self.current_token = self.jk.get_next_token()
+            elif self.current_token.value in ALL_TOKENS["subroutine"]:
+                self.compile_subroutine_dec()
+                self.current_token = self.jk.get_next_token()
+        # }
+
+    def compile_class_var_dec(self):
+        # ('static'|'field')
+        static_or_field = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        # type
+        var_type = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        # var name
+        self.class_st.define(self.current_token.value, var_type, static_or_field)
+        self.current_token = self.jk.get_next_token()
+        while self.current_token.value == ",":
+            # ','
+            self.current_token = self.jk.get_next_token()
+            # var name
+            self.class_st.define(self.current_token.value, var_type, static_or_field)
+            self.current_token = self.jk.get_next_token()
+        # ';'
+
+    def compile_subroutine_body(self):
+        # {
+        self.current_token = self.jk.get_next_token()
+        while self.current_token.value == "var":
+            self.compile_var_dec()
+            self.current_token = self.jk.get_next_token()
+        self.vmw.write_function(self.class_name + "." + self.func_name, self.func_st.var_count(LOCAL))
+        if self.is_method is True:
+            self.vmw.write_push(ARGUMENT, 0)
+            self.vmw.write_pop(POINTER, 0)
+        elif self.is_ctor is True:
+            self.vmw.write_push(CONSTANT, self.class_st.var_count(THIS))
+            self.vmw.write_call("Memory.alloc", 1)
+            self.vmw.write_pop(POINTER, 0)
+        self.compile_statements()
+        self.current_token = self.jk.get_next_token()
+        # }
+
+    def compile_subroutine_dec(self):
+        self.func_st.start()
+        # (constructor|function|method)
+        self.is_ctor, self.is_method = False, False
+        if self.current_token.value == METHOD:
+            self.func_st.define(THIS, self.class_name, ARGUMENT)
+            self.is_method = True
+        elif self.current_token.value == CTOR:
+            self.is_ctor = True
+        self.current_token = self.jk.get_next_token()
+        # (void|type)
+        if self.current_token.value == "void":
+            self.is_void = True
+        else:
+            self.is_void = False
+        self.current_token = self.jk.get_next_token()
+        # subroutine name
+        self.func_name = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        # (
+        self.current_token = self.jk.get_next_token()
+        self.compile_parameter_list()
+        self.current_token = self.jk.get_next_token()
+        # )
+        self.current_token = self.jk.get_next_token()
+        self.compile_subroutine_body()
+
+    def compile_parameter_list(self):
+        if self.current_token.value != ")":
+            # type
+            var_type = self.current_token.value
+            self.current_token = self.jk.get_next_token()
+            # var name
+            self.func_st.define(self.current_token.value, var_type, ARGUMENT)
+            self.current_token = self.jk.get_next_token()
+            if self.current_token.value == ",":
+                while self.current_token.value == ",":
+                    # ,
+                    self.current_token = self.jk.get_next_token()
+                    # type
+                    var_type = self.current_token.value
+                    self.current_token = self.jk.get_next_token()
+                    # var name
+                    self.func_st.define(self.current_token.value, var_type, ARGUMENT)
+                    self.current_token = self.jk.get_next_token()
+                self.jk.go_back()
+            else:
+                self.jk.go_back()
+        else:
+            self.jk.go_back()
+
+    def compile_var_dec(self):
+        # 'var'
+        self.current_token = self.jk.get_next_token()
+        # type
+        var_type = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        # var name
+        self.func_st.define(self.current_token.value, var_type, "local")
+        self.current_token = self.jk.get_next_token()
+        while self.current_token.value == ",":
+            # ,
+            self.current_token = self.jk.get_next_token()
+            # var name
+            self.func_st.define(self.current_token.value, var_type, "local")
+            self.current_token = self.jk.get_next_token()
+        # ;
+
+    def compile_statements(self):
+        if is_statement(self.current_token):
+            while is_statement(self.current_token):
+                if self.current_token.value == "let":
+                    self.compile_let()
+                    self.current_token = self.jk.get_next_token()
+                elif self.current_token.value == "if":
+                    self.compile_if()
+                    self.current_token = self.jk.get_next_token()
+                elif self.current_token.value == "while":
+                    self.compile_while()
+                    self.current_token = self.jk.get_next_token()
+                elif self.current_token.value == "do":
+                    self.compile_do()
+                    self.vmw.write_pop("temp", 0)
+                    self.current_token = self.jk.get_next_token()
+                elif self.current_token.value == "return":
+                    self.compile_return()
+                    self.current_token = self.jk.get_next_token()
+            self.jk.go_back()
+        else:
+            self.jk.go_back()
+
+    def compile_do(self):
+        # do
+        self.current_token = self.jk.get_next_token()
+        # subroutine, class or var name
+        name = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        self.compile_subroutine_call(name)
+        self.current_token = self.jk.get_next_token()
+        # ;
+
+    def compile_let(self):
+        self.first_is_array = False
+        self.second_is_array = False
+        # let
+        self.current_token = self.jk.get_next_token()
+        # some var name
+        var_name = self.current_token.value
+        self.current_token = self.jk.get_next_token()
+        if self.current_token.value == "[":
+            # [
+            self.first_is_array = True
+            symbol = self.func_st.resolve(var_name)
+            if symbol is not None:
+                self.vmw.write_push(symbol.segment, symbol.index)
+            self.current_token = self.jk.get_next_token()
+            self.compile_expression()
+            self.current_token = self.jk.get_next_token()
+            # ]
+            self.vmw.write_arithmetic("+")
+            self.current_token = self.jk.get_next_token()
+        # =
+        self.current_token = self.jk.get_next_token()
+        self.compile_expression()
+        if self.first_is_array is True:
+            if self.second_is_array is True:
+                self.vmw.write_pop(TEMP, 0)
+                self.vmw.write_pop(POINTER, 1)
+                self.vmw.write_push(TEMP, 0)
+                self.vmw.write_pop(THAT, 0)
+            else:
+                # only first is array
+                self.vmw.write_pop(TEMP, 0)
+                self.vmw.write_pop(POINTER, 1)
+                self.vmw.write_push(TEMP, 0)
+                self.vmw.write_pop(THAT, 0)
+        else:
+            symbol = self.func_st.resolve(var_name)
+            if symbol is not None:
+                self.vmw.write_pop(symbol.segment, symbol.index)
+            else:
+                raise Exception("wow such code very bad")
+        self.current_token = self.jk.get_next_token()
+        # ;
+
+    def compile_while(self):
+        # while
+        start_label = self.label_index
+        self.vmw.write_label("L" + str(start_label))
+        self.label_index += 2
+        self.current_token = self.jk.get_next_token()
+        # (
+        self.current_token = self.jk.get_next_token()
+        self.compile_expression()
+        self.vmw.write_unary("~")
+        self.current_token = self.jk.get_next_token()
+        # )
+        self.vmw.write_if("L" + str(start_label + 1))
+        self.current_token = self.jk.get_next_token()
+        # {
+        self.current_token = self.jk.get_next_token()
+        self.compile_statements()
+        self.vmw.write_goto("L" + str(start_label))
+        self.current_token = self.jk.get_next_token()
+        # }
+        self.vmw.write_label("L" + str(start_label + 1))
+        self.label_index += 1
+
+    def compile_return(self):
+        # 'return'
+        self.current_token = self.jk.get_next_token()
+        if self.is_ctor is True:
+            self.vmw.write_push(POINTER, 0)
+            self.current_token = self.jk.get_next_token()
+        elif self.current_token.value != ";":
+            self.compile_expression()
+            self.current_token = self.jk.get_next_token()
+        if self.is_void is True:
+            self.vmw.write_push("constant", 0)
+        self.vmw.write_return()
+
+    def compile_if(self):
+        # if
+        self.current_token = self.jk.get_next_token()
+        # (
+        self.current_token = self.jk.get_next_token()
+        self.compile_expression()
+        self.vmw.write_unary("~")
+        start_label = self.label_index
+        self.vmw.write_if("L" + str(start_label))
+        self.label_index += 2
+        self.current_token = self.jk.get_next_token()
+        # )
+        self.current_token = self.jk.get_next_token()
+        # {
+        self.current_token = self.jk.get_next_token()
+        self.compile_statements()
+        self.vmw.write_goto("L" + str(start_label + 1))
+        self.vmw.write_label("L" + str(start_label))
+        self.current_token = self.jk.get_next_token()
+        # }
+        self.current_token = self.jk.get_next_token()
+        if self.current_token.value == "else":
+            # else
+            self.current_token = self.jk.get_next_token()
+            # {
+            # self.write_token()
+            self.current_token = self.jk.get_next_token()
+            self.compile_statements()
+            self.current_token = self.jk.get_next_token()
+            # }
+        else:
+            self.jk.go_back()
+        self.vmw.write_label("L" + str(start_label + 1))
+
+    def compile_expression(self):
+        # term (op term)*, left to right
+        self.compile_term()
+        while self.jk.has_more_tokens():
+            self.current_token = self.jk.get_next_token()
+            if self.current_token.value in ALL_TOKENS["op"]:
+                saved_op = self.current_token.value
+                self.current_token = self.jk.get_next_token()
+                self.compile_term()
+                self.vmw.write_arithmetic(saved_op)
+            else:
+                self.jk.go_back()
+                break
+
+    def compile_term(self):
+        # (expression)
+        if self.current_token.value == "(":
+            # (
+            self.current_token = self.jk.get_next_token()
+            self.compile_expression()
+            self.current_token = self.jk.get_next_token()
+            # )
+        # unaryOp term
+        elif self.current_token.value in ALL_TOKENS["unary"]:
+            # some unary op
+            save_un = self.current_token.value
+            self.current_token = self.jk.get_next_token()
+            self.compile_term()
+            self.vmw.write_unary(save_un)
+        elif self.current_token.type == INT_CONST:
+            self.vmw.write_push(CONSTANT, int(self.current_token.value))
+        elif self.current_token.type == STR_CONST:
+            self.vmw.write_push(CONSTANT, len(self.current_token.value) - 2)
+            self.vmw.write_call("String.new", 1)
+            for char in self.current_token.value[1:-1]:
+                self.vmw.write_push(CONSTANT, ord(char))
+                self.vmw.write_call("String.appendChar", 2)
+        elif self.current_token.value == TRUE:
+            self.vmw.write_push("constant", 1)
+            self.vmw.write_unary("-")
+        elif self.current_token.value == THIS:
+            self.vmw.write_push(POINTER, 0)
+        elif self.current_token.value == NULL or self.current_token.value == FALSE:
+            self.vmw.write_push("constant", 0)
+        # var name, var name [expression] or subroutine call
+        else:
+            name = self.current_token.value
+            self.current_token = self.jk.get_next_token()
+            if self.current_token.value == "(" or self.current_token.value == ".":
+                self.compile_subroutine_call(name)
+                return
+            symbol = self.func_st.resolve(name)
+            if symbol is not None:
+                self.vmw.write_push(symbol.segment, symbol.index)
+            # var name [expression]
+            if self.current_token.value == "[":
+                # [
+                self.current_token = self.jk.get_next_token()
+                self.compile_expression()
+                self.current_token = self.jk.get_next_token()
+                # ]
+                self.vmw.write_arithmetic("+")
+                self.vmw.write_pop(POINTER, 1)
+                self.vmw.write_push(THAT, 0)
+            else:
+                self.jk.go_back()
+
+    def compile_expression_list(self):
+        # returns the number of expressions
+        argc = 0
+        if is_term(self.current_token):
+            while is_term(self.current_token):
+                self.compile_expression()
+                argc += 1
+                self.current_token = self.jk.get_next_token()
+                if self.current_token.value == ",":
+                    # ','
+                    self.current_token = self.jk.get_next_token()
+                else:
+                    self.jk.go_back()
+                    break
+        else:
+            self.jk.go_back()
+        return argc
+
+    def compile_subroutine_call(self, name):
+        # the receiver, the function and the argument count are locals, so calls can nest
+        argc = 0
+        if self.current_token.value == "(":
+            # a method of this class unless the class declares it as a function or constructor
+            if self.subroutine_kinds.get(name, METHOD) == METHOD:
+                self.vmw.write_push(POINTER, 0)
+                argc = 1
+            func_name = self.class_name + "." + name
+        else:
+            # .
+            self.current_token = self.jk.get_next_token()
+            # subroutine name, of the class of the var name or of the class name
+            symbol = self.func_st.resolve(name)
+            if symbol is not None:
+                self.vmw.write_push(symbol.segment, symbol.index)
+                argc = 1
+                func_name = symbol.type + "." + self.current_token.value
+            else:
+                func_name = name + "." + self.current_token.value
+            self.current_token = self.jk.get_next_token()
+        # (
+        self.current_token = self.jk.get_next_token()
+        argc += self.compile_expression_list()
+        self.current_token = self.jk.get_next_token()
+        # )
+        self.vmw.write_call(func_name, argc)
@@ -0,0 +1,186 @@
+# Times each stage of the compiler (read, tokenize, parse, codegen, write) on generated programs that
+# each stress one dimension, records peak memory per stage, and compares the results with a baseline.
+# Run from the repository root: python -m benchmarks.suite [--output results.json] [--compare baseline.json]
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from JackCompiler import COMPILER_VERSION, CodeGenerator, CompilationEngine, JackTokenizer, VMWriter, read_file, \
+    write_atomically
+from benchmarks.corpus import ProgramGenerator, write_program
+from benchmarks.harness import run_main
+
+STAGES = ("read", "tokenize", "parse", "codegen", "write")
+# generator parameters of each case at scale 1
+CASES = {"files": dict(files=40),
+         "size": dict(files=4, subroutines=40, statements=40),
+         "depth": dict(files=4, depth=40),
+         "identifiers": dict(files=4, identifiers=200),
+         "strings": dict(files=10, strings=0.8)}
+SCALED = {"files": "files", "size": "subroutines", "depth": "depth", "identifiers": "identifiers",
+          "strings": "files"}
+DEFAULT_THRESHOLD = 0.15
+
+
+def make_case(name, scale, seed):
+    parameters = dict(CASES[name])
+    parameters[SCALED[name]] = int(parameters[SCALED[name]] * scale)
+    return ProgramGenerator(seed=seed, **parameters).generate()
+
+
+def run_stages(file_names, output_directory, measure):
+    # runs every stage over all the files once, measure(stage, func) runs func and returns its result
+    sources = measure("read", lambda: [read_file(file_name) for file_name in file_names])
+    tokenizers = measure("tokenize", lambda: [JackTokenizer(lines) for lines in sources])
+    class_decs = measure("parse", lambda: [CompilationEngine(tokenizer, None).parse() for tokenizer in tokenizers])
+
+    def generate():
+        writers = list()
+        for class_dec in class_decs:
+            vmw = VMWriter(io.BytesIO())
+            CodeGenerator(vmw).compile_class(class_dec)
+            writers.append(vmw)
+        return writers
+    writers = measure("codegen", generate)
+
+    def write():
+        for class_dec, vmw in zip(class_decs, writers):
+            write_atomically(os.path.join(output_directory, class_dec.name + ".vm"), vmw.getvalue())
+    measure("write", write)
+    tokens = sum(len(tokenizer.tokens) for tokenizer in tokenizers)
+    instructions = sum(vmw.written for vmw in writers)
+    return tokens, instructions
+
+
+def time_case(file_names, output_directory, repeat):
+    best = dict()
+
+    def measure(stage, func):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if stage not in best or elapsed < best[stage]:
+            best[stage] = elapsed
+        return result
+    for _ in range(repeat):
+        tokens, instructions = run_stages(file_names, output_directory, measure)
+    return best, tokens, instructions
+
+
+def trace_case(file_names, output_directory):
+    # peak memory a stage allocated on top of what the earlier stages left behind
+    peaks = dict()
+
+    def measure(stage, func):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - before
+        return result
+    tracemalloc.start()
+    try:
+        run_stages(file_names, output_directory, measure)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_suite(cases, scale, seed, repeat):
+    results = {"meta": {"compiler_version": COMPILER_VERSION, "python": platform.python_version(),
+                        "machine": platform.machine(), "scale": scale, "seed": seed, "repeat": repeat},
+               "cases": dict()}
+    for name in cases:
+        with tempfile.TemporaryDirectory() as directory:
+            sources = make_case(name, scale, seed)
+            write_program(directory, sources)
+            file_names = [os.path.join(directory, class_name + ".jack") for class_name in sorted(sources)]
+            seconds, tokens, instructions = time_case(file_names, directory, repeat)
+            peaks = trace_case(file_names, directory)
+        stages = dict()
+        for stage in STAGES:
+            stages[stage] = {"seconds": seconds[stage], "peak_bytes": peaks[stage]}
+        results["cases"][name] = {"files": len(sources), "bytes": sum(len(source) for source in sources.values()),
+                                  "tokens": tokens, "instructions": instructions, "stages": stages}
+    return results
+
+
+def format_results(results):
+    lines = ["%-12s %6s %9s %9s %-9s %11s %12s" % ("case", "files", "tokens", "instrs", "stage", "best (ms)",
+                                                    "peak (KiB)")]
+    for name, case in results["cases"].items():
+        for stage in STAGES:
+            lines.append("%-12s %6d %9d %9d %-9s %11.2f %12.1f" % (
+                name, case["files"], case["tokens"], case["instructions"], stage,
+                1000 * case["stages"][stage]["seconds"], case["stages"][stage]["peak_bytes"] / 1024))
+    return "\n".join(lines)
+
+
+def compare(results, baseline, threshold):
+    # one line per stage, returns them and whether anything got slower or bigger by more than threshold
+    lines = ["%-12s %-9s %10s %10s %-10s" % ("case", "stage", "time", "memory", "")]
+    regressed = False
+    for key in ("scale", "seed"):
+        if results["meta"][key] != baseline["meta"].get(key):
+            lines.append("warning: the baseline was run with " + key + " " + str(baseline["meta"].get(key)))
+    for name, case in results["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        for stage in STAGES:
+            new = case["stages"][stage]
+            old = baseline["cases"][name]["stages"].get(stage)
+            if old is None:
+                continue
+            time_ratio = new["seconds"] / old["seconds"] if old["seconds"] else 1.0
+            memory_ratio = new["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] > 0 else 1.0
+            flags = list()
+            if time_ratio > 1 + threshold:
+                flags.append("slower")
+            if memory_ratio > 1 + threshold:
+                flags.append("bigger")
+            regressed = regressed or bool(flags)
+            lines.append("%-12s %-9s %9.2fx %9.2fx %s" % (name, stage, time_ratio, memory_ratio,
+                                                          "REGRESSION " + ", ".join(flags) if flags else ""))
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the compiler stages on generated Jack programs.")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma separated cases (default all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the dimension each case stresses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the best time of each stage counts")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown or memory growth reported as a regression (default %(default)s)")
+    args = parser.parse_args(argv)
+    cases = args.cases.split(",")
+    for name in cases:
+        if name not in CASES:
+            parser.error("unknown case " + name + ", expected one of " + ", ".join(CASES))
+    results = run_suite(cases, args.scale, args.seed, args.repeat)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        lines, regressed = compare(results, baseline, args.threshold)
+        print()
+        print("\n".join(lines))
+        if regressed:
+            print("regressions above " + str(round(100 * args.threshold)) + "% against " + args.compare,
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    run_main(main)
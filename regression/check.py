@@ -0,0 +1,102 @@
+# Runs every program of the regression corpus compiled in each code generation mode and fails unless
+# all of them print what the program's expected.txt says.
+# Run from the repository root: python -m regression.check [program ...]
+import os
+import sys
+
+from JackCompiler import INLINE_MAX_INSTRUCTIONS, CompilationEngine, CompileOptions, JackTokenizer, \
+    find_jack_files, generate_class, prepare_program, read_file
+from HackEmulator import HackComputer
+from HackTranslator import HackTranslator
+from VMBytecode import decode
+from VMInterpreter import VMError, VirtualMachine
+
+CORPUS = os.path.dirname(os.path.abspath(__file__))
+MODES = {"plain": CompileOptions(),
+         "-O": CompileOptions(optimize=True, strength_reduce=True),
+         "pool class": CompileOptions(string_pool="class"),
+         "pool program": CompileOptions(string_pool="program"),
+         "-O pool": CompileOptions(optimize=True, strength_reduce=True, string_pool="program"),
+         "dead": CompileOptions(eliminate_dead=True),
+         "-O dead pool": CompileOptions(optimize=True, strength_reduce=True, string_pool="program",
+                                        eliminate_dead=True),
+         "inline": CompileOptions(inline=INLINE_MAX_INSTRUCTIONS),
+         "-O inline dead": CompileOptions(optimize=True, strength_reduce=True, eliminate_dead=True,
+                                          inline=INLINE_MAX_INSTRUCTIONS),
+         "-O vmb": CompileOptions(optimize=True, strength_reduce=True, target="vmb"),
+         "asm": CompileOptions(target="asm"),
+         "-O asm": CompileOptions(optimize=True, strength_reduce=True, target="asm"),
+         "rotate": CompileOptions(rotate_loops=True),
+         "-O rotate asm": CompileOptions(optimize=True, strength_reduce=True, target="asm", rotate_loops=True)}
+
+
+def find_programs():
+    programs = list()
+    for name in sorted(os.listdir(CORPUS)):
+        if os.path.isfile(os.path.join(CORPUS, name, "expected.txt")):
+            programs.append(name)
+    return programs
+
+
+def parse_program(directory):
+    class_decs = list()
+    for file_name in find_jack_files(directory):
+        class_decs.append(CompilationEngine(JackTokenizer(read_file(file_name)), None).parse())
+    return class_decs
+
+
+def compile_program(class_decs, options):
+    # returns the .vm text, or the decoded bytecode, of every class and the number of instructions in all
+    # of them, for the asm target the Hack program and its number of instructions
+    classes = dict()
+    written = 0
+    class_decs, removed, pool, inliner = prepare_program(class_decs, options)
+    translator = HackTranslator() if options.target == "asm" else None
+    for class_dec in class_decs:
+        code, stats = generate_class(class_dec, options, pool, inliner=inliner, translator=translator)
+        classes[class_dec.name] = decode(code) if options.target == "vmb" else code.decode()
+        written += stats["asm_written"] if translator is not None else stats["written"]
+    if translator is not None:
+        program = "\n".join(translator.bootstrap()) + "\n" + "".join(classes.values()) + \
+            "\n".join(translator.shared_code()) + "\n"
+        return program, written
+    return classes, written
+
+
+def run_program(classes):
+    # classes is what compile_program returned, steps are VM or Hack instructions
+    if isinstance(classes, str):
+        machine = HackComputer(classes.splitlines())
+    else:
+        machine = VirtualMachine(classes)
+    try:
+        output = machine.run()
+    except VMError as error:
+        output = "error: " + str(error) + "\n"
+    return output, machine.steps, machine.os_calls
+
+
+def main(argv=None):
+    programs = (argv if argv is not None else sys.argv[1:]) or find_programs()
+    failed = 0
+    print("%-12s %-15s %8s %10s %9s  %s" % ("program", "mode", "code", "steps", "os calls", "result"))
+    for name in programs:
+        directory = os.path.join(CORPUS, name)
+        with open(os.path.join(directory, "expected.txt")) as file:
+            expected = file.read()
+        class_decs = parse_program(directory)
+        for mode, options in MODES.items():
+            classes, written = compile_program(class_decs, options)
+            output, steps, os_calls = run_program(classes)
+            result = "ok" if output == expected else "FAILED, output differs from expected.txt"
+            if output != expected:
+                failed += 1
+            print("%-12s %-15s %8d %10d %9d  %s" % (name, mode, written, steps, os_calls, result))
+    if failed:
+        print(str(failed) + " program builds failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
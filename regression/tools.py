@@ -0,0 +1,328 @@
+# Checks of what the compiler does besides the code of the programs, the files and reports its tools
+# write, each on copies of programs of the regression corpus in a temporary directory.
+# Run from the repository root: python -m regression.tools [check ...]
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stderr
+
+import JackCompiler
+import JackDaemon
+import VMBundle
+import VMBytecode
+from VMInterpreter import VMError, read_classes
+from regression.check import CORPUS, find_programs, run_program
+
+
+def copy_program(name, directory):
+    # the directory of a copy of the regression program name
+    target = os.path.join(directory, name)
+    shutil.copytree(os.path.join(CORPUS, name), target)
+    return target
+
+
+def compile_quietly(argv):
+    # JackCompiler.main with its report on stderr kept back, returns the exit status and the report
+    stderr = io.StringIO()
+    with redirect_stderr(stderr):
+        status = JackCompiler.main(argv)
+    return status, stderr.getvalue()
+
+
+def check_profile(directory):
+    # --profile with every target counts the instructions of each subroutine
+    for target in ("vm", "vmb", "asm"):
+        program = copy_program("Objects", os.path.join(directory, target))
+        report_path = os.path.join(directory, target + ".json")
+        status, report = compile_quietly([program, "--target", target, "--profile", report_path])
+        if status != 0:
+            return "--target " + target + " --profile failed: " + report
+        with open(report_path) as file:
+            files = json.load(file)["files"]
+        for file_name, record in files.items():
+            if file_name.endswith(".jack") and (not record["subroutines"] or not record["instructions"]):
+                return "--target " + target + " --profile counted no instructions in " + file_name
+    return None
+
+
+def read_outputs(directory, extension):
+    # the bytes of the files with extension in directory by class name
+    outputs = dict()
+    for name in os.listdir(directory):
+        if name.endswith(extension):
+            with open(os.path.join(directory, name), "rb") as file:
+                outputs[name[:-len(extension)]] = file.read()
+    return outputs
+
+
+def check_bundle(directory):
+    # each class extracted or unpacked from a bundle is the file a compilation without --bundle writes,
+    # and a bundle cut short is an error rather than shorter code
+    for target, extension in (("vm", ".vm"), ("vmb", VMBytecode.EXTENSION)):
+        program = copy_program("Objects", os.path.join(directory, target))
+        bundle = os.path.join(directory, target + VMBundle.BUNDLE_EXTENSION)
+        status, report = compile_quietly([program, "--target", target])
+        if status != 0:
+            return "--target " + target + " failed: " + report
+        expected = read_outputs(program, extension)
+        status, report = compile_quietly([program, "--target", target, "--bundle", bundle])
+        if status != 0:
+            return "--target " + target + " --bundle failed: " + report
+        if VMBundle.unpack(bundle) != expected:
+            return "unpacking the " + target + " bundle does not give the files of each class"
+        for name, code in expected.items():
+            if VMBundle.extract(bundle, name) != code:
+                return "extracting " + name + " from the " + target + " bundle does not give " + name + extension
+        unpacked = os.path.join(directory, target + "-unpacked")
+        if VMBundle.main([bundle, "--unpack", unpacked]) != 0 or read_outputs(unpacked, extension) != expected:
+            return "VMBundle.py --unpack does not write the files of each class of the " + target + " bundle"
+        with open(bundle, "rb") as file:
+            last = list(VMBundle.read_index(file))[-1]
+            file.seek(0)
+            data = file.read()
+        with open(bundle, "wb") as file:
+            file.write(data[:-1])
+        for read in (lambda: VMBundle.extract(bundle, last), lambda: VMBundle.unpack(bundle)):
+            try:
+                read()
+            except VMBundle.BundleError as error:
+                if "truncated" not in str(error):
+                    return "a truncated " + target + " bundle fails with " + repr(str(error))
+            else:
+                return "a truncated " + target + " bundle reads without an error"
+        with redirect_stderr(io.StringIO()):
+            if VMBundle.main([bundle, "--extract", last]) == 0:
+                return "VMBundle.py --extract succeeds on a truncated " + target + " bundle"
+    return None
+
+
+def check_bytecode(directory):
+    # the bytecode of a file decodes to its .vm text and the .vm text encodes to its bytecode, also
+    # through VMBytecode.py converting whole directories either way
+    for name in find_programs():
+        for optimize in (False, True):
+            program = copy_program(name, os.path.join(directory, "-O" if optimize else "plain"))
+            for target in ("vm", "vmb"):
+                options = JackCompiler.CompileOptions(optimize=optimize, strength_reduce=optimize, target=target)
+                for file_name in JackCompiler.find_jack_files(program):
+                    JackCompiler.compile_file(file_name, options=options)
+            texts = read_outputs(program, ".vm")
+            codes = read_outputs(program, VMBytecode.EXTENSION)
+            for class_name, text in texts.items():
+                if VMBytecode.to_text(codes[class_name]) != text.decode():
+                    return "the bytecode of " + name + "/" + class_name + " decodes to other .vm text"
+                if VMBytecode.to_bytecode(text.decode()) != codes[class_name]:
+                    return "the .vm text of " + name + "/" + class_name + " encodes to other bytecode"
+            with redirect_stderr(io.StringIO()):
+                for argv, extension, expected in (([program], VMBytecode.EXTENSION, codes),
+                                                  ([program, "--to-text"], ".vm", texts)):
+                    if VMBytecode.main(argv) != 0 or read_outputs(program, extension) != expected:
+                        return "VMBytecode.py " + " ".join(argv[1:]) + " converts " + name + " to other code"
+    return None
+
+
+def check_cache(directory):
+    # a build again takes every class from the cache and rewrites no output, a source changed in its
+    # comments compiles again to the same output and leaves it alone too, and one changed in its code
+    # rewrites only its own output
+    program = copy_program("Objects", directory)
+    cache = JackCompiler.BuildCache(os.path.join(directory, "cache"))
+    file_names = JackCompiler.find_jack_files(program)
+    outputs = [os.path.splitext(file_name)[0] + ".vm" for file_name in file_names]
+    for file_name in file_names:
+        if not JackCompiler.compile_file(file_name, cache):
+            return os.path.basename(file_name) + " came from the empty cache"
+    for output in outputs:
+        # a time no write leaves behind
+        os.utime(output, (1, 1))
+    for file_name in file_names:
+        if JackCompiler.compile_file(file_name, cache):
+            return os.path.basename(file_name) + " compiled again with its output in the cache"
+    with open(file_names[0]) as file:
+        source = file.read()
+    with open(file_names[0], "w") as file:
+        file.write(source + "// changed\n")
+    if not JackCompiler.compile_file(file_names[0], cache):
+        return "a changed " + os.path.basename(file_names[0]) + " came from the cache"
+    if os.path.getmtime(outputs[0]) != 1:
+        return "a change to the comments of " + os.path.basename(file_names[0]) + " rewrote the same output"
+    with open(file_names[0], "w") as file:
+        file.write(source.rstrip()[:-1] + "    function void added() { return; }\n}\n")
+    for file_name in file_names:
+        JackCompiler.compile_file(file_name, cache)
+    rewritten = [os.path.basename(output) for output in outputs if os.path.getmtime(output) != 1]
+    if rewritten != [os.path.basename(outputs[0])]:
+        return "builds with the cache rewrote " + (", ".join(rewritten) or "no output") + ", not only " + \
+            os.path.basename(outputs[0])
+    # four entries of 100 bytes last used in order, the first of them read again, in a cache of 250
+    cache = JackCompiler.BuildCache(os.path.join(directory, "evicted"), 250)
+    keys = [cache.key_of(str(n)) for n in range(4)]
+    for n, key in enumerate(keys):
+        cache.put(key, bytes(100))
+        os.utime(cache.path_of(key), (n + 1, n + 1))
+    cache.get(keys[0])
+    removed = cache.evict()
+    kept = [n for n, key in enumerate(keys) if cache.get(key) is not None]
+    if removed != 2 or kept != [0, 3]:
+        return "evicting down to 250 bytes removed " + str(removed) + " entries and kept " + str(kept) + \
+            ", not the least recently used two"
+    return None
+
+
+def check_pool(directory):
+    # the pooled literals of all the files the command line compiles, with workers too, fit in the 240
+    # static words between them
+    for mode in ("class", "program"):
+        program = copy_program("PoolBudget", os.path.join(directory, mode))
+        status, report = compile_quietly([program, "--string-pool", mode, "--jobs", "2"])
+        if status != 0:
+            return "--string-pool " + mode + " failed: " + report
+        with open(os.path.join(program, "expected.txt")) as file:
+            expected = file.read()
+        try:
+            output = run_program(read_classes(program))[0]
+        except VMError as error:
+            return "PoolBudget compiled with --string-pool " + mode + " does not run: " + str(error)
+        if output != expected:
+            return "PoolBudget compiled with --string-pool " + mode + " prints " + repr(output)
+    return None
+
+
+def check_link(directory):
+    # an asm program calling a function that no class and no .vm file next to the sources defines does
+    # not link, and one calling OS functions that only HackEmulator provides links with a warning naming
+    # them, unless there is a .vm file that defines them
+    program = copy_program("Objects", directory)
+    status, report = compile_quietly([program, "--target", "asm"])
+    if status != 0 or "warning" not in report or "Sys.init" not in report or "Memory.alloc" not in report:
+        return "--target asm without the OS does not warn of Sys.init and Memory.alloc: " + report
+    with open(os.path.join(program, "Sys.vm"), "w") as file:
+        file.write("function Sys.init 0\ncall Main.main 0\npop temp 0\nlabel halt\ngoto halt\n")
+    status, report = compile_quietly([program, "--target", "asm"])
+    if status != 0 or "Sys.init" in report or "Memory.alloc" not in report:
+        return "--target asm with Sys.vm next to the sources still warns of Sys.init: " + report
+    main_file = os.path.join(program, "Main.jack")
+    with open(main_file) as file:
+        source = file.read()
+    with open(main_file, "w") as file:
+        file.write(source.rstrip()[:-1] + "    function void broken() { do Missing.run(); return; }\n}\n")
+    status, report = compile_quietly([program, "--target", "asm"])
+    if status == 0 or "Missing.run" not in report:
+        return "--target asm links a call to Missing.run, which nothing defines: " + report
+    return None
+
+
+# small enough that tokens, comments and string constants of every program span chunks
+STREAM_CHUNK_SIZES = (1, 2, 7, 64)
+STREAM_MODES = (JackCompiler.CompileOptions(),
+                JackCompiler.CompileOptions(optimize=True, strength_reduce=True, rotate_loops=True),
+                JackCompiler.CompileOptions(optimize=True, strength_reduce=True, target="vmb"))
+
+
+def check_stream(directory):
+    # streaming a file in chunks of any size writes the same bytes as compiling it whole
+    for name in find_programs():
+        program = copy_program(name, directory)
+        for file_name in JackCompiler.find_jack_files(program):
+            for options in STREAM_MODES:
+                output = os.path.splitext(file_name)[0] + options.extension()
+                JackCompiler.compile_file(file_name, options=options)
+                with open(output, "rb") as file:
+                    expected = file.read()
+                for chunk_size in STREAM_CHUNK_SIZES:
+                    JackCompiler.compile_stream(file_name, options, chunk_size)
+                    with open(output, "rb") as file:
+                        if file.read() != expected:
+                            return ("streaming " + name + "/" + os.path.basename(file_name) + " in chunks of " +
+                                    str(chunk_size) + " to " + options.extension() + " writes other code")
+    return None
+
+
+# the options a plain build compiles in one walk, without a tree
+FUSED_MODES = (JackCompiler.CompileOptions(),
+               JackCompiler.CompileOptions(strength_reduce=True),
+               JackCompiler.CompileOptions(strength_reduce=True, target="vmb"))
+
+
+def check_fused(directory):
+    # the one walk from tokens to code of a plain build gives the code of parsing to a tree and
+    # generating from it
+    for name in find_programs():
+        for file_name in JackCompiler.find_jack_files(os.path.join(CORPUS, name)):
+            source = "".join(JackCompiler.read_file(file_name))
+            class_dec = JackCompiler.CompilationEngine(JackCompiler.JackTokenizer(source), None).parse()
+            for options in FUSED_MODES:
+                result = JackCompiler.fused_class(source, options)
+                if result is None:
+                    return name + "/" + os.path.basename(file_name) + " does not compile in one walk"
+                if result[0] != JackCompiler.generate_class(class_dec, options)[0]:
+                    return ("the one walk compiles " + name + "/" + os.path.basename(file_name) + " with " +
+                            (options.key() or "no options") + " to other code than the tree")
+    return None
+
+
+def check_daemon(directory):
+    # the daemon does not replace a file that is not a socket, tries a file that failed again on the
+    # next poll, and rebuilds a whole program when one of its classes is removed
+    path = os.path.join(directory, "not-a-socket")
+    with open(path, "w") as file:
+        file.write("keep")
+    try:
+        JackDaemon.CompileServer(path).server_close()
+        return "CompileServer replaced a file that is not a socket"
+    except Exception:
+        pass
+    if not os.path.isfile(path):
+        return "CompileServer removed a file that is not a socket"
+    program = copy_program("Objects", directory)
+    watcher = JackDaemon.Watcher(program)
+    if len(watcher.poll()) != 3 or watcher.poll():
+        return "the first poll does not compile every file once"
+    main_file = os.path.join(program, "Main.jack")
+    with open(main_file) as file:
+        source = file.read()
+    with open(main_file, "w") as file:
+        file.write(source + "}")
+    for unused in range(2):
+        results = watcher.poll()
+        if len(results) != 1 or results[0][1] is None:
+            return "a poll after Main.jack broke does not try it again: " + repr(results)
+    with open(main_file, "w") as file:
+        file.write(source)
+    if [error for file_name, error, stats in watcher.poll()] != [None] or watcher.poll():
+        return "Main.jack does not compile once after it is fixed"
+    watcher = JackDaemon.Watcher(program, JackCompiler.CompileOptions(string_pool="program"))
+    if len(watcher.poll()) != 3:
+        return "the first poll does not build the whole program"
+    os.remove(os.path.join(program, "List.jack"))
+    if not watcher.poll():
+        return "removing List.jack does not rebuild the whole program"
+    return None
+
+
+CHECKS = {"profile": check_profile, "bundle": check_bundle, "stream": check_stream,
+          "bytecode": check_bytecode, "cache": check_cache,
+          "pool": check_pool, "link": check_link, "fused": check_fused,
+          "daemon": check_daemon}
+
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or list(CHECKS)
+    failed = 0
+    for name in names:
+        with tempfile.TemporaryDirectory() as directory:
+            problem = CHECKS[name](directory)
+        if problem is not None:
+            failed += 1
+        print("%-12s %s" % (name, "ok" if problem is None else "FAILED, " + problem))
+    if failed:
+        print(str(failed) + " checks failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())